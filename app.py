@@ -4,14 +4,27 @@ from dotenv import load_dotenv, find_dotenv
 # 将 .env 文件中对应的键值对，加载至环境变量中(仅在本次运行过程有效)
 _ = load_dotenv(find_dotenv())
 
-from Config import Config
-from routes import register_routes
-
 
 def create_app():
+    # 应用模块在 create_app 中才导入：PDF 解析进程池以 spawn 启动，子进程会重新导入 `python app.py` 的主模块，
+    # 模块顶层只保留轻量的导入，子进程不会加载 langchain、向量库等依赖
+    from Config import Config
+    from routes import register_routes
+    from services.service_container import init_services
+    from utils.mysql_storage import session_manager as mysql_session_manager
+
     app = Flask(__name__)
     app.config.from_object(Config)
 
+    # 构建应用级服务容器，所有请求共享
+    init_services(app)
+
+    @app.cli.command('migrate-session-history')
+    def migrate_session_history():
+        """将 chat_sessions.history 中的整段 JSON 历史迁移到逐条消息表 chat_messages"""
+        migrated = mysql_session_manager.migrate_history_blobs()
+        print(f"Migrated {migrated} sessions to chat_messages.")
+
     # 注册路由
     register_routes(app)
 
@@ -0,0 +1,84 @@
+"""
+异步服务入口：
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+POST /api/v1/chat 由 AsyncChatService 原生异步处理（LLM、Redis、Tavily 和网页抓取均为非阻塞 I/O），
+等待上游时不占用线程，单个 worker 即可同时承载数百个对话；
+其余接口仍交给 Flask 应用，通过 asgiref 在线程池中执行。
+"""
+import json
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import create_app
+
+flask_app = create_app()
+container = flask_app.extensions['service_container']
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def _read_json(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    try:
+        return json.loads(body) if body else None
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+
+
+async def _send_json(send, payload: dict, status: int = 200):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def chat(scope, receive, send):
+    """普通对话接口（异步版本），请求和响应格式与 Flask 版本的 /chat 一致"""
+    data = await _read_json(receive)
+    if not data or 'message' not in data or 'session_id' not in data:
+        await _send_json(send, {'error': 'Missing message or session_id in request body'}, 400)
+        return
+
+    user_message = data['message']
+    system_prompt = data.get('system_prompt', 'You are a helpful assistant.')
+    session_id = data['session_id']
+
+    # Flask 的应用上下文基于 contextvars，每个请求任务各自独立
+    with flask_app.app_context():
+        try:
+            ai_response = await container.async_chat_service.handle_chat(user_message, system_prompt, session_id)
+        except Exception as e:
+            flask_app.logger.error(f"Error in async chat: {e}")
+            await _send_json(send, {'error': 'Failed to process chat request'}, 500)
+            return
+
+    await _send_json(send, {'response': ai_response, 'session_id': session_id})
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # 把 write-behind 中尚未写入 MySQL 的会话刷盘
+            container.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/api/v1/chat':
+        await chat(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
@@ -0,0 +1,65 @@
+"""
+测量每轮对话中构建智能体的开销，对比缓存前后。
+
+- uncached：每轮都重新构建提示词模板、绑定工具并创建 AgentExecutor（缓存前 _get_agent 的行为）；
+- cached：ChatService._get_agent 命中按 (工具集, 提示词指纹, 模型) 缓存的智能体。
+另外给出使用假 LLM 完整跑一轮 handle_chat 的耗时，用于对照构建开销在整轮中的占比。
+使用真实的 ChatOpenAI 客户端构建（不会发出请求），以包含 bind_tools 生成工具 schema 的开销。
+
+用法：
+    python -m benchmarks.bench_agent_cache
+"""
+import contextlib
+import io
+import os
+import statistics
+import time
+
+from flask import Flask
+from langchain_core.messages import AIMessage
+from langchain_openai import ChatOpenAI
+
+import services.chat_service as chat_service_module
+from services.chat_service import ChatService
+from benchmarks.bench_stream_ttft import SlowFakeChatModel, InMemorySessionManager, NoVectorDB
+
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', 50))
+
+
+def _median_ms(fn, rounds=ROUNDS):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    app = Flask(__name__)
+    app.config.update(LLM_MODEL_NAME='bench', LLM_BASE_URL='http://127.0.0.1:1/v1')
+    llm = ChatOpenAI(model='bench', api_key='bench', base_url=app.config['LLM_BASE_URL'])
+    chat_service_module.get_llm = lambda: llm
+    service = ChatService(InMemorySessionManager(), NoVectorDB())
+
+    with app.app_context(), contextlib.redirect_stdout(io.StringIO()):
+        uncached = _median_ms(lambda: service._build_agent(service._get_tools('bench')))
+        service._get_agent('bench')
+        cached = _median_ms(lambda: service._get_agent('bench'))
+
+        # 假 LLM 直接回答，整轮耗时基本只剩框架开销
+        fake_llm = SlowFakeChatModel(messages=iter(AIMessage(content='ok') for _ in range(2 * ROUNDS)),
+                                     token_delay=0)
+        chat_service_module.get_llm = lambda: fake_llm
+        service = ChatService(InMemorySessionManager(), NoVectorDB())
+        turn = _median_ms(lambda: service.handle_chat('hello', 'You are a helpful assistant.', 'bench'))
+
+    print(f"rounds={ROUNDS}")
+    print(f"agent construction (uncached): {uncached:8.2f} ms/turn")
+    print(f"agent lookup       (cached):   {cached:8.3f} ms/turn")
+    print(f"full turn with fake LLM (cached agent): {turn:8.2f} ms")
+    print(f"cache stats: {service.get_agent_cache_stats()}")
+
+
+if __name__ == '__main__':
+    main()
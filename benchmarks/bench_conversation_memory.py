@@ -0,0 +1,97 @@
+"""
+对比 buffer 与 summary 两种对话记忆在长会话中每轮的提示词大小。
+
+模拟一个 TURNS 轮的会话，每轮用户消息和回答各约 TURN_CHARS 个字符（中文），对每种记忆模式逐轮统计：
+- 提示词 token 数：系统提示词 + 历史消息（含摘要）+ 本轮输入，与 ChatService 日志中记录的一致；
+- 预填充耗时：按 PREFILL_TPS tokens/s 估算模型处理提示词的时间。
+summary 模式的摘要由本地的桩模型生成（截取合并内容的开头），合并在后台线程中进行，与线上一致。
+
+用法：
+    python -m benchmarks.bench_conversation_memory
+"""
+import os
+import time
+from typing import List, Optional
+
+from flask import Flask
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import services.conversation_memory as conversation_memory_module
+from services.chat_service import ChatService
+from services.conversation_memory import ConversationMemory
+
+TURNS = int(os.environ.get('BENCH_TURNS', 80))
+TURN_CHARS = int(os.environ.get('BENCH_TURN_CHARS', 300))
+MAX_TOKENS = int(os.environ.get('BENCH_MAX_TOKENS', 3000))
+PREFILL_TPS = float(os.environ.get('BENCH_PREFILL_TPS', 2000))
+SUMMARY_LATENCY = float(os.environ.get('BENCH_SUMMARY_LATENCY', 0.05))
+
+
+class StubSummaryLLM(BaseChatModel):
+    """截取合并内容开头作为摘要的桩模型"""
+
+    @property
+    def _llm_type(self) -> str:
+        return 'stub-summary'
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(SUMMARY_LATENCY)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=messages[-1].content[:600]))])
+
+
+class DictSessionManager:
+    """只保存滚动摘要的内存版会话存储"""
+
+    def __init__(self):
+        self.summaries = {}
+
+    def get_session_summary(self, session_id):
+        return self.summaries.get(session_id)
+
+    def set_session_summary(self, session_id, summary, covered):
+        self.summaries[session_id] = {'summary': summary, 'covered': covered}
+
+
+def _message(turn: int, role: str):
+    text = f'第{turn}轮{role}：关于季度报告中收入、成本和人员规模的讨论，以及下一步的计划。'
+    return (text * (TURN_CHARS // len(text) + 1))[:TURN_CHARS]
+
+
+def main():
+    app = Flask(__name__)
+    conversation_memory_module.get_llm = lambda: StubSummaryLLM()
+    print(f"turns={TURNS} chars/message={TURN_CHARS} budget={MAX_TOKENS} tokens prefill={PREFILL_TPS:.0f} tokens/s")
+    with app.app_context():
+        app.logger.disabled = True
+        for mode in ('buffer', 'summary'):
+            memory = ConversationMemory(DictSessionManager(), mode=mode, max_tokens=MAX_TOKENS)
+            service = ChatService(None, None, memory=memory)
+            session = []
+            print(f"\n{mode}")
+            print(f"{'turn':>6}{'history msgs':>14}{'prompt tokens':>15}{'prefill':>10}{'build':>10}")
+            for turn in range(1, TURNS + 1):
+                user_message = _message(turn, '用户')
+                before = memory._stats['prompt_tokens']
+                start = time.perf_counter()
+                inputs = service._agent_inputs(user_message, '', session, 'bench')
+                build_ms = (time.perf_counter() - start) * 1000
+                tokens = memory._stats['prompt_tokens'] - before
+                if turn == 1 or turn % 10 == 0:
+                    print(f"{turn:>6}{len(inputs['chat_history']):>14}{tokens:>15}"
+                          f"{tokens / PREFILL_TPS * 1000:>8.0f}ms{build_ms:>8.1f}ms")
+                session, _ = service._append_turn(session, user_message, _message(turn, '助手'))
+                memory.after_turn('bench', session)
+                # 等待后台合并完成，模拟用户两轮之间的间隔
+                while memory.get_stats()['folding']:
+                    time.sleep(0.01)
+            stats = memory.get_stats()
+            print(f"avg prompt tokens={stats['avg_prompt_tokens']} max={stats['max_prompt_tokens']} "
+                  f"folds={stats['folds']} dropped messages={stats['dropped_messages']}")
+            memory.shutdown()
+
+
+if __name__ == '__main__':
+    main()
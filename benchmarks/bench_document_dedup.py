@@ -0,0 +1,108 @@
+"""
+测量文档登记表对重复上传相同文件的影响。
+
+模拟 /chat_with_file 中对话之前的文件处理阶段（计算文件哈希 -> 复制上传内容 -> 解析 -> 摘要 -> 分片 -> embedding -> 写入向量库），
+摘要 LLM 和 embedding API 用固定延迟的假实现代替（SUMMARY_LATENCY / EMBED_LATENCY 秒），不调用外部 API。
+同一个文件依次上传到 SESSIONS 个不同会话：第一次完整处理，之后直接复用登记的分片和向量。
+最后清理所有会话，确认引用归零后文档被删除。
+
+用法：
+    python -m benchmarks.bench_document_dedup
+"""
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from flask import Flask
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from werkzeug.datastructures import FileStorage
+
+import models.vector_db_manager as vector_db_manager_module
+from models.document_registry import DocumentRegistry
+from models.vector_db_manager import VectorDBManager
+from utils.file_util import file_sha256, spool_upload, iter_file_sections
+
+SESSIONS = int(os.environ.get('BENCH_SESSIONS', 10))
+DOC_KB = int(os.environ.get('BENCH_DOC_KB', 200))
+SUMMARY_LATENCY = float(os.environ.get('BENCH_SUMMARY_LATENCY', 5.0))
+EMBED_LATENCY = float(os.environ.get('BENCH_EMBED_LATENCY', 0.2))
+EMBED_BATCH = 25
+
+
+class SlowSummarizer:
+    """DocumentSummarizer.stream() 的假实现：整篇文档的摘要耗时 SUMMARY_LATENCY 秒"""
+
+    def stream(self):
+        return self
+
+    def add(self, text):
+        pass
+
+    def finish(self):
+        time.sleep(SUMMARY_LATENCY)
+        return '这是一份员工手册的摘要。'
+
+    def close(self):
+        pass
+
+
+class SlowFakeEmbeddings(DeterministicFakeEmbedding):
+    def embed_documents(self, texts):
+        time.sleep(EMBED_LATENCY * ((len(texts) + EMBED_BATCH - 1) // EMBED_BATCH))
+        return super().embed_documents(texts)
+
+
+def _ingest(manager, data, session_id):
+    """与 IngestionService 中的文件处理步骤相同"""
+    uploaded_file = FileStorage(stream=io.BytesIO(data), filename='handbook.txt')
+    file_hash = file_sha256(uploaded_file)
+    if manager.attach_registered_document(uploaded_file.filename, file_hash, session_id):
+        return
+    upload = spool_upload(uploaded_file)
+    try:
+        manager.generate_embeddings(uploaded_file.filename, iter_file_sections(upload, uploaded_file.filename),
+                                    session_id, file_hash=file_hash)
+    finally:
+        upload.close()
+
+
+def main():
+    line = '第 {} 条：员工应当遵守公司的各项规章制度，按时完成本职工作。\n'
+    data = ''.join(line.format(i) for i in range(DOC_KB * 1024 // len(line.encode('utf-8')))).encode('utf-8')
+
+    with tempfile.TemporaryDirectory() as root:
+        app = Flask(__name__)
+        app.config.update(UPLOAD_FOLDER=os.path.join(root, 'uploads'), EMBEDDING_CACHE_ENABLED=False)
+        embeddings = SlowFakeEmbeddings(size=1536)
+        vector_db_manager_module.get_embeddings = lambda: embeddings
+        vector_db_manager_module.get_document_embeddings = lambda: embeddings
+
+        registry = DocumentRegistry(os.path.join(root, 'document_registry.sqlite3'))
+        manager = VectorDBManager(os.path.join(root, 'embedding'), layout='shared', registry=registry,
+                                  summarizer=SlowSummarizer())
+
+        timings = []
+        with app.app_context():
+            for i in range(SESSIONS):
+                start = time.perf_counter()
+                _ingest(manager, data, f'session-{i}')
+                timings.append((time.perf_counter() - start) * 1000)
+            stats_before = registry.get_stats()
+            for i in range(SESSIONS):
+                manager.clear_vector_db(f'session-{i}')
+            stats_after = registry.get_stats()
+            vector_db_manager_module.VectorStoreCache._stop_system(
+                os.path.join(root, 'embedding', vector_db_manager_module.SHARED_DIR_NAME))
+
+    print(f"file={len(data) / 1024:.0f}KB sessions={SESSIONS} summary latency={SUMMARY_LATENCY}s "
+          f"embed latency={EMBED_LATENCY * 1000:.0f}ms/{EMBED_BATCH} chunks")
+    print(f"first upload:          {timings[0]:10.1f} ms")
+    print(f"repeat uploads (p50):  {statistics.median(timings[1:]):10.1f} ms")
+    print(f"registry after uploads: {stats_before}")
+    print(f"registry after clears:  {stats_after}")
+
+
+if __name__ == '__main__':
+    main()
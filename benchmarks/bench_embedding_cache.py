@@ -0,0 +1,63 @@
+"""
+测量 embedding 缓存对重复上传文档的影响。
+
+使用假的 embedding 模型模拟 DashScope：每次 API 调用最多 BATCH 条文本，每次调用固定延迟 API_LATENCY 秒，
+并统计调用次数和发送的文本条数。对同一份文档（DOC_CHUNKS 个文本块）依次执行：
+- 首次上传（缓存为空）；
+- 重复上传（所有文本块命中缓存）；
+- 修改了 10% 内容后再次上传（只有变化的文本块需要调用 API）。
+
+用法：
+    python -m benchmarks.bench_embedding_cache
+"""
+import os
+import tempfile
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from models.embedding_cache import EmbeddingCache, CachedEmbeddings
+
+DOC_CHUNKS = int(os.environ.get('BENCH_DOC_CHUNKS', 400))
+BATCH = int(os.environ.get('BENCH_BATCH', 25))
+API_LATENCY = float(os.environ.get('BENCH_API_LATENCY', 0.2))
+
+
+class SlowFakeEmbeddings(DeterministicFakeEmbedding):
+    """按批调用、每批固定延迟的假 embedding 模型"""
+    calls: int = 0
+    texts_sent: int = 0
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), BATCH):
+            batch = texts[start:start + BATCH]
+            time.sleep(API_LATENCY)
+            self.calls += 1
+            self.texts_sent += len(batch)
+            vectors.extend(super().embed_documents(batch))
+        return vectors
+
+
+def main():
+    chunks = [f'员工手册 第 {i} 节：' + '这是一段需要向量化的正文内容。' * 20 for i in range(DOC_CHUNKS)]
+    edited = [chunk + '（已修订）' if i % 10 == 0 else chunk for i, chunk in enumerate(chunks)]
+
+    with tempfile.TemporaryDirectory() as root:
+        underlying = SlowFakeEmbeddings(size=1536)
+        cache = EmbeddingCache(os.path.join(root, 'embedding_cache.sqlite3'))
+        embeddings = CachedEmbeddings(underlying, cache, 'text-embedding-v1')
+
+        print(f"chunks={DOC_CHUNKS} batch={BATCH} api latency={API_LATENCY * 1000:.0f}ms/call")
+        print(f"{'upload':<16}{'time (ms)':>12}{'api calls':>11}{'texts sent':>12}")
+        for name, texts in (('first', chunks), ('repeat', chunks), ('10% edited', edited)):
+            calls, sent = underlying.calls, underlying.texts_sent
+            start = time.perf_counter()
+            embeddings.embed_documents(texts)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"{name:<16}{elapsed:>12.1f}{underlying.calls - calls:>11}{underlying.texts_sent - sent:>12}")
+        print(f"cache stats: {cache.get_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+测量文档分片 embedding 的吞吐（chunks/s），对比串行调用与 EmbeddingExecutor。
+
+在本地启动一个假的 DashScope 文本 embedding 服务（通过 DASHSCOPE_HTTP_BASE_URL 指向它），不调用外部 API：
+- 每个请求固定延迟 REQUEST_LATENCY 秒，外加每条文本 PER_TEXT_LATENCY 秒；
+- 每秒最多接受 SERVER_RPS 个请求，超出时返回 429（Throttling.RateQuota）。
+分别测量：
+- serial：原来的做法，DashScopeEmbeddings.embed_documents 按 25 条一批串行请求，429 时由客户端内部指数退避重试；
+- executor：EmbeddingExecutor 按服务商上限分批、CONCURRENCY 路并发，速率上限 CLIENT_RATE（故意高于服务端限制），
+  遇到 429 时令牌桶降速。
+
+用法：
+    python -m benchmarks.bench_embedding_throughput
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PORT = int(os.environ.get('BENCH_PORT', 18020))
+os.environ['DASHSCOPE_HTTP_BASE_URL'] = f'http://127.0.0.1:{PORT}/api/v1'
+
+from langchain_community.embeddings import DashScopeEmbeddings  # noqa: E402
+
+from models.embedding_executor import EmbeddingExecutor  # noqa: E402
+
+CHUNKS = int(os.environ.get('BENCH_CHUNKS', 1000))
+DIM = 1536
+REQUEST_LATENCY = float(os.environ.get('BENCH_REQUEST_LATENCY', 0.3))
+PER_TEXT_LATENCY = float(os.environ.get('BENCH_PER_TEXT_LATENCY', 0.004))
+SERVER_RPS = float(os.environ.get('BENCH_SERVER_RPS', 8))
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', 4))
+CLIENT_RATE = float(os.environ.get('BENCH_CLIENT_RATE', 20))
+
+
+class FakeDashScopeServer(BaseHTTPRequestHandler):
+    window = deque()
+    lock = threading.Lock()
+    stats = {'requests': 0, 'throttled': 0}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        texts = body['input']['texts']
+        now = time.monotonic()
+        with self.lock:
+            self.stats['requests'] += 1
+            while self.window and now - self.window[0] > 1.0:
+                self.window.popleft()
+            throttled = len(self.window) >= SERVER_RPS
+            if throttled:
+                self.stats['throttled'] += 1
+            else:
+                self.window.append(now)
+
+        if throttled:
+            self._reply(429, {'request_id': 'fake', 'code': 'Throttling.RateQuota',
+                              'message': 'Requests rate limit exceeded, please try again later.'})
+            return
+        time.sleep(REQUEST_LATENCY + PER_TEXT_LATENCY * len(texts))
+        embeddings = [{'text_index': i, 'embedding': [((hash(t) >> (k % 32)) & 0xff) / 255.0 for k in range(DIM)]}
+                      for i, t in enumerate(texts)]
+        self._reply(200, {'request_id': 'fake', 'output': {'embeddings': embeddings},
+                          'usage': {'total_tokens': sum(len(t) for t in texts)}})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def _measure(name, fn):
+    FakeDashScopeServer.stats.update(requests=0, throttled=0)
+    FakeDashScopeServer.window.clear()
+    start = time.perf_counter()
+    vectors = fn()
+    elapsed = time.perf_counter() - start
+    assert len(vectors) == CHUNKS
+    stats = FakeDashScopeServer.stats
+    print(f"{name:<10}{elapsed:>9.2f}s{CHUNKS / elapsed:>12.1f}{stats['requests']:>10}{stats['throttled']:>10}")
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', PORT), FakeDashScopeServer)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    texts = [f'第 {i} 个分片：' + '需要计算向量的正文内容。' * 30 for i in range(CHUNKS)]
+
+    def serial():
+        return DashScopeEmbeddings(model='text-embedding-v1', dashscope_api_key='fake').embed_documents(texts)
+
+    def executor():
+        embeddings = DashScopeEmbeddings(model='text-embedding-v1', dashscope_api_key='fake', max_retries=1)
+        runner = EmbeddingExecutor(max_concurrency=CONCURRENCY, rate_limit=CLIENT_RATE)
+        vectors = [None] * len(texts)
+        for start, batch in runner.embed(embeddings, texts):
+            vectors[start:start + len(batch)] = batch
+        print(f"          executor stats: {runner.get_stats()}")
+        return vectors
+
+    print(f"chunks={CHUNKS} server limit={SERVER_RPS:.0f} req/s latency={REQUEST_LATENCY * 1000:.0f}ms"
+          f"+{PER_TEXT_LATENCY * 1000:.0f}ms/text concurrency={CONCURRENCY} client rate={CLIENT_RATE:.0f} req/s")
+    print(f"{'mode':<10}{'time':>10}{'chunks/s':>12}{'requests':>10}{'429s':>10}")
+    _measure('serial', serial)
+    _measure('executor', executor)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+测量图片描述的缩放预处理和缓存对 /chat_with_image 的影响。
+
+使用本地的桩视觉模型，不调用外部 API：耗时 = BASE_LATENCY + 上传字节数 / UPLOAD_BPS + 图片 token 数 / PREFILL_TPS，
+图片 token 数按每 28x28 像素一个估算。测试图片为合成的手机照片（4032x3024 JPEG）和高分屏截图（2880x1800 PNG）。
+对每张图片依次测量：
+- original：原来的做法，原图 base64 后直接发送；
+- resized：缩小到长边不超过 IMAGE_MAX_SIDE 并重新压缩后发送；
+- cached：同一张图片再次发送，直接使用缓存的描述。
+
+用法：
+    python -m benchmarks.bench_image_desc
+"""
+import base64
+import io
+import os
+import random
+import time
+from typing import List, Optional
+
+from flask import Flask
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from PIL import Image, ImageDraw
+
+import services.chat_service as chat_service_module
+from services.chat_service import ChatService
+from utils.file_util import get_image_desc
+
+MAX_SIDE = int(os.environ.get('BENCH_MAX_SIDE', 1536))
+BASE_LATENCY = float(os.environ.get('BENCH_BASE_LATENCY', 1.0))
+UPLOAD_BPS = float(os.environ.get('BENCH_UPLOAD_BPS', 4 * 1024 * 1024))
+PREFILL_TPS = float(os.environ.get('BENCH_PREFILL_TPS', 5000))
+
+
+class StubVisionLLM(BaseChatModel):
+    """按上传大小和图片分辨率模拟耗时的桩视觉模型"""
+    tokens: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return 'stub-vision'
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        url = messages[-1].content[1]['image_url']['url']
+        data = base64.b64decode(url.split(',', 1)[1])
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+        self.tokens = width * height // (28 * 28)
+        time.sleep(BASE_LATENCY + len(url) / UPLOAD_BPS + self.tokens / PREFILL_TPS)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f'一张 {width}x{height} 的图片'))])
+
+
+class DictImageCache:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, description):
+        self.data[key] = description
+
+
+def _photo():
+    rng = random.Random(0)
+    image = Image.new('RGB', (4032, 3024))
+    draw = ImageDraw.Draw(image)
+    for _ in range(3000):
+        x, y = rng.randrange(4032), rng.randrange(3024)
+        draw.ellipse((x, y, x + rng.randrange(20, 300), y + rng.randrange(20, 300)),
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    image = image.effect_spread(3)
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=92)
+    return 'photo.jpg', output.getvalue()
+
+
+def _screenshot():
+    image = Image.new('RGB', (2880, 1800), (250, 250, 250))
+    draw = ImageDraw.Draw(image)
+    for row in range(0, 1800, 24):
+        draw.text((40, row), f'{row:05d}  INFO  request handled in {row % 97} ms  session=abc{row}  status=200 ' * 3,
+                  fill=(30, 30, 30))
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return 'screenshot.png', output.getvalue()
+
+
+def main():
+    app = Flask(__name__)
+    app.config.update(VISION_MODEL_NAME='stub-vision', IMAGE_MAX_SIDE=MAX_SIDE)
+    llm = StubVisionLLM()
+    chat_service_module.get_vision_llm = lambda: llm
+    service = ChatService.__new__(ChatService)
+    ChatService.__init__(service, None, None, image_desc_cache=DictImageCache())
+
+    print(f"max side={MAX_SIDE} base latency={BASE_LATENCY}s upload={UPLOAD_BPS / 1024 / 1024:.0f} MB/s "
+          f"prefill={PREFILL_TPS:.0f} tokens/s")
+    print(f"{'image':<16}{'mode':<10}{'sent':>11}{'tokens':>9}{'latency':>10}")
+    with app.app_context():
+        for name, data in (_photo(), _screenshot()):
+            start = time.perf_counter()
+            get_image_desc(llm, base64.b64encode(data).decode('utf-8'))
+            print(f"{name:<16}{'original':<10}{len(data) / 1024:>8.0f} KB{llm.tokens:>9}"
+                  f"{(time.perf_counter() - start) * 1000:>8.0f}ms")
+
+            before = service.get_image_stats()['bytes_sent']
+            start = time.perf_counter()
+            service._vision_description(data)
+            sent = service.get_image_stats()['bytes_sent'] - before
+            print(f"{'':<16}{'resized':<10}{sent / 1024:>8.0f} KB{llm.tokens:>9}"
+                  f"{(time.perf_counter() - start) * 1000:>8.0f}ms")
+
+            start = time.perf_counter()
+            service._vision_description(data)
+            print(f"{'':<16}{'cached':<10}{0:>8} KB{0:>9}{(time.perf_counter() - start) * 1000:>8.1f}ms")
+    print(f"stats: {service.get_image_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+测量同一步中多个工具调用并发执行对智能体耗时的影响。
+
+模型为本地桩模型：第一步一次请求 TOOLS 个工具调用，拿到全部结果后第二步直接给出回答；
+每个工具等待 TOOL_LATENCY 秒模拟联网搜索或抓取网页，不调用外部 API。
+分别用 AgentExecutor（逐个执行工具）和 ParallelAgentExecutor 同步（invoke）和异步（ainvoke）调用，
+统计整次调用的耗时；最后把其中一个工具设为 SLOW_LATENCY 秒、超时设为 TIMEOUT 秒，观察超时的调用被取消后智能体照常返回。
+
+用法：
+    python -m benchmarks.bench_parallel_tools
+"""
+import asyncio
+import os
+import time
+
+from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tools import StructuredTool
+
+from services.parallel_agent import ParallelAgentExecutor, get_tool_execution_stats
+
+TOOLS = int(os.environ.get('BENCH_TOOLS', 4))
+TOOL_LATENCY = float(os.environ.get('BENCH_TOOL_LATENCY', 0.5))
+SLOW_LATENCY = float(os.environ.get('BENCH_SLOW_LATENCY', 3))
+TIMEOUT = float(os.environ.get('BENCH_TIMEOUT', 1))
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', 3))
+
+
+class MultiToolChatModel(BaseChatModel):
+    """没有工具结果时一次请求所有工具，否则返回最终回答"""
+    tool_names: list
+
+    @property
+    def _llm_type(self):
+        return 'bench-multi-tool'
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if any(isinstance(message, ToolMessage) for message in messages):
+            message = AIMessage(content=f'汇总了 {sum(isinstance(m, ToolMessage) for m in messages)} 个工具的结果')
+        else:
+            message = AIMessage(content='', tool_calls=[
+                {'name': name, 'args': {'query': f'问题 {i}'}, 'id': f'call_{i}'}
+                for i, name in enumerate(self.tool_names)])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _tools(latencies: list):
+    def make(index, latency):
+        def run(query: str) -> str:
+            time.sleep(latency)
+            return f'{query} 的结果'
+
+        async def arun(query: str) -> str:
+            await asyncio.sleep(latency)
+            return f'{query} 的结果'
+
+        return StructuredTool.from_function(func=run, coroutine=arun, name=f'search_{index}',
+                                            description='模拟的联网搜索')
+
+    return [make(index, latency) for index, latency in enumerate(latencies)]
+
+
+def _executor(executor_class, latencies: list, **kwargs):
+    tools = _tools(latencies)
+    prompt = ChatPromptTemplate.from_messages([('human', '{input}'), ('placeholder', '{agent_scratchpad}')])
+    agent = create_tool_calling_agent(MultiToolChatModel(tool_names=[t.name for t in tools]), tools, prompt)
+    return executor_class(agent=agent, tools=tools, max_iterations=5, max_execution_time=30, **kwargs)
+
+
+def _timed(call):
+    elapsed = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = call()
+        elapsed.append(time.perf_counter() - start)
+    return sum(elapsed) / len(elapsed) * 1000, result
+
+
+def main():
+    latencies = [TOOL_LATENCY] * TOOLS
+    print(f"{TOOLS} tool calls per step, {TOOL_LATENCY * 1000:.0f} ms each, {ROUNDS} rounds")
+    print(f"{'executor':<34}{'avg ms':>9}")
+    sequential = _executor(AgentExecutor, latencies)
+    parallel = _executor(ParallelAgentExecutor, latencies, tool_timeout=TIMEOUT * 10)
+    for name, call in [
+        ('AgentExecutor.invoke', lambda: sequential.invoke({'input': '问题'})),
+        ('ParallelAgentExecutor.invoke', lambda: parallel.invoke({'input': '问题'})),
+        ('AgentExecutor.ainvoke', lambda: asyncio.run(sequential.ainvoke({'input': '问题'}))),
+        ('ParallelAgentExecutor.ainvoke', lambda: asyncio.run(parallel.ainvoke({'input': '问题'}))),
+    ]:
+        ms, result = _timed(call)
+        print(f"{name:<34}{ms:>9.0f}  {result['output']}")
+
+    latencies[-1] = SLOW_LATENCY
+    print(f"\none tool takes {SLOW_LATENCY * 1000:.0f} ms, tool timeout {TIMEOUT * 1000:.0f} ms")
+    with_timeout = _executor(ParallelAgentExecutor, latencies, tool_timeout=TIMEOUT, return_intermediate_steps=True)
+    for name, call in [
+        ('ParallelAgentExecutor.invoke', lambda: with_timeout.invoke({'input': '问题'})),
+        ('ParallelAgentExecutor.ainvoke', lambda: asyncio.run(with_timeout.ainvoke({'input': '问题'}))),
+    ]:
+        start = time.perf_counter()
+        result = call()
+        observations = [str(observation)[:24] for _, observation in result['intermediate_steps']]
+        print(f"{name:<34}{(time.perf_counter() - start) * 1000:>9.0f}  {observations}")
+    print(f"\ntool execution stats: {get_tool_execution_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+对比整篇加载与流式、按页并行解析多页 PDF 的耗时和内存。
+
+在临时目录中生成 PAGES 页的合成 PDF（每页约 LINES_PER_PAGE 行文本），每种方式在独立子进程中运行：
+- load：原来的做法，PyPDFLoader.load() 读出所有页，拼接为整篇文本后一次切分为 500 字符的分片；
+- stream (N workers)：iter_file_sections 逐页产出文本（N > 1 时页面在 N 个进程中并行提取），
+  StreamingSplitter 增量切分，分片产出后即被消费、不在内存中保留。
+内存为解析进程的峰值 RSS 相对导入完依赖后的增量；并行解析时另列出单个解析子进程的峰值 RSS。
+
+用法：
+    python -m benchmarks.bench_pdf_parsing
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PAGES = [int(p) for p in os.environ.get('BENCH_PAGES', '300,800').split(',')]
+LINES_PER_PAGE = int(os.environ.get('BENCH_LINES_PER_PAGE', 45))
+WORKERS = [int(w) for w in os.environ.get('BENCH_WORKERS', '1,4').split(',')]
+
+
+def _write_pdf(path: str, pages: int):
+    """生成只包含 Helvetica 文本的最小 PDF"""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for page in range(pages):
+        lines = [f'Page {page + 1} line {line + 1}: the quarterly report describes revenue, costs, '
+                 f'headcount and the outlook for section {page % 17}.' for line in range(LINES_PER_PAGE)]
+        stream = 'BT /F1 9 Tf 11 TL 40 800 Td ' + ' '.join(f'({text}) Tj T*' for text in lines) + ' ET'
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream.encode('latin-1') + b'\nendstream')
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % (len(objects)))
+        kids.append(len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % kid for kid in kids), pages)
+
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n')
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+        xref = f.tell()
+        f.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b'%010d 00000 n \n' % offset)
+        f.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+
+
+def _rss_kb(field: str, pid='self') -> int:
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+    return 0
+
+
+def _children_peak_kb() -> int:
+    """子进程（解析进程池）中最大的峰值 RSS"""
+    peak = 0
+    for task in os.listdir('/proc/self/task'):
+        with open(f'/proc/self/task/{task}/children') as f:
+            for pid in f.read().split():
+                if 'multiprocessing.spawn' in open(f'/proc/{pid}/cmdline').read():
+                    peak = max(peak, _rss_kb('VmHWM', pid))
+    return peak
+
+
+def _run(mode: str, path: str, workers: int):
+    """在子进程中执行一种解析方式，打印 耗时 分片数 RSS增量 子进程RSS"""
+    from flask import Flask
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.document_loaders import PyPDFLoader
+
+    from utils.file_util import iter_file_sections
+    from utils.pdf_pages import shutdown_pool
+    from utils.stream_splitter import StreamingSplitter
+    from models.vector_db_manager import CHUNK_FLUSH_CHARS
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    app = Flask(__name__)
+    baseline = _rss_kb('VmRSS')
+    start = time.perf_counter()
+    chunks = 0
+    if mode == 'load':
+        documents = PyPDFLoader(path).load()
+        text = "\n".join([doc.page_content for doc in documents])
+        chunks = len(splitter.split_text(text))
+    else:
+        with app.app_context():
+            stream = StreamingSplitter(splitter, flush_size=CHUNK_FLUSH_CHARS)
+            for section in iter_file_sections(path, pdf_workers=workers):
+                chunks += len(stream.feed(section))
+            chunks += len(stream.close())
+    elapsed = time.perf_counter() - start
+    peak = _rss_kb('VmHWM') - baseline
+    children = _children_peak_kb()
+    shutdown_pool()
+    print(f'{elapsed:.3f} {chunks} {peak} {children}')
+
+
+def main():
+    print(f"{'pages':>6}  {'mode':<18}{'time':>9}{'chunks':>9}{'parent RSS':>13}{'worker RSS':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in PAGES:
+            path = os.path.join(tmp, f'report_{pages}.pdf')
+            _write_pdf(path, pages)
+            modes = [('load', 1)] + [('stream', workers) for workers in WORKERS]
+            for mode, workers in modes:
+                output = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.bench_pdf_parsing', mode, path, str(workers)],
+                    capture_output=True, text=True, check=True).stdout.split()
+                elapsed, chunks, peak, children = float(output[0]), int(output[1]), int(output[2]), int(output[3])
+                label = 'load' if mode == 'load' else f'stream ({workers} workers)'
+                child = f'{children / 1024:.1f} MB' if mode == 'stream' and workers > 1 else '-'
+                print(f'{pages:>6}  {label:<18}{elapsed:>8.2f}s{chunks:>9}{peak / 1024:>10.1f} MB{child:>12}')
+    print(f'cpu count: {os.cpu_count()}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4:
+        _run(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
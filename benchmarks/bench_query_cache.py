@@ -0,0 +1,107 @@
+"""
+测量查询缓存对向量数据库查询工具的影响。
+
+语料与 bench_retrieval 相同（确定性生成的代码文件分片），embedding 使用桩模型，每次查询 embedding 额外等待
+EMBED_LATENCY 秒模拟远程调用。模拟智能体在一个会话中发出 QUERIES 次查询：
+约 REPEAT_RATIO 的查询是之前查询过的问题，其中一半只在大小写、空白或末尾标点上不同；
+查询进行到一半时会话上传了一个新文件，此前缓存的检索结果失效，查询向量仍可复用。
+分别在不使用缓存和使用缓存时统计 embedding 请求次数、ANN 检索次数和平均耗时，
+并核对缓存返回的结果：完全相同的查询应与不使用缓存时一致，近似相同的查询返回首次查询的结果。
+
+用法：
+    python -m benchmarks.bench_query_cache
+"""
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+from flask import Flask
+
+import models.retriever as retriever_module
+import models.vector_db_manager as vector_db_manager_module
+from benchmarks.bench_retrieval import HashingEmbeddings, _corpus
+from models.keyword_index import KeywordIndex
+from models.query_cache import QueryCache
+from models.retriever import HybridRetriever
+from models.vector_db_manager import VectorDBManager
+
+QUERIES = int(os.environ.get('BENCH_QUERIES', 200))
+REPEAT_RATIO = float(os.environ.get('BENCH_REPEAT_RATIO', 0.5))
+EMBED_LATENCY = float(os.environ.get('BENCH_EMBED_LATENCY', 0.08))
+SESSION_ID = 'bench-query-cache'
+
+
+class SlowEmbeddings(HashingEmbeddings):
+    """每次查询 embedding 都等待 EMBED_LATENCY 秒的桩模型"""
+    calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        time.sleep(EMBED_LATENCY)
+        return super().embed_query(text)
+
+
+def _workload(queries):
+    rng = random.Random(1)
+    asked = []
+    for _ in range(QUERIES):
+        if asked and rng.random() < REPEAT_RATIO:
+            query = rng.choice(asked)
+            if rng.random() < 0.5:
+                query = rng.choice([query.upper(), f'  {query.rstrip("？")}?', query.replace(' ', '  ')])
+        else:
+            query = rng.choice(queries)[0]
+            asked.append(query)
+        yield query
+
+
+def main():
+    app = Flask(__name__)
+    files, queries = _corpus()
+    workload = list(_workload(queries))
+    asked = {query for query, _, _ in queries}
+    new_file = ['def reconcile_gift_card_balance(self, ctx, request):\n'
+                '    """按月核对礼品卡余额，结果写入缓存，失败时抛出 ServiceError。"""\n'
+                '    return self.cache.put(request.key, self.repository.query(ctx, request))']
+
+    print(f"{len(workload)} queries, repeat ratio {REPEAT_RATIO}, embed latency {EMBED_LATENCY * 1000:.0f} ms")
+    print(f"{'mode':<10}{'embed calls':>13}{'ANN searches':>14}{'avg ms':>9}")
+    answers = {}
+    with app.app_context():
+        app.logger.disabled = True
+        for mode in ('no cache', 'cache'):
+            embeddings = SlowEmbeddings(256)
+            vector_db_manager_module.get_embeddings = lambda: embeddings
+            retriever_module.get_embeddings = lambda: embeddings
+            with tempfile.TemporaryDirectory() as tmp:
+                retriever = HybridRetriever(KeywordIndex(os.path.join(tmp, 'keyword_index.sqlite3')))
+                manager = VectorDBManager(os.path.join(tmp, 'embedding'), retriever=retriever,
+                                          query_cache=QueryCache() if mode == 'cache' else None)
+                for file_name, chunks in files:
+                    manager._add_chunks(SESSION_ID, file_name, chunks, embeddings.embed_documents(chunks))
+                embeddings.calls = 0
+
+                elapsed, results = [], []
+                for index, query in enumerate(workload):
+                    if index == len(workload) // 2:
+                        manager._add_chunks(SESSION_ID, 'gift_card.py', new_file,
+                                            embeddings.embed_documents(new_file))
+                    start = time.perf_counter()
+                    results.append(manager.retrieve_chunks(query, SESSION_ID))
+                    elapsed.append((time.perf_counter() - start) * 1000)
+                answers[mode] = results
+                searches = retriever.get_stats()['queries']
+                print(f"{mode:<10}{embeddings.calls:>13}{searches:>14}{sum(elapsed) / len(elapsed):>9.1f}")
+                if mode == 'cache':
+                    print(f"cache stats: {manager.get_query_cache_stats()}")
+
+    mismatched = Counter('exact' if query in asked else 'variant'
+                         for query, a, b in zip(workload, answers['no cache'], answers['cache']) if a != b)
+    print(f"results differing from uncached retrieval: exact queries {mismatched['exact']}, "
+          f"near-identical variants {mismatched['variant']}")
+
+
+if __name__ == '__main__':
+    main()
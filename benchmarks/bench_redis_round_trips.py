@@ -0,0 +1,111 @@
+"""
+统计一轮 handle_chat 中的 Redis 往返次数与建连次数（优化前 / 优化后）。
+
+优化前：每次调用 _get_redis_client 都新建连接池并 PING，一轮对话依次执行
+print_session_history / get_session_history / set_session_history / sync_session_to_mysql 中的再次读取；
+优化后：共享连接池，不再 PING，打印与同步直接复用已读取的历史。
+MySQL 同步不在统计范围内。
+
+用法（需要一个可写的 Redis，建议使用单独的 db）：
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.bench_redis_round_trips
+"""
+import contextlib
+import io
+import json
+import os
+import time
+
+import redis
+from flask import Flask
+from langchain_core.messages import HumanMessage, AIMessage
+
+from utils.session_storage import RedisSessionManager
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/15')
+TURNS = int(os.environ.get('BENCH_TURNS', 200))
+
+
+class CountingConnection(redis.Connection):
+    """统计发送到服务端的数据包（即往返次数）和建连次数"""
+    round_trips = 0
+    connects = 0
+
+    def _connect(self):
+        CountingConnection.connects += 1
+        return super()._connect()
+
+    def send_packed_command(self, command, check_health=True):
+        CountingConnection.round_trips += 1
+        super().send_packed_command(command, check_health)
+
+    @classmethod
+    def reset(cls):
+        cls.round_trips = 0
+        cls.connects = 0
+
+
+def _legacy_client():
+    """还原优化前的 _get_redis_client：每次新建连接池并 PING"""
+    pool = redis.ConnectionPool.from_url(REDIS_URL, connection_class=CountingConnection)
+    r = redis.Redis(connection_pool=pool)
+    r.ping()
+    return r
+
+
+def legacy_turn(session_id, payload):
+    key = f"chat_session:{session_id}"
+    _legacy_client().get(key)  # print_session_history
+    _legacy_client().get(key)  # get_session_history
+    _legacy_client().setex(key, 3600, payload)  # set_session_history
+    _legacy_client().get(key)  # sync_session_to_mysql 中的再次读取
+
+
+def pooled_turn(manager, session_id):
+    session = manager.get_session_history(session_id)
+    manager.print_session_history(session_id, session)
+    manager.set_session_history(session_id, session[-8:] + [HumanMessage(content='hi'), AIMessage(content='hello')])
+
+
+def _report(name, elapsed):
+    print(f"{name:<8} round trips/turn: {CountingConnection.round_trips / TURNS:5.2f}   "
+          f"connects/turn: {CountingConnection.connects / TURNS:5.2f}   "
+          f"latency/turn: {elapsed / TURNS * 1000:6.2f} ms")
+
+
+def main():
+    app = Flask(__name__)
+    app.config['REDIS_URL'] = REDIS_URL
+    session_id = 'bench-round-trips'
+    history = [HumanMessage(content='hi'), AIMessage(content='hello')] * 4
+
+    with app.app_context():
+        manager = RedisSessionManager()
+        manager._pool = redis.ConnectionPool.from_url(REDIS_URL, connection_class=CountingConnection)
+        manager.set_session_history(session_id, history)
+        payload = json.dumps(manager._serialize_history(history))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            CountingConnection.reset()
+            start = time.perf_counter()
+            for _ in range(TURNS):
+                legacy_turn(session_id, payload)
+            legacy_elapsed = time.perf_counter() - start
+            legacy_stats = (CountingConnection.round_trips, CountingConnection.connects)
+
+            CountingConnection.reset()
+            start = time.perf_counter()
+            for _ in range(TURNS):
+                pooled_turn(manager, session_id)
+            pooled_elapsed = time.perf_counter() - start
+
+        manager.clear_session_history(session_id)
+
+    pooled_stats = (CountingConnection.round_trips, CountingConnection.connects)
+    CountingConnection.round_trips, CountingConnection.connects = legacy_stats
+    _report('before', legacy_elapsed)
+    CountingConnection.round_trips, CountingConnection.connects = pooled_stats
+    _report('after', pooled_elapsed)
+
+
+if __name__ == '__main__':
+    main()
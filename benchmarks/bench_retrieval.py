@@ -0,0 +1,190 @@
+"""
+离线评估文档检索的质量和耗时：只做向量检索（原来的做法）与 BM25、混合检索、混合检索 + MMR 的对比。
+
+测试语料为确定性生成的代码文件（.py / .java 风格），每个方法一个分片，包含方法名和一段中文说明；
+其中部分文件上传了两个版本，用于观察重复分片对结果的影响。查询分两类：
+- identifier：按方法名提问（如 “calculateInvoiceTax 在什么情况下会抛出异常？”）；
+- description：按中文说明提问，不出现方法名。
+每个查询有唯一的目标方法（两个版本的分片都算命中）。
+
+向量使用本地的桩 embedding（字符 n-gram 哈希后随机投影到 DIMENSION 维），不调用外部 API；
+桩模型的语义能力远弱于真实模型，质量指标只用于比较各检索方式的相对差异。
+指标：
+- hit@k：前 k 个结果中包含目标方法的查询比例；
+- MRR：目标方法首次出现位置的倒数的平均值；
+- redundant：结果中与排在前面的结果属于同一方法的分片数（重复内容占用了上下文）的平均值；
+- 各阶段平均耗时（ms）。
+
+用法：
+    python -m benchmarks.bench_retrieval
+"""
+import hashlib
+import os
+import random
+import re
+import tempfile
+import time
+
+import numpy as np
+from flask import Flask
+from langchain_core.embeddings import Embeddings
+
+import models.retriever as retriever_module
+import models.vector_db_manager as vector_db_manager_module
+from models.keyword_index import KeywordIndex
+from models.retriever import HybridRetriever, RETRIEVAL_STAGES
+from models.vector_db_manager import VectorDBManager
+
+FILES = int(os.environ.get('BENCH_FILES', 40))
+METHODS_PER_FILE = int(os.environ.get('BENCH_METHODS_PER_FILE', 12))
+QUERIES = int(os.environ.get('BENCH_QUERIES', 200))
+DIMENSION = int(os.environ.get('BENCH_DIMENSION', 256))
+TOP_K = int(os.environ.get('BENCH_TOP_K', 3))
+FETCH_K = int(os.environ.get('BENCH_FETCH_K', 20))
+SESSION_ID = 'bench-retrieval'
+
+VERBS = [('calculate', '计算'), ('parse', '解析'), ('validate', '校验'), ('load', '加载'), ('sync', '同步'),
+         ('render', '渲染'), ('export', '导出'), ('merge', '合并'), ('resolve', '解析并确定'), ('schedule', '调度')]
+NOUNS = [('Invoice', '发票'), ('Shipping', '运单'), ('Customer', '客户'), ('Ledger', '总账'), ('Coupon', '优惠券'),
+         ('Warehouse', '仓库'), ('Payroll', '工资'), ('Ticket', '工单'), ('Quota', '配额'), ('Contract', '合同')]
+SUFFIXES = [('Tax', '税额'), ('Batch', '批次'), ('Record', '记录'), ('Summary', '汇总'), ('Window', '时间窗口'),
+            ('Status', '状态'), ('Limit', '上限'), ('Report', '报表')]
+QUALIFIERS = ['按月', '按地区', '增量', '全量', '跨币种', '含折扣', '历史', '待审核']
+
+
+class HashingEmbeddings(Embeddings):
+    """字符 n-gram 哈希 + 随机投影的桩 embedding"""
+
+    def __init__(self, dimension: int):
+        self.projection = np.random.default_rng(0).standard_normal((4096, dimension)).astype(np.float32)
+
+    def _embed(self, text: str):
+        counts = np.zeros(4096, dtype=np.float32)
+        text = text.lower()
+        for n in (2, 3):
+            for i in range(len(text) - n + 1):
+                counts[int.from_bytes(hashlib.md5(text[i:i + n].encode('utf-8')).digest()[:4], 'little') % 4096] += 1
+        vector = np.log1p(counts) @ self.projection
+        return (vector / (np.linalg.norm(vector) + 1e-12)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def _corpus():
+    """返回 ([(文件名, [分片])], [(查询, 目标方法名, 类型)])"""
+    rng = random.Random(0)
+    combos = [(verb, noun, suffix) for verb in VERBS for noun in NOUNS for suffix in SUFFIXES]
+    rng.shuffle(combos)
+    methods = []
+    for verb, noun, suffix in combos[:FILES * METHODS_PER_FILE]:
+        name = f'{verb[0]}{noun[0]}{suffix[0]}'
+        qualifier = rng.choice(QUALIFIERS)
+        description = f'{qualifier}{verb[1]}{noun[1]}的{suffix[1]}'
+        methods.append((name, description))
+
+    files = []
+    for index in range(FILES):
+        java = index % 2 == 0
+        chunks = []
+        for name, description in methods[index * METHODS_PER_FILE:(index + 1) * METHODS_PER_FILE]:
+            if java:
+                chunks.append(f'/**\n * {description}，结果写入缓存，失败时记录日志并抛出 ServiceException。\n */\n'
+                              f'public Result {name}(Context ctx, Request request) {{\n'
+                              f'    Result result = repository.query(ctx, request);\n'
+                              f'    if (result == null) {{\n        throw new ServiceException("empty");\n    }}\n'
+                              f'    return cache.put(request.key(), result);\n}}')
+            else:
+                snake = re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+                chunks.append(f'def {snake}(self, ctx, request):\n'
+                              f'    """{description}，结果写入缓存，失败时记录日志并抛出 ServiceError。"""\n'
+                              f'    result = self.repository.query(ctx, request)\n'
+                              f'    if result is None:\n        raise ServiceError("empty")\n'
+                              f'    return self.cache.put(request.key, result)')
+        extension = 'java' if java else 'py'
+        files.append((f'module_{index}.{extension}', chunks))
+        if index % 4 == 0:
+            # 同一文件的第二个版本，内容只有少量差异
+            files.append((f'module_{index}_v2.{extension}',
+                          [chunk.replace('写入缓存', '写入缓存（v2）') for chunk in chunks]))
+
+    queries = []
+    for _ in range(QUERIES):
+        index = rng.randrange(len(methods))
+        name, description = methods[index]
+        if rng.random() < 0.5:
+            identifier = name if index // METHODS_PER_FILE % 2 == 0 else re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+            queries.append((f'{identifier} 在什么情况下会抛出异常？', name, 'identifier'))
+        else:
+            queries.append((f'哪个方法负责{description}？', name, 'description'))
+    return files, queries
+
+
+def _method_of(chunk: str):
+    """分片所属的方法名（Java 风格的方法名或 Python 风格的函数名）"""
+    match = re.search(r'public Result (\w+)\(|def (\w+)\(', chunk)
+    if match is None:
+        return None
+    return match.group(1) or ''.join(part.capitalize() if i else part
+                                     for i, part in enumerate(match.group(2).split('_')))
+
+
+def main():
+    app = Flask(__name__)
+    embeddings = HashingEmbeddings(DIMENSION)
+    vector_db_manager_module.get_embeddings = lambda: embeddings
+    retriever_module.get_embeddings = lambda: embeddings
+    files, queries = _corpus()
+    chunk_count = sum(len(chunks) for _, chunks in files)
+
+    with tempfile.TemporaryDirectory() as tmp, app.app_context():
+        app.logger.disabled = True
+        keyword_index = KeywordIndex(os.path.join(tmp, 'keyword_index.sqlite3'))
+        modes = {
+            'vector': None,
+            'bm25': HybridRetriever(keyword_index, top_k=TOP_K, fetch_k=FETCH_K, vector_weight=0.0, mmr_lambda=1.0),
+            'hybrid': HybridRetriever(keyword_index, top_k=TOP_K, fetch_k=FETCH_K, vector_weight=0.5, mmr_lambda=1.0),
+            'hybrid+mmr': HybridRetriever(keyword_index, top_k=TOP_K, fetch_k=FETCH_K, vector_weight=0.5,
+                                          mmr_lambda=0.7),
+        }
+        writer = VectorDBManager(os.path.join(tmp, 'embedding'), retriever=modes['hybrid'])
+        start = time.perf_counter()
+        for file_name, chunks in files:
+            writer._add_chunks(SESSION_ID, file_name, chunks, embeddings.embed_documents(chunks))
+        index_ms = (time.perf_counter() - start) * 1000
+        print(f"corpus: {len(files)} files, {chunk_count} chunks; {len(queries)} queries; "
+              f"indexing (embeddings precomputed): {index_ms:.0f} ms")
+        print(f"{'mode':<12}{'type':<13}{'hit@' + str(TOP_K):>7}{'MRR':>7}{'redundant':>11}{'avg ms':>9}  stages (ms)")
+
+        for mode, retriever in modes.items():
+            manager = VectorDBManager(os.path.join(tmp, 'embedding'), retriever=retriever)
+            manager.retrieve_chunks(queries[0][0], SESSION_ID)  # 预热（打开 Chroma 句柄）
+            if retriever is not None:
+                retriever._stats.clear()
+            results = {'identifier': [], 'description': []}
+            elapsed = []
+            for query, target, kind in queries:
+                start = time.perf_counter()
+                chunks = manager.retrieve_chunks(query, SESSION_ID)
+                elapsed.append((time.perf_counter() - start) * 1000)
+                found = [_method_of(chunk) for chunk in chunks]
+                rank = found.index(target) + 1 if target in found else None
+                redundant = sum(1 for i, name in enumerate(found) if name is not None and name in found[:i])
+                results[kind].append((rank, redundant))
+            stages = ''
+            if retriever is not None:
+                stats = retriever.get_stats()['avg_stage_ms']
+                stages = ' '.join(f'{stage}={stats[stage]:.2f}' for stage in RETRIEVAL_STAGES if stage in stats)
+            for kind, rows in results.items():
+                hit = sum(1 for rank, _ in rows if rank) / len(rows)
+                mrr = sum(1 / rank for rank, _ in rows if rank) / len(rows)
+                redundant = sum(r for _, r in rows) / len(rows)
+                print(f"{mode:<12}{kind:<13}{hit:>7.2f}{mrr:>7.2f}{redundant:>11.2f}"
+                      f"{sum(elapsed) / len(elapsed):>9.2f}  {stages if kind == 'identifier' else ''}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+对比阻塞接口与流式接口的首 token 时间（TTFT）。
+
+使用本地的假 LLM（按固定间隔逐个输出 token），不依赖外部 API、Redis 和 MySQL：
+- blocking：ChatService.handle_chat 返回完整回答的耗时，即客户端拿到首字节的时间；
+- streaming：ChatService.handle_chat_stream 产出第一个 token 事件的耗时。
+
+用法：
+    python -m benchmarks.bench_stream_ttft
+"""
+import contextlib
+import io
+import os
+import statistics
+import time
+
+from flask import Flask
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+import services.chat_service as chat_service_module
+from services.chat_service import ChatService
+
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', 5))
+TOKENS = int(os.environ.get('BENCH_TOKENS', 200))
+TOKEN_DELAY = float(os.environ.get('BENCH_TOKEN_DELAY', 0.01))
+
+
+class SlowFakeChatModel(GenericFakeChatModel):
+    """按 token_delay 间隔逐个输出 token 的假 LLM"""
+    token_delay: float = 0.01
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _stream(self, *args, **kwargs):
+        for chunk in super()._stream(*args, **kwargs):
+            time.sleep(self.token_delay)
+            yield chunk
+
+
+class InMemorySessionManager:
+    """只保存在内存中的会话管理器，避免测量到 Redis / MySQL 的耗时"""
+
+    def __init__(self):
+        self.sessions = {}
+
+    def get_session_history(self, session_id, default=None):
+        return list(self.sessions.get(session_id, []))
+
+    def print_session_history(self, session_id, history=None):
+        pass
+
+    def save_session_turn(self, session_id, history, new_messages):
+        self.sessions[session_id] = list(history)
+
+
+class NoVectorDB:
+    def get_embeddings_path(self):
+        return os.devnull
+
+
+def _fake_llm():
+    answer = ' '.join(f'token{i}' for i in range(TOKENS))
+    return SlowFakeChatModel(messages=iter(AIMessage(content=answer) for _ in range(2 * ROUNDS + 2)),
+                             token_delay=TOKEN_DELAY)
+
+
+def main():
+    app = Flask(__name__)
+    llm = _fake_llm()
+    chat_service_module.get_llm = lambda: llm
+    service = ChatService(InMemorySessionManager(), NoVectorDB())
+
+    blocking, streaming_first, streaming_total = [], [], []
+    with app.app_context(), contextlib.redirect_stdout(io.StringIO()):
+        for i in range(ROUNDS):
+            start = time.perf_counter()
+            service.handle_chat('hello', 'You are a helpful assistant.', f'blocking-{i}')
+            blocking.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            first = None
+            for event in service.handle_chat_stream('hello', 'You are a helpful assistant.', f'stream-{i}'):
+                if first is None and event['type'] == 'token':
+                    first = time.perf_counter() - start
+            streaming_first.append(first)
+            streaming_total.append(time.perf_counter() - start)
+
+    print(f"tokens={TOKENS} token_delay={TOKEN_DELAY * 1000:.0f}ms rounds={ROUNDS}")
+    print(f"blocking  time to first byte: {statistics.median(blocking) * 1000:8.1f} ms")
+    print(f"streaming time to first token: {statistics.median(streaming_first) * 1000:8.1f} ms "
+          f"(complete: {statistics.median(streaming_total) * 1000:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+对比长文档一次性摘要与分层（map-reduce）摘要。
+
+使用本地的桩 LLM，不调用外部 API：耗时 = 输入 token 数 / PREFILL_TPS + 输出 token 数 / DECODE_TPS，
+输出长度为输入的 10%，最多 MAX_OUTPUT_TOKENS；输入超过 CONTEXT_WINDOW 时与真实接口一样报错。
+文档为 DOC_TOKENS 左右的合成中文文本。依次测量：
+- single：原来的做法，整篇文档一次调用（全文超出上下文窗口，另取前 FIT_TOKENS 左右的部分对比耗时）；
+- map-reduce：DocumentSummarizer，按 SECTION_TOKENS 分段、FAN_OUT 路并发；
+- map-reduce (cached)：同一文档再次摘要，分段摘要全部命中缓存，只需合并；
+- map-reduce (10% failures)：部分分段调用失败时以段落开头代替，整体仍然完成。
+
+用法：
+    python -m benchmarks.bench_summarizer
+"""
+import os
+import random
+import threading
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import utils.summarizer as summarizer_module
+from utils.file_util import get_generate_summary_chain
+from utils.summarizer import DocumentSummarizer
+from utils.token_utils import count_tokens
+
+DOC_TOKENS = int(os.environ.get('BENCH_DOC_TOKENS', 300000))
+SECTION_TOKENS = int(os.environ.get('BENCH_SECTION_TOKENS', 4000))
+FAN_OUT = int(os.environ.get('BENCH_FAN_OUT', 8))
+CONTEXT_WINDOW = int(os.environ.get('BENCH_CONTEXT_WINDOW', 64000))
+PREFILL_TPS = float(os.environ.get('BENCH_PREFILL_TPS', 20000))
+DECODE_TPS = float(os.environ.get('BENCH_DECODE_TPS', 400))
+MAX_OUTPUT_TOKENS = int(os.environ.get('BENCH_MAX_OUTPUT_TOKENS', 2000))
+FIT_TOKENS = int(os.environ.get('BENCH_FIT_TOKENS', 60000))
+
+
+class StubSummaryLLM(BaseChatModel):
+    """按输入输出 token 数模拟耗时的桩 LLM"""
+    failure_rate: float = 0.0
+    calls: int = 0
+    lock: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return 'stub-summary'
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        with self.lock:
+            self.calls += 1
+        text = messages[-1].content
+        input_tokens = sum(count_tokens(m.content) for m in messages)
+        if input_tokens > CONTEXT_WINDOW:
+            raise ValueError(f"This model's maximum context length is {CONTEXT_WINDOW} tokens, "
+                             f"however you requested {input_tokens} tokens")
+        output_chars = min(len(text) // 10, MAX_OUTPUT_TOKENS)
+        time.sleep(input_tokens / PREFILL_TPS + count_tokens(text[:output_chars]) / DECODE_TPS)
+        if random.random() < self.failure_rate:
+            raise TimeoutError('stub upstream timeout')
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text[:output_chars]))])
+
+
+class DictSummaryCache:
+    def __init__(self):
+        self.data = {}
+
+    def get_many(self, keys):
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def set_many(self, items):
+        self.data.update(items)
+
+
+def _document():
+    rng = random.Random(0)
+    topics = ['报销流程', '考勤制度', '信息安全', '采购审批', '绩效考核', '培训发展', '差旅标准', '保密协议']
+    paragraphs, tokens = [], 0
+    while tokens < DOC_TOKENS:
+        topic = rng.choice(topics)
+        paragraph = f"第{len(paragraphs) + 1}条 关于{topic}：" + f"员工在办理{topic}相关事项时应当遵守公司规定，按要求提交材料并留存记录。" * 8
+        paragraphs.append(paragraph)
+        tokens += count_tokens(paragraph)
+    return "\n\n".join(paragraphs)
+
+
+def _run(name, fn, llm):
+    calls = llm.calls
+    start = time.perf_counter()
+    try:
+        summary = fn()
+        result = f"{len(summary):>8} chars"
+    except Exception as e:
+        result = f"  failed: {str(e)[:60]}"
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28}{elapsed:>9.2f}s{llm.calls - calls:>7} calls {result}")
+
+
+def main():
+    text = _document()
+    llm = StubSummaryLLM(lock=threading.Lock())
+    summarizer_module.get_llm = lambda: llm
+    cache = DictSummaryCache()
+    summarizer = DocumentSummarizer(section_tokens=SECTION_TOKENS, fan_out=FAN_OUT, cache=cache)
+
+    print(f"document={count_tokens(text)} tokens, section={SECTION_TOKENS} tokens, fan-out={FAN_OUT}, "
+          f"context window={CONTEXT_WINDOW}")
+    fitting = text[:len(text) * FIT_TOKENS // count_tokens(text)]
+    _run(f'single call (~{FIT_TOKENS // 1000}k tokens)', lambda: get_generate_summary_chain(llm).invoke({'input': fitting}), llm)
+    _run(f'map-reduce (~{FIT_TOKENS // 1000}k tokens)', lambda: DocumentSummarizer(SECTION_TOKENS, FAN_OUT).summarize(fitting), llm)
+    _run('single call', lambda: get_generate_summary_chain(llm).invoke({'input': text}), llm)
+    _run('map-reduce', lambda: summarizer.summarize(text), llm)
+    _run('map-reduce (cached)', lambda: summarizer.summarize(text), llm)
+    llm.failure_rate = 0.1
+    _run('map-reduce (10% failures)', lambda: DocumentSummarizer(SECTION_TOKENS, FAN_OUT).summarize(text), llm)
+
+
+if __name__ == '__main__':
+    main()
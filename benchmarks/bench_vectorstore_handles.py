@@ -0,0 +1,75 @@
+"""
+测量会话向量库句柄缓存对查询耗时的影响。
+
+在临时目录中为 SESSIONS 个会话各写入 CHUNKS 个文本块（使用确定性的假 Embedding，不调用外部 API），
+然后对同一批会话重复查询：
+- uncached：每次查询都新建 Chroma(persist_directory=...)，并在查询后关闭（缓存前的行为，
+  chromadb 按目录共享的 System 也一并释放，每次都要重新打开 SQLite 和 HNSW 索引）；
+- cached：通过 VectorDBManager.query_vectorstore 查询，复用缓存中的句柄。
+
+用法：
+    python -m benchmarks.bench_vectorstore_handles
+"""
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from flask import Flask
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import models.vector_db_manager as vector_db_manager_module
+from models.vector_db_manager import VectorDBManager
+from models.vectorstore_cache import VectorStoreCache
+
+SESSIONS = int(os.environ.get('BENCH_SESSIONS', 8))
+CHUNKS = int(os.environ.get('BENCH_CHUNKS', 200))
+QUERIES = int(os.environ.get('BENCH_QUERIES', 20))
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    app = Flask(__name__)
+    embeddings = DeterministicFakeEmbedding(size=256)
+    vector_db_manager_module.get_embeddings = lambda: embeddings
+    root = tempfile.mkdtemp(prefix='bench_vectorstore_')
+    manager = VectorDBManager(root)
+
+    try:
+        with app.app_context():
+            for i in range(SESSIONS):
+                with manager.handle_cache.open(os.path.join(root, f's{i}'), embeddings) as db:
+                    db.add_texts([f'session {i} chunk {j} ' * 20 for j in range(CHUNKS)])
+            manager.handle_cache = VectorStoreCache(max_handles=SESSIONS)
+            for i in range(SESSIONS):
+                VectorStoreCache._stop_system(os.path.join(root, f's{i}'))
+
+            def uncached_query(session_id):
+                persist_dir = os.path.join(root, session_id)
+                db = Chroma(persist_directory=persist_dir, embedding_function=embeddings)
+                db.similarity_search('chunk', k=3)
+                VectorStoreCache._stop_system(persist_dir)
+
+            uncached = [_timed(lambda: uncached_query(f's{n % SESSIONS}')) for n in range(QUERIES)]
+            cached = [_timed(lambda: manager.query_vectorstore('chunk', f's{n % SESSIONS}')) for n in range(QUERIES)]
+            stats = manager.get_cache_stats()
+    finally:
+        for i in range(SESSIONS):
+            manager.handle_cache.close(os.path.join(root, f's{i}'))
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"sessions={SESSIONS} chunks/session={CHUNKS} queries={QUERIES}")
+    print(f"uncached query: p50 {statistics.median(uncached):8.2f} ms")
+    print(f"cached query:   p50 {statistics.median(cached):8.2f} ms  (first pass opens each handle once)")
+    print(f"cache stats: {stats}")
+
+
+if __name__ == '__main__':
+    main()
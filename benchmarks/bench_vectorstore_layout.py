@@ -0,0 +1,134 @@
+"""
+对比两种向量库存储布局在大量会话下的查询延迟和磁盘占用。
+
+- directory：每个会话一个 Chroma 数据库（EMBEDDINGS_PATH/<session_id>）；
+- shared：所有会话写入 VECTOR_DB_SHARDS 个分片集合，按 session_id 元数据过滤。
+每个会话写入 CHUNKS 个文本块（确定性的假 Embedding，不调用外部 API），
+随后随机抽取会话，通过 VectorDBManager.query_vectorstore 查询（directory 布局下句柄缓存大小为 CACHE_HANDLES，
+会话数远大于缓存时大部分查询需要重新打开数据库），并统计清理单个会话的耗时。
+
+会话数较多时 directory 布局的写入耗时很长，可用 BENCH_SESSIONS 调小。
+
+用法：
+    python -m benchmarks.bench_vectorstore_layout
+"""
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import chromadb
+from flask import Flask
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import models.vector_db_manager as vector_db_manager_module
+from models.vector_db_manager import VectorDBManager
+from models.vectorstore_cache import VectorStoreCache
+
+SESSIONS = int(os.environ.get('BENCH_SESSIONS', 10000))
+CHUNKS = int(os.environ.get('BENCH_CHUNKS', 5))
+SHARDS = int(os.environ.get('BENCH_SHARDS', 8))
+CACHE_HANDLES = int(os.environ.get('BENCH_CACHE_HANDLES', 32))
+QUERIES = int(os.environ.get('BENCH_QUERIES', 200))
+CLEARS = int(os.environ.get('BENCH_CLEARS', 20))
+DIM = 256
+
+
+def _disk_usage(path):
+    total, files = 0, 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            total += os.path.getsize(os.path.join(root, name))
+            files += 1
+    return total, files
+
+
+def _texts(session_index):
+    return [f'session {session_index} chunk {j} ' * 20 for j in range(CHUNKS)]
+
+
+def _populate_directory(root, embeddings):
+    """直接用 chromadb 客户端批量写入，写完即释放，模拟已有的大量会话目录"""
+    for i in range(SESSIONS):
+        persist_dir = os.path.join(root, f'session-{i}')
+        client = chromadb.PersistentClient(path=persist_dir)
+        texts = _texts(i)
+        client.get_or_create_collection('langchain').add(
+            ids=[f'{i}-{j}' for j in range(CHUNKS)], documents=texts,
+            embeddings=embeddings.embed_documents(texts),
+            metadatas=[{'session_id': f'session-{i}'}] * CHUNKS)
+        VectorStoreCache._stop_system(persist_dir)
+
+
+def _populate_shared(manager, embeddings):
+    batches = {}
+    for i in range(SESSIONS):
+        batches.setdefault(manager._shard_of(f'session-{i}'), []).append(i)
+    for shard_sessions in batches.values():
+        shard = manager._get_shard(f'session-{shard_sessions[0]}')
+        for start in range(0, len(shard_sessions), 500):
+            ids, texts, metadatas = [], [], []
+            for i in shard_sessions[start:start + 500]:
+                ids += [f'{i}-{j}' for j in range(CHUNKS)]
+                texts += _texts(i)
+                metadatas += [{'session_id': f'session-{i}'}] * CHUNKS
+            shard._collection.add(ids=ids, documents=texts, metadatas=metadatas,
+                                  embeddings=embeddings.embed_documents(texts))
+
+
+def _measure(manager):
+    rng = random.Random(0)
+    samples = []
+    for _ in range(QUERIES):
+        session_id = f'session-{rng.randrange(SESSIONS)}'
+        start = time.perf_counter()
+        manager.query_vectorstore('chunk', session_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+
+    clears = []
+    for i in range(CLEARS):
+        start = time.perf_counter()
+        manager.clear_vector_db(f'session-{SESSIONS - 1 - i}')
+        clears.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), samples[int(len(samples) * 0.95)], statistics.median(clears)
+
+
+def main():
+    app = Flask(__name__)
+    embeddings = DeterministicFakeEmbedding(size=DIM)
+    vector_db_manager_module.get_embeddings = lambda: embeddings
+    results = []
+
+    with app.app_context():
+        for layout in ('directory', 'shared'):
+            root = tempfile.mkdtemp(prefix=f'bench_layout_{layout}_')
+            try:
+                manager = VectorDBManager(root, max_open_handles=CACHE_HANDLES, layout=layout, shards=SHARDS)
+                start = time.perf_counter()
+                if layout == 'directory':
+                    _populate_directory(root, embeddings)
+                else:
+                    _populate_shared(manager, embeddings)
+                populate_s = time.perf_counter() - start
+                size, files = _disk_usage(root)
+                p50, p95, clear_ms = _measure(manager)
+                results.append((layout, populate_s, size, files, p50, p95, clear_ms))
+            finally:
+                for persist_dir in list(manager.handle_cache._handles):
+                    manager.handle_cache.close(persist_dir)
+                VectorStoreCache._stop_system(os.path.join(root, vector_db_manager_module.SHARED_DIR_NAME))
+                shutil.rmtree(root, ignore_errors=True)
+
+    print(f"sessions={SESSIONS} chunks/session={CHUNKS} shards={SHARDS} cached handles={CACHE_HANDLES}")
+    print(f"{'layout':<10}{'populate (s)':>14}{'disk (MB)':>11}{'files':>9}"
+          f"{'query p50':>11}{'query p95':>11}{'clear p50':>11}")
+    for layout, populate_s, size, files, p50, p95, clear_ms in results:
+        print(f"{layout:<10}{populate_s:>14.1f}{size / 1024 / 1024:>11.1f}{files:>9}"
+              f"{p50:>9.2f}ms{p95:>9.2f}ms{clear_ms:>9.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+测量联网搜索结果缓存（WebResultCache）对 Tavily 请求数和工具耗时的影响。
+
+本地起一个假 Tavily 服务（/search、/crawl），每次请求固定延迟 TAVILY_LATENCY 秒，不调用外部 API。
+模拟 USERS 个用户并发调用 web_search，每人 QUERIES_PER_USER 次，问题按 Zipf 分布从 POPULAR 个热门问题中抽取，
+约三成只在大小写、空白或末尾标点上不同。分别在不使用缓存和使用缓存时统计发往 Tavily 的请求数和平均耗时。
+随后测量请求合并：
+- 同一进程内 BURST 个线程同时搜索同一个新问题；
+- 两个缓存实例（模拟两个 worker 进程，共用同一个 Redis）同时搜索同一个新问题；
+- 异步模式下 BURST 个协程同时搜索同一个新问题。
+
+用法（需要一个可写的 Redis，建议使用单独的 db）：
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.bench_web_cache
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import redis
+
+import utils.web_utils as web_utils
+from utils.web_cache import WebResultCache
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/15')
+TAVILY_LATENCY = float(os.environ.get('TAVILY_LATENCY', 0.3))
+USERS = int(os.environ.get('BENCH_USERS', 16))
+QUERIES_PER_USER = int(os.environ.get('BENCH_QUERIES_PER_USER', 20))
+POPULAR = int(os.environ.get('BENCH_POPULAR', 40))
+BURST = int(os.environ.get('BENCH_BURST', 20))
+
+TOPICS = ['今天的天气', '美元兑人民币汇率', '最新的 Python 版本', '春节放假安排', '世界杯赛程', '黄金价格',
+          '高铁票什么时候开售', '个税起征点', '新能源车补贴', '考研报名时间']
+
+
+class FakeTavily(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeTavilyHandler)
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+
+class FakeTavilyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.server.lock:
+            self.server.requests[self.path] += 1
+        time.sleep(TAVILY_LATENCY)
+        if self.path == '/search':
+            body = {'query': payload['query'], 'answer': f"关于「{payload['query']}」的回答", 'results': []}
+        else:
+            body = {'base_url': payload['url'], 'results': [{'title': '页面', 'content': '页面内容'}]}
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _workload(popular: list, rng: random.Random):
+    weights = [1 / (rank + 1) for rank in range(len(popular))]
+    for _ in range(QUERIES_PER_USER):
+        query = rng.choices(popular, weights)[0]
+        if rng.random() < 0.3:
+            query = rng.choice([query.upper(), f'  {query}？', query + '?'])
+        yield query
+
+
+def _cache(client: redis.Redis):
+    return WebResultCache(lambda: client, ttls={'search': 600, 'crawl': 600}, poll_interval=0.05)
+
+
+def _clear(client: redis.Redis):
+    for key in client.scan_iter('web_cache*'):
+        client.delete(key)
+
+
+def main():
+    server = FakeTavily()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['TAVILY_API_KEY'] = 'bench'
+    os.environ['TAVILY_BASE_URL'] = f'http://127.0.0.1:{server.server_address[1]}'
+    client = redis.Redis.from_url(REDIS_URL)
+    search = web_utils.web_search.func
+
+    rng = random.Random(0)
+    popular = [f'{rng.choice(TOPICS)} {i}' for i in range(POPULAR)]
+    workloads = [list(_workload(popular, random.Random(user))) for user in range(USERS)]
+    total = sum(len(queries) for queries in workloads)
+
+    print(f"{USERS} users x {QUERIES_PER_USER} searches over {POPULAR} popular questions, "
+          f"Tavily latency {TAVILY_LATENCY * 1000:.0f} ms")
+    print(f"{'mode':<10}{'Tavily calls':>14}{'avg ms':>9}{'p95 ms':>9}")
+    for mode in ('no cache', 'cache'):
+        _clear(client)
+        web_utils.set_web_cache(_cache(client) if mode == 'cache' else None)
+        server.requests.clear()
+
+        def run(queries):
+            elapsed = []
+            for query in queries:
+                start = time.perf_counter()
+                search(query)
+                elapsed.append((time.perf_counter() - start) * 1000)
+            return elapsed
+
+        with ThreadPoolExecutor(USERS) as executor:
+            elapsed = sorted(ms for user in executor.map(run, workloads) for ms in user)
+        print(f"{mode:<10}{server.requests['/search']:>14}{sum(elapsed) / total:>9.1f}"
+              f"{elapsed[int(len(elapsed) * 0.95)]:>9.1f}")
+        if mode == 'cache':
+            print(f"cache stats: {web_utils.get_web_cache_stats()}")
+
+    print(f"\nburst of {BURST} identical new searches")
+    _clear(client)
+    server.requests.clear()
+    cache = _cache(client)
+    web_utils.set_web_cache(cache)
+    with ThreadPoolExecutor(BURST) as executor:
+        list(executor.map(search, ['一个新问题'] * BURST))
+    print(f"one worker, threads:   Tavily calls {server.requests['/search']}, stats {cache.get_stats()}")
+
+    server.requests.clear()
+    workers = [_cache(client), _cache(client)]
+
+    def search_on(index):
+        return workers[index % 2].get_or_fetch(
+            'search:second', lambda: web_utils.get_tavily_client().search('另一个新问题'))
+
+    with ThreadPoolExecutor(BURST) as executor:
+        list(executor.map(search_on, range(BURST)))
+    print(f"two workers, threads:  Tavily calls {server.requests['/search']}, "
+          f"stats {[worker.get_stats() for worker in workers]}")
+
+    server.requests.clear()
+    cache = _cache(client)
+    web_utils.set_web_cache(cache)
+
+    async def burst():
+        await asyncio.gather(*[web_utils.web_search.coroutine('第三个新问题') for _ in range(BURST)])
+
+    asyncio.run(burst())
+    print(f"one worker, asyncio:   Tavily calls {server.requests['/search']}, stats {cache.get_stats()}")
+    _clear(client)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
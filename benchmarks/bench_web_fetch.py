@@ -0,0 +1,199 @@
+"""
+测量网页抓取工具 fetch_url_content 的连接复用、条件请求和解析耗时。
+
+本地起一个 HTTP/1.1 测试服务器，提供 PAGES 个约 PAGE_KB KB 的中文网页（含导航、脚本、侧边栏等无关元素），
+每个网页带 ETag，请求带 If-None-Match 且网页未变化时返回 304；每建立一个新连接等待 CONNECT_LATENCY 秒，
+模拟 TCP/TLS 握手的往返时间。另有一个 OVERSIZED_MB MB 的超大网页。
+
+工作负载为 REQUESTS 次抓取，其中约 REPEAT_RATIO 是之前抓取过的网页（网页内容不变）。对比：
+- baseline：原来的实现，每次 requests.get，apparent_encoding 推测编码，BeautifulSoup(html.parser) 解析；
+- pooled：共享连接池 + 条件请求缓存 + lxml 解析。
+统计新建连接数、传输的响应体字节数、平均耗时，并单独测量两种解析方式解析同一网页的耗时，
+核对两种实现提取的文本一致；最后抓取超大网页，观察读取的字节数被限制在 WEB_FETCH_MAX_BYTES 以内。
+
+用法：
+    python -m benchmarks.bench_web_fetch
+"""
+import contextlib
+import hashlib
+import io
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from bs4 import BeautifulSoup
+
+import utils.web_utils as web_utils
+from utils.http_fetch import PageFetcher
+from utils.web_utils import CONTENT_SELECTORS, DEFAULT_HEADERS, UNWANTED_SELECTORS, _extract_content
+
+PAGES = int(os.environ.get('BENCH_PAGES', 20))
+PAGE_KB = int(os.environ.get('BENCH_PAGE_KB', 200))
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', 100))
+REPEAT_RATIO = float(os.environ.get('BENCH_REPEAT_RATIO', 0.5))
+CONNECT_LATENCY = float(os.environ.get('BENCH_CONNECT_LATENCY', 0.03))
+OVERSIZED_MB = int(os.environ.get('BENCH_OVERSIZED_MB', 20))
+MAX_BYTES = 2 * 1024 * 1024
+
+SENTENCES = ['连接池按主机复用已经建立的连接，省去重复的握手。', '条件请求在网页没有变化时只返回响应头。',
+             'lxml 在 C 语言中构建文档树，解析速度远快于纯 Python 的解析器。', '响应体按块读取，超过上限后立即断开连接。']
+
+
+def _page(index: int) -> bytes:
+    rng = random.Random(index)
+    paragraphs = []
+    while sum(len(p) for p in paragraphs) * 3 < PAGE_KB * 1024:
+        paragraphs.append(f'<p class="text">第 {index} 页：' + ''.join(rng.choice(SENTENCES) for _ in range(8))
+                          + f'<span>注释 {len(paragraphs)}</span><!-- 备注 --></p>')
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>页面 {index}</title>'
+            f'<style>p {{ color: #333; }}</style><script>var page = {index};</script></head><body>'
+            f'<nav><a href="/">首页</a><a href="/about">关于</a></nav>'
+            f'<div class="sidebar">相关链接</div><div class="advertisement">广告</div>'
+            f'<article><h1>页面 {index}</h1>{"".join(paragraphs)}</article>'
+            f'<div id="footer">版权所有</div></body></html>').encode('utf-8')
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FixtureHandler)
+        self.pages = {f'/page/{i}': _page(i) for i in range(PAGES)}
+        paragraph = f'<p>{"".join(SENTENCES) * 20}</p>'.encode('utf-8')
+        self.pages['/oversized'] = (b'<html><body><article>'
+                                    + paragraph * (OVERSIZED_MB * 1024 * 1024 // len(paragraph)))
+        self.etags = {path: hashlib.md5(body).hexdigest() for path, body in self.pages.items()}
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, key: str, value: int = 1):
+        with self.lock:
+            self.stats[key] += value
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+        time.sleep(CONNECT_LATENCY)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = self.server.pages.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        etag = f'"{self.server.etags[self.path]}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.server.count('not_modified')
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+            self.server.count('body_bytes', len(body))
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.count('aborted')
+
+
+def baseline_fetch(url: str):
+    """原来的 fetch_url_content：每次新建连接，apparent_encoding 推测编码，html.parser 解析"""
+    response = requests.get(url, headers=DEFAULT_HEADERS, timeout=10)
+    response.raise_for_status()
+    response.encoding = response.apparent_encoding
+    return _soup_extract(response.text)
+
+
+def _soup_extract(html: str):
+    soup = BeautifulSoup(html, 'html.parser')
+    for selector in UNWANTED_SELECTORS:
+        for tag in soup.select(selector):
+            tag.decompose()
+    for selector in CONTENT_SELECTORS:
+        elements = soup.select(selector)
+        if elements:
+            return [text for text in (element.get_text(strip=True) for element in elements) if text]
+    return []
+
+
+def _workload(base: str):
+    rng = random.Random(2)
+    fetched = []
+    for _ in range(REQUESTS):
+        if fetched and rng.random() < REPEAT_RATIO:
+            yield rng.choice(fetched)
+        else:
+            url = f'{base}/page/{rng.randrange(PAGES)}'
+            fetched.append(url)
+            yield url
+
+
+def _quiet(function):
+    """屏蔽工具函数中的 print 输出"""
+    def run(*args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function(*args)
+    return run
+
+
+def main():
+    server = FixtureServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    workload = list(_workload(base))
+    web_utils._page_fetcher = PageFetcher(max_bytes=MAX_BYTES, headers=DEFAULT_HEADERS)
+    pooled_fetch = _quiet(web_utils.fetch_url_content.func)
+
+    print(f"{PAGES} pages of ~{PAGE_KB} KB, {len(workload)} requests, repeat ratio {REPEAT_RATIO}, "
+          f"connect latency {CONNECT_LATENCY * 1000:.0f} ms")
+    print(f"{'mode':<10}{'connections':>13}{'304s':>7}{'body MB':>9}{'avg ms':>9}")
+    outputs = {}
+    for mode, fetch in (('baseline', baseline_fetch), ('pooled', pooled_fetch)):
+        server.stats.clear()
+        start = time.perf_counter()
+        outputs[mode] = [fetch(url) for url in workload]
+        elapsed = (time.perf_counter() - start) * 1000 / len(workload)
+        print(f"{mode:<10}{server.stats['connections']:>13}{server.stats['not_modified']:>7}"
+              f"{server.stats['body_bytes'] / 1024 / 1024:>9.1f}{elapsed:>9.1f}")
+    mismatched = sum(1 for a, b in zip(outputs['baseline'], outputs['pooled']) if a != b)
+    print(f"extracted text differing between implementations: {mismatched} of {len(workload)}")
+
+    page = server.pages['/page/0']
+    for name, parse in (('html.parser + BeautifulSoup', lambda: _soup_extract(page.decode('utf-8'))),
+                        ('lxml streaming target', _quiet(lambda: _extract_content(page, 'page/0', None)))):
+        start = time.perf_counter()
+        for _ in range(10):
+            parse()
+        print(f"parse {len(page) // 1024} KB page, {name:<28}{(time.perf_counter() - start) * 100:>8.1f} ms")
+
+    start = time.perf_counter()
+    texts = baseline_fetch(f'{base}/oversized')
+    print(f"oversized page ({OVERSIZED_MB} MB), baseline: {sum(len(t) for t in texts) // 1024} KB of text "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+    read_before = web_utils._page_fetcher.get_stats()['bytes']
+    start = time.perf_counter()
+    texts = pooled_fetch(f'{base}/oversized')
+    read = web_utils._page_fetcher.get_stats()['bytes'] - read_before
+    print(f"oversized page ({OVERSIZED_MB} MB), pooled: read {read / 1024 / 1024:.1f} MB, "
+          f"{sum(len(t) for t in texts) // 1024} KB of text in {(time.perf_counter() - start) * 1000:.0f} ms")
+    print(f"fetcher stats: {web_utils._page_fetcher.get_stats()}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
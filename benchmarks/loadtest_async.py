@@ -0,0 +1,185 @@
+"""
+异步服务模式与线程模式的并发压测。
+
+在本地启动两个桩服务，不调用外部 API：
+- 假 LLM：OpenAI 兼容的 /chat/completions（流式），每次调用固定延迟 LLM_LATENCY 秒，
+  第一轮先让智能体调用一次 web_search，拿到工具结果后再给出最终回答；
+- 假 Tavily：/search 固定延迟 TAVILY_LATENCY 秒后返回答案。
+随后分别以两种方式启动应用并在不同并发下发送 /api/v1/chat 请求：
+- threaded：Flask(WSGI) 线程模式，最多 WORKER_THREADS 个请求同时处理（相当于 gunicorn --threads）；
+- async：asgi.py + uvicorn 单 worker。
+
+会话存储仍使用真实的 Redis（REDIS_URL）；write-behind 刷盘间隔设为很长，压测期间不写 MySQL，
+MySQL 不可用时新会话的加载会直接失败并按空历史处理，相关错误日志被屏蔽。
+
+用法：
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.loadtest_async
+"""
+import asyncio
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/15')
+LLM_LATENCY = float(os.environ.get('LLM_LATENCY', 0.5))
+TAVILY_LATENCY = float(os.environ.get('TAVILY_LATENCY', 0.3))
+WORKER_THREADS = int(os.environ.get('WORKER_THREADS', 8))
+CONCURRENCY_LEVELS = [int(c) for c in os.environ.get('CONCURRENCY', '10,50,200').split(',')]
+
+STUB_LLM_PORT = 18001
+STUB_TAVILY_PORT = 18002
+THREADED_PORT = 18010
+ASYNC_PORT = 18011
+
+
+def _sse_chunk(delta, finish_reason=None):
+    chunk = {
+        'id': 'chatcmpl-stub', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'stub',
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n".encode()
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容的假 LLM：没有工具结果时先调用 web_search，否则直接回答"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(LLM_LATENCY)
+
+        has_tool_result = any(m.get('role') == 'tool' for m in body.get('messages', []))
+        if has_tool_result or not body.get('tools'):
+            chunks = [_sse_chunk({'role': 'assistant', 'content': 'stub answer'}), _sse_chunk({}, 'stop')]
+        else:
+            tool_call = {'index': 0, 'id': f'call_{uuid.uuid4().hex[:8]}', 'type': 'function',
+                         'function': {'name': 'web_search', 'arguments': json.dumps({'query': 'stub'})}}
+            chunks = [_sse_chunk({'role': 'assistant', 'content': None, 'tool_calls': [tool_call]}),
+                      _sse_chunk({}, 'tool_calls')]
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+class StubTavilyHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(TAVILY_LATENCY)
+        body = json.dumps({'answer': 'stub search answer', 'results': []}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_stub(handler, port):
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _configure_environment():
+    os.environ.setdefault('LLM_API_KEY', 'stub')
+    os.environ['TAVILY_API_KEY'] = 'stub'
+    os.environ['TAVILY_BASE_URL'] = f'http://127.0.0.1:{STUB_TAVILY_PORT}'
+    os.environ['SESSION_WRITE_BEHIND'] = 'true'
+    os.environ['SESSION_FLUSH_INTERVAL'] = '3600'
+    os.environ['SESSION_FLUSH_BATCH_SIZE'] = '1000000'
+    logging.disable(logging.ERROR)
+
+
+def _configure_app(flask_app):
+    flask_app.config['LLM_BASE_URL'] = f'http://127.0.0.1:{STUB_LLM_PORT}'
+    flask_app.config['LLM_MODEL_NAME'] = 'stub'
+    flask_app.config['REDIS_URL'] = REDIS_URL
+    flask_app.config['EMBEDDINGS_PATH'] = os.path.join(os.path.dirname(__file__), '.loadtest_embeddings')
+
+
+def _start_threaded_server():
+    """Flask 线程模式，并发处理数限制为 WORKER_THREADS"""
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    flask_app = create_app()
+    _configure_app(flask_app)
+    slots = threading.BoundedSemaphore(WORKER_THREADS)
+
+    def limited_app(environ, start_response):
+        with slots:
+            return list(flask_app(environ, start_response))
+
+    server = make_server('127.0.0.1', THREADED_PORT, limited_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _start_async_server():
+    import uvicorn
+    import asgi
+
+    _configure_app(asgi.flask_app)
+    config = uvicorn.Config(asgi.app, host='127.0.0.1', port=ASYNC_PORT, log_level='warning', lifespan='off')
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def _run_level(port, concurrency):
+    url = f'http://127.0.0.1:{port}/api/v1/chat'
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        async def one_request():
+            start = time.perf_counter()
+            response = await client.post(url, json={'message': 'hello', 'session_id': f'load-{uuid.uuid4().hex}'})
+            return time.perf_counter() - start, response.status_code == 200
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one_request() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return concurrency / elapsed, statistics.median(latencies), p95, errors
+
+
+def main():
+    _configure_environment()
+    _start_stub(StubLLMHandler, STUB_LLM_PORT)
+    _start_stub(StubTavilyHandler, STUB_TAVILY_PORT)
+    threaded_server = _start_threaded_server()
+    async_server = _start_async_server()
+
+    print(f"LLM latency {LLM_LATENCY}s x2, Tavily latency {TAVILY_LATENCY}s, threaded workers {WORKER_THREADS}")
+    print(f"{'mode':<10}{'concurrency':>12}{'req/s':>10}{'p50 (s)':>10}{'p95 (s)':>10}{'errors':>8}")
+    for mode, port in (('threaded', THREADED_PORT), ('async', ASYNC_PORT)):
+        for concurrency in CONCURRENCY_LEVELS:
+            throughput, p50, p95, errors = asyncio.run(_run_level(port, concurrency))
+            print(f"{mode:<10}{concurrency:>12}{throughput:>10.1f}{p50:>10.2f}{p95:>10.2f}{errors:>8}")
+
+    threaded_server.shutdown()
+    async_server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
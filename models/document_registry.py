@@ -0,0 +1,146 @@
+# models/document_registry.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentRegistry:
+    """
+    已处理文档的登记表，保存在本地 SQLite 中，键为上传文件内容的 sha256，并记录计算向量时使用的 embedding 模型。
+    每份文档保存摘要、分片文本和分片向量（流式处理的文档不保留整篇原文）；同一文件再次上传到任意会话时直接复用，
+    不再重复解析、生成摘要和计算 embedding；embedding 模型变化后登记的向量不再复用，重新处理后替换原记录。
+    每个引用该文档的会话记一次引用，会话清理时释放引用，引用数归零的文档随之删除。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                file_hash TEXT PRIMARY KEY,
+                file_name TEXT NOT NULL,
+                content TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                chunks TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                vectors BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                embedding_model TEXT NOT NULL DEFAULT ''
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if 'embedding_model' not in columns:
+            # 旧版本创建的登记表没有记录模型，这些文档在下次上传时重新处理
+            self._conn.execute("ALTER TABLE documents ADD COLUMN embedding_model TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS document_refs (
+                file_hash TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                PRIMARY KEY (file_hash, session_id)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_document_refs_session ON document_refs (session_id)")
+
+    def get(self, file_hash: str, embedding_model: str):
+        """
+        返回登记的文档 {file_name, content, summary, chunks, vectors}；
+        不存在或向量由其他 embedding 模型计算时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_name, content, summary, chunks, dimension, vectors, embedding_model "
+                "FROM documents WHERE file_hash = ?", (file_hash,)).fetchone()
+            if row is not None and row[6] != embedding_model:
+                self.stats['model_mismatches'] += 1
+                row = None
+            self.stats['hits' if row else 'misses'] += 1
+        if row is None:
+            return None
+        file_name, content, summary, chunks, dimension, blob, _ = row
+        flat = array('f')
+        flat.frombytes(blob)
+        vectors = [flat[i:i + dimension].tolist() for i in range(0, len(flat), dimension)]
+        return {'file_name': file_name, 'content': content, 'summary': summary,
+                'chunks': json.loads(chunks), 'vectors': vectors}
+
+    def put(self, file_hash: str, file_name: str, content: str, summary: str, chunks: list, vectors: list,
+            embedding_model: str):
+        """登记一份处理完成的文档（已存在同一模型的记录时保留原有记录，其他模型的记录被替换）"""
+        dimension = len(vectors[0]) if vectors else 0
+        flat = array('f')
+        for vector in vectors:
+            flat.extend(vector)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO documents "
+                "(file_hash, file_name, content, summary, chunks, dimension, vectors, created_at, embedding_model) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (file_hash) DO UPDATE SET file_name = excluded.file_name, content = excluded.content, "
+                "summary = excluded.summary, chunks = excluded.chunks, dimension = excluded.dimension, "
+                "vectors = excluded.vectors, created_at = excluded.created_at, "
+                "embedding_model = excluded.embedding_model "
+                "WHERE documents.embedding_model != excluded.embedding_model",
+                (file_hash, file_name, content, summary, json.dumps(chunks, ensure_ascii=False),
+                 dimension, flat.tobytes(), time.time(), embedding_model))
+
+    def add_ref(self, file_hash: str, session_id: str) -> bool:
+        """记录 session_id 引用了该文档；会话此前已引用过时返回 False"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO document_refs (file_hash, session_id) VALUES (?, ?)", (file_hash, session_id))
+            return cursor.rowcount > 0
+
+    def has_ref(self, file_hash: str, session_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM document_refs WHERE file_hash = ? AND session_id = ?",
+                (file_hash, session_id)).fetchone() is not None
+
+    def release_session(self, session_id: str):
+        """释放会话持有的所有引用，并删除不再被任何会话引用的文档"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                hashes = [row[0] for row in self._conn.execute(
+                    "SELECT file_hash FROM document_refs WHERE session_id = ?", (session_id,))]
+                self._conn.execute("DELETE FROM document_refs WHERE session_id = ?", (session_id,))
+                removed = 0
+                for file_hash in hashes:
+                    removed += self._conn.execute(
+                        "DELETE FROM documents WHERE file_hash = ? AND NOT EXISTS "
+                        "(SELECT 1 FROM document_refs WHERE file_hash = ?)", (file_hash, file_hash)).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.stats['released_documents'] += removed
+        if removed:
+            logger.info(f"Removed {removed} unreferenced documents after clearing session {session_id}")
+
+    def get_stats(self):
+        with self._lock:
+            documents, refs = self._conn.execute(
+                "SELECT (SELECT COUNT(*) FROM documents), (SELECT COUNT(*) FROM document_refs)").fetchone()
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'documents': documents,
+                'refs': refs,
+                'hits': self.stats['hits'],
+                'misses': self.stats['misses'],
+                'released_documents': self.stats['released_documents'],
+                'model_mismatches': self.stats['model_mismatches'],
+                'hit_rate': round(self.stats['hits'] / lookups, 4) if lookups else None,
+            }
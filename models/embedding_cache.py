@@ -0,0 +1,167 @@
+# models/embedding_cache.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# 单条 SQL 中 IN (...) 参数的最大个数，低于 SQLite 默认的变量数限制
+_SQL_BATCH = 500
+
+
+class EmbeddingCache:
+    """
+    持久化的文本块 embedding 缓存，保存在本地 SQLite 中，键为 sha256(模型名, 文本)。
+    向量以 float32 存储；总大小超过 max_bytes 时按最近使用时间淘汰到 90% 以下。
+    同一台机器上的多个 worker 进程可以共用同一个缓存文件。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1024 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: list) -> dict:
+        """批量查询，返回命中的 {key: 向量}，并刷新命中条目的最近使用时间"""
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall()
+                for key, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+                if rows:
+                    hit_keys = [row[0] for row in rows]
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(hit_keys))})",
+                        [time.time(), *hit_keys])
+            self.stats['hits'] += len(found)
+            self.stats['misses'] += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict):
+        """批量写入 {key: 向量}，写入后按需淘汰"""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = array('f', vector).tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._bytes += sum(row[2] for row in rows)
+            self.stats['writes'] += len(rows)
+            if self._bytes > self.max_bytes:
+                self._evict_locked()
+
+    def _evict_locked(self):
+        # 其他进程也可能写入了同一个文件，淘汰前以数据库中的实际大小为准
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        if self._bytes <= target:
+            return
+        to_free = self._bytes - target
+        freed, keys = 0, []
+        for key, size in self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used"):
+            keys.append(key)
+            freed += size
+            if freed >= to_free:
+                break
+        self._conn.execute("BEGIN")
+        try:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                self._conn.execute(f"DELETE FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._bytes -= freed
+        self.stats['evictions'] += len(keys)
+        logger.info(f"Evicted {len(keys)} cached embeddings ({freed / 1024 / 1024:.1f} MB)")
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'path': self.path,
+                'size_mb': round(self._bytes / 1024 / 1024, 2),
+                'max_mb': round(self.max_bytes / 1024 / 1024, 2),
+                'hits': self.stats['hits'],
+                'misses': self.stats['misses'],
+                'writes': self.stats['writes'],
+                'evictions': self.stats['evictions'],
+                'hit_rate': round(self.stats['hits'] / lookups, 4) if lookups else None,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    在 embedding 模型外包一层缓存：embed_documents 先批量查缓存，只把未命中的文本（去重后）
+    一次性交给底层模型，结果再批量写回。查询向量不缓存，直接交给底层模型。
+    """
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            embedded = self.underlying.embed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), embedded))
+            self.cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> list:
+        return self.underlying.embed_query(text)
@@ -0,0 +1,137 @@
+# models/embedding_executor.py
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from langchain_community.embeddings.dashscope import BATCH_SIZE as DASHSCOPE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def is_throttled(error: Exception) -> bool:
+    """embedding 接口是否因限流（HTTP 429）而失败"""
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) == 429 or getattr(error, 'status_code', None) == 429:
+        return True
+    message = str(error)
+    return 'status_code: 429' in message or 'Throttling' in message
+
+
+class TokenBucket:
+    """
+    令牌桶限速：每次请求消耗一个令牌，令牌按 rate 个/秒补充，最多积累 capacity 个。
+    请求被限流时速率减半（不低于 min_rate），之后每次成功按 max_rate 的 5% 逐步恢复。
+    """
+
+    def __init__(self, rate: float, capacity: float = None, min_rate: float = 0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill_locked(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_throttled(self):
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            # 丢弃已积累的令牌，让所有并发请求一起放慢
+            self.tokens = min(self.tokens, 0.0)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class EmbeddingExecutor:
+    """
+    文档分片的 embedding 执行器：按服务商单次请求的上限分批，最多 max_concurrency 批并发请求，
+    请求速率受令牌桶控制，遇到 429 时降速并重试该批。
+    执行器和令牌桶在进程内共享，多个入库任务同时进行时总并发和总速率仍受限制。
+    """
+
+    def __init__(self, max_concurrency: int = 4, rate_limit: float = 10.0, batch_size: int = None,
+                 max_retries: int = 6):
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate_limit)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='embed')
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    def batch_size_for(self, embeddings) -> int:
+        """未显式配置时使用服务商允许的单次最大条数"""
+        if self.batch_size:
+            return self.batch_size
+        model_name = getattr(embeddings, 'model_name', None) or getattr(embeddings, 'model', None)
+        return DASHSCOPE_BATCH_SIZE.get(model_name, 25)
+
+    def embed(self, embeddings, texts: list):
+        """
+        计算 texts 的向量，按完成顺序逐批产出 (起始下标, 向量列表)，调用方可以边产出边写入向量数据库。
+        任意一批重试耗尽后抛出异常，尚未开始的批次会被取消。
+        """
+        batch_size = self.batch_size_for(embeddings)
+        futures = {
+            self._pool.submit(self._embed_batch, embeddings, texts[start:start + batch_size]): start
+            for start in range(0, len(texts), batch_size)
+        }
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _embed_batch(self, embeddings, batch: list):
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                vectors = embeddings.embed_documents(batch)
+            except Exception as e:
+                if not is_throttled(e) or attempt >= self.max_retries:
+                    self._count('failed_batches')
+                    raise
+                attempt += 1
+                self.bucket.on_throttled()
+                self._count('throttled')
+                logger.warning(f"Embedding request throttled, slowing down to {self.bucket.rate:.2f} req/s "
+                               f"(retry {attempt}/{self.max_retries})")
+                continue
+            self.bucket.on_success()
+            self._count('batches')
+            self._count('texts', len(batch))
+            return vectors
+
+    def _count(self, key: str, value: int = 1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def get_stats(self):
+        with self._stats_lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'rate_limit': self.bucket.max_rate,
+                'current_rate': round(self.bucket.rate, 2),
+                **self._stats,
+            }
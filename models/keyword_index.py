@@ -0,0 +1,148 @@
+# models/keyword_index.py
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+# 单条 SQL 中 IN (...) 参数的最大个数，低于 SQLite 默认的变量数限制
+_SQL_BATCH = 500
+
+# 英文单词 / 代码标识符，以及连续的中日韩文字
+_WORD_PATTERN = re.compile(r'[A-Za-z0-9_]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+# 驼峰命名拆分：HTTPServerError -> HTTP, Server, Error
+_CAMEL_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+
+
+def tokenize(text: str) -> list:
+    """
+    检索用的分词：英文和代码标识符转小写后整体作为一个词，驼峰 / 下划线命名另外拆出各个部分
+    （getUserName -> getusername, get, user, name）；中文没有分词器可用，按相邻两字切分（单字的词保留单字）。
+    """
+    terms = []
+    for match in _WORD_PATTERN.finditer(text):
+        word = match.group()
+        if not word.isascii():
+            if len(word) == 1:
+                terms.append(word)
+            else:
+                terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+            continue
+        if len(word) > 1:
+            terms.append(word.lower())
+        parts = [part.lower() for piece in word.split('_') for part in _CAMEL_PATTERN.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(part for part in parts if len(part) > 1)
+    return terms
+
+
+class KeywordIndex:
+    """
+    会话分片的倒排索引，保存在本地 SQLite 中，与向量数据库中的分片使用相同的 ID，按 BM25 打分。
+    每个词在每个分片中的出现次数记为一条倒排记录，按 (session_id, term) 查询；
+    同一台机器上的多个 worker 进程可以共用同一个索引文件。
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                session_id TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (session_id, chunk_id)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS postings (
+                session_id TEXT NOT NULL,
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (session_id, term, chunk_id)
+            ) WITHOUT ROWID
+        """)
+
+    def add(self, session_id: str, chunk_ids: list, texts: list):
+        """索引一批分片，已经索引过的分片 ID 会被跳过"""
+        if not chunk_ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for chunk_id, text in zip(chunk_ids, texts):
+                    counts = Counter(tokenize(text or ''))
+                    length = sum(counts.values())
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO chunks (session_id, chunk_id, length) VALUES (?, ?, ?)",
+                        (session_id, chunk_id, length))
+                    if cursor.rowcount != 1:
+                        continue
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO postings (session_id, term, chunk_id, tf, length) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(session_id, term, chunk_id, tf, length) for term, tf in counts.items()])
+                    self.stats['indexed_chunks'] += 1
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def has_session(self, session_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM chunks WHERE session_id = ? LIMIT 1",
+                                      (session_id,)).fetchone() is not None
+
+    def search(self, session_id: str, query: str, k: int = 20) -> list:
+        """返回 BM25 得分最高的 k 个分片 [(chunk_id, score)]，按得分从高到低排列"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            total, avg_length = self._conn.execute(
+                "SELECT COUNT(*), AVG(length) FROM chunks WHERE session_id = ?", (session_id,)).fetchone()
+            if not total:
+                return []
+            rows = []
+            for start in range(0, len(terms), _SQL_BATCH):
+                batch = terms[start:start + _SQL_BATCH]
+                rows.extend(self._conn.execute(
+                    f"SELECT term, chunk_id, tf, length FROM postings "
+                    f"WHERE session_id = ? AND term IN ({','.join('?' * len(batch))})",
+                    [session_id, *batch]).fetchall())
+            self.stats['searches'] += 1
+
+        document_frequency = Counter(term for term, _, _, _ in rows)
+        scores = Counter()
+        for term, chunk_id, tf, length in rows:
+            df = document_frequency[term]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * length / (avg_length or 1))
+            scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+    def delete_session(self, session_id: str):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM postings WHERE session_id = ?", (session_id,))
+                self._conn.execute("DELETE FROM chunks WHERE session_id = ?", (session_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
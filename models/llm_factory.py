@@ -1,32 +1,100 @@
 # models/llm_factory.py
 import os
+import threading
+from collections import Counter
 
 from flask import current_app
 from langchain_openai import ChatOpenAI
 from langchain_community.embeddings import DashScopeEmbeddings
 
+from models.embedding_cache import EmbeddingCache, CachedEmbeddings
+
+# 进程内复用的客户端，键为 (类型, 配置...)；ChatOpenAI / DashScopeEmbeddings 均可在多线程间共享
+_clients = {}
+_clients_lock = threading.Lock()
+
+# 当前 worker 进程内各类对象的构造次数，用于确认热路径上没有重复构造
+construction_counts = Counter()
+
+
+def _get_or_create(kind: str, key: tuple, factory):
+    """按配置缓存客户端，同一配置在进程内只构造一次"""
+    cache_key = (kind,) + key
+    client = _clients.get(cache_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(cache_key)
+            if client is None:
+                client = factory()
+                _clients[cache_key] = client
+                construction_counts[kind] += 1
+    return client
+
+
+def get_construction_counts():
+    """返回当前进程内的构造计数"""
+    return {'pid': os.getpid(), 'counts': dict(construction_counts)}
+
 
 def get_llm():
     """获取配置好的 LLM 实例"""
-    return ChatOpenAI(
-        openai_api_key=os.getenv('LLM_API_KEY'),
-        model_name=current_app.config['LLM_MODEL_NAME'],
-        base_url=current_app.config['LLM_BASE_URL']
-    )
+    api_key = os.getenv('LLM_API_KEY')
+    model_name = current_app.config['LLM_MODEL_NAME']
+    base_url = current_app.config['LLM_BASE_URL']
+    return _get_or_create('llm', (api_key, model_name, base_url), lambda: ChatOpenAI(
+        openai_api_key=api_key,
+        model_name=model_name,
+        base_url=base_url
+    ))
 
 
 def get_vision_llm():
     """具有识图功能的大模型"""
-    return ChatOpenAI(
-        openai_api_key=os.getenv('VISION_MODEL_API_KEY'),
-        model_name=current_app.config['VISION_MODEL_NAME'],
-        base_url=current_app.config['VISION_MODEL_BASE_URL']
-    )
+    api_key = os.getenv('VISION_MODEL_API_KEY')
+    model_name = current_app.config['VISION_MODEL_NAME']
+    base_url = current_app.config['VISION_MODEL_BASE_URL']
+    return _get_or_create('vision_llm', (api_key, model_name, base_url), lambda: ChatOpenAI(
+        openai_api_key=api_key,
+        model_name=model_name,
+        base_url=base_url
+    ))
+
+
+def get_embedding_cache():
+    """文本块 embedding 的持久化缓存，未启用时返回 None"""
+    if not current_app.config.get('EMBEDDING_CACHE_ENABLED', False):
+        return None
+    path = current_app.config.get('EMBEDDING_CACHE_PATH')
+    max_bytes = current_app.config.get('EMBEDDING_CACHE_MAX_MB', 1024) * 1024 * 1024
+    return _get_or_create('embedding_cache', (path, max_bytes), lambda: EmbeddingCache(path, max_bytes))
+
+
+def get_embedding_model_name() -> str:
+    """文档分片和查询使用的 embedding 模型名称，用于区分不同模型计算的向量"""
+    return current_app.config.get('DASH_EMBEDDINGS_MODEL_NAME')
 
 
 def get_embeddings():
-    """配置embedding模型"""
-    return DashScopeEmbeddings(
-        model=current_app.config.get('DASH_EMBEDDINGS_MODEL_NAME'),
-        dashscope_api_key=os.getenv('DASHSCOPE_API_KEY')
-    )
+    """配置embedding模型，用于查询向量等单次调用"""
+    model = current_app.config.get('DASH_EMBEDDINGS_MODEL_NAME')
+    api_key = os.getenv('DASHSCOPE_API_KEY')
+    return _get_or_create('embeddings', (model, api_key), lambda: DashScopeEmbeddings(
+        model=model,
+        dashscope_api_key=api_key
+    ))
+
+
+def get_document_embeddings():
+    """
+    文档分片使用的 embedding 模型，由 EmbeddingExecutor 分批调用。
+    关闭客户端内部的重试，限流（429）直接交给执行器的令牌桶处理；启用缓存时，重复的文本块直接使用缓存中的向量。
+    """
+    model = current_app.config.get('DASH_EMBEDDINGS_MODEL_NAME')
+    api_key = os.getenv('DASHSCOPE_API_KEY')
+    cache = get_embedding_cache()
+
+    def factory():
+        embeddings = DashScopeEmbeddings(model=model, dashscope_api_key=api_key, max_retries=1)
+        return CachedEmbeddings(embeddings, cache, model) if cache is not None else embeddings
+
+    return _get_or_create('document_embeddings', (model, api_key, cache.path if cache is not None else None), factory)
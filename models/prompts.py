@@ -11,6 +11,30 @@ GENERATE_SUMMARY_PROMPT = """
     请直接输出生成的摘要，无需添加如“摘要如下”或“以下是摘要”之类的前缀。
     """
 
+# 合并分段摘要的提示词（长文档分段摘要后使用）
+REDUCE_SUMMARY_PROMPT = """
+    你是一位高效的文本摘要专家。用户提供的内容是同一篇长文档按顺序分段后，各段落分别生成的摘要。
+    请将这些分段摘要合并为一份完整、连贯的文档摘要。
+    具体要求如下：
+    1.  **整体视角**：从全文的角度组织内容，体现文档的整体结构和主线，而不是逐段罗列。
+    2.  **去除重复**：合并各段摘要中重复或相近的信息。
+    3.  **忠实原文**：只使用分段摘要中出现的信息，不得添加推论或个人解读。
+    4.  **语言精炼**：使用清晰、流畅、精炼的语言进行概括。
+    请直接输出合并后的摘要，无需添加如“摘要如下”或“以下是摘要”之类的前缀。
+    """
+
+# 对话滚动摘要的提示词（会话历史超出 token 预算时，把较早的对话合并进摘要）
+CONVERSATION_SUMMARY_PROMPT = """
+    你负责维护一段多轮对话的滚动摘要。用户提供的内容包括此前的摘要（可能为空）和紧接其后的若干轮对话。
+    请将新增的对话合并进摘要，输出更新后的完整摘要。
+    具体要求如下：
+    1.  **保留关键信息**：用户的身份、偏好和目标，已经确认的事实、结论和决定，尚未解决的问题，以及后续可能被引用的具体细节（名称、数字、文件名、链接等）。
+    2.  **删除冗余**：省略寒暄、重复的内容和已被后续对话推翻的信息。
+    3.  **忠实原文**：只使用摘要和对话中出现的信息，不得添加推论或个人解读。
+    4.  **长度控制**：摘要不超过 {max_tokens} 个 token，使用与对话相同的语言。
+    请直接输出更新后的摘要，无需添加如“摘要如下”或“以下是摘要”之类的前缀。
+    """
+
 # 图片描述提示词
 IMAGE_DESC_PROMPT = """
     你是一位专业的图像内容描述专家。你的任务是接收一张图片，并生成一段清晰、准确、全面且客观的描述。
@@ -0,0 +1,105 @@
+# models/query_cache.py
+import logging
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from array import array
+from collections import OrderedDict, Counter
+
+logger = logging.getLogger(__name__)
+
+# 查询末尾不影响语义的标点
+_TRAILING_PUNCTUATION = re.compile(r'[\s?!.。？！,，;；:：]+$')
+
+
+def normalize_query(query: str) -> str:
+    """查询文本归一化：全角转半角、转小写、合并空白、去掉末尾标点，近似相同的查询得到同一个键"""
+    text = unicodedata.normalize('NFKC', query).lower()
+    text = ' '.join(text.split())
+    return _TRAILING_PUNCTUATION.sub('', text)
+
+
+class QueryCache:
+    """
+    向量数据库查询工具的进程内缓存，按 (会话, 归一化后的查询) 保存查询向量和检索结果，按 LRU 和 TTL 淘汰。
+    - 查询向量只取决于查询文本，会话写入新文档后仍然可以复用，省去 embedding 请求；
+    - 检索结果记录写入时会话的版本号，会话写入新分片或被清理时换一个新的版本号，旧结果随之失效。
+    版本号保存在 Redis 中（query_cache_gen:{session_id}，每次失效写入一个随机值，不会与之前的版本号重复），
+    多个 worker 进程之间的失效也能生效；未提供 Redis 客户端时只在进程内计数。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: int = 600, get_client=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.get_client = get_client
+        self._entries = OrderedDict()
+        self._generations = Counter()
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def generation(self, session_id: str):
+        """会话当前的版本号，读取失败时返回 None（此时不使用、也不写入检索结果）"""
+        if self.get_client is None:
+            with self._lock:
+                return self._generations[session_id]
+        try:
+            value = self.get_client().get(f"query_cache_gen:{session_id}") or b''
+            return value.decode() if isinstance(value, bytes) else value
+        except Exception as e:
+            logger.warning(f"Failed to read query cache generation for {session_id}: {e}")
+            return None
+
+    def invalidate(self, session_id: str):
+        """会话的文档发生变化，之前缓存的检索结果全部失效（查询向量保留）"""
+        with self._lock:
+            self.stats['invalidations'] += 1
+            self._generations[session_id] += 1
+            for key in [key for key, entry in self._entries.items() if key[0] == session_id and entry[2] is not None]:
+                expires_at, vector, _, _ = self._entries[key]
+                self._entries[key] = (expires_at, vector, None, None)
+        if self.get_client is None:
+            return
+        key = f"query_cache_gen:{session_id}"
+        try:
+            # 用随机值而不是递增计数：计数的键过期后从 0 重新开始，可能与其他进程中仍有效的旧条目的版本号相同。
+            # 键的过期时间长于缓存条目，过期后读到的空版本号也不会与仍然有效的旧条目相同
+            self.get_client().set(key, uuid.uuid4().hex, ex=self.ttl * 2)
+        except Exception as e:
+            # 其他 worker 进程中的旧结果最多保留到 TTL 过期
+            logger.warning(f"Failed to invalidate query cache for {session_id}: {e}")
+
+    def get(self, session_id: str, query: str, generation):
+        """返回 (查询向量, 检索结果)，未命中的部分为 None；generation 不一致的检索结果视为未命中"""
+        key = (session_id, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None, None
+            self._entries.move_to_end(key)
+            _, vector, results, results_generation = entry
+            if results is not None and generation is not None and results_generation == generation:
+                self.stats['hits'] += 1
+                return vector.tolist(), list(results)
+            self.stats['vector_hits'] += 1
+            return vector.tolist(), None
+
+    def put(self, session_id: str, query: str, vector: list, results: list, generation):
+        """保存查询向量和检索结果；generation 为 None 时只保存查询向量"""
+        key = (session_id, normalize_query(query))
+        entry = (time.monotonic() + self.ttl, array('f', vector), results if generation is not None else None,
+                 generation)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), **self.stats}
@@ -0,0 +1,225 @@
+# models/retriever.py
+import importlib
+import logging
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from models.keyword_index import KeywordIndex
+from models.llm_factory import get_embeddings
+
+logger = logging.getLogger(__name__)
+
+# 检索的各个阶段，按执行顺序
+RETRIEVAL_STAGES = ('embed', 'vector', 'keyword', 'fuse', 'rerank', 'mmr')
+
+
+class CrossEncoderReranker:
+    """sentence-transformers 的 CrossEncoder 本地重排模型，首次使用时加载"""
+
+    def __init__(self, model_name: str = 'BAAI/bge-reranker-base', max_length: int = 512):
+        self.model_name = model_name
+        self.max_length = max_length
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    started = time.perf_counter()
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length)
+                    logger.info(f"Reranker {self.model_name} loaded in {time.perf_counter() - started:.1f}s")
+        return self._model
+
+    def score(self, query: str, texts: list) -> list:
+        return self._load().predict([(query, text) for text in texts]).tolist()
+
+
+def create_reranker(name: str, model_name: str = None):
+    """
+    按名称创建重排器：'none' 不重排；'cross_encoder' 使用本地 CrossEncoder 模型；
+    'package.module:factory' 形式表示自定义重排器，factory(model_name) 返回带 score(query, texts) 方法的对象。
+    """
+    if not name or name == 'none':
+        return None
+    if name == 'cross_encoder':
+        return CrossEncoderReranker(model_name) if model_name else CrossEncoderReranker()
+    module_name, _, attr = name.partition(':')
+    return getattr(importlib.import_module(module_name), attr)(model_name)
+
+
+def _normalize(scores: np.ndarray) -> np.ndarray:
+    """按最大最小值缩放到 [0, 1]，所有得分相同时都记为 1"""
+    if scores.size == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high - low < 1e-9:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def mmr_select(embeddings: np.ndarray, relevance: np.ndarray, k: int, mmr_lambda: float) -> list:
+    """
+    最大边际相关（MMR）选择：每次选 mmr_lambda * 相关度 - (1 - mmr_lambda) * 与已选结果的最大相似度 最高的候选，
+    避免返回多个几乎相同的分片。embeddings 需已归一化。
+    """
+    selected = []
+    remaining = list(range(len(relevance)))
+    max_similarity = np.zeros(len(relevance), dtype=np.float32)
+    while remaining and len(selected) < k:
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * max_similarity[remaining]
+        best = remaining.pop(int(np.argmax(scores)))
+        selected.append(best)
+        max_similarity = np.maximum(max_similarity, embeddings @ embeddings[best])
+    return selected
+
+
+class HybridRetriever:
+    """
+    混合检索：向量检索和 BM25 关键词检索各取 fetch_k 个候选，两路得分各自归一化后按 vector_weight 加权融合；
+    配置了重排器时对融合后的前 rerank_k 个候选重新打分，最后用 MMR 从候选中选出 top_k 个结果。
+    关键词索引与向量数据库中的分片使用相同的 ID，索引之前写入的会话在首次检索或写入时从向量数据库补建。
+    每次检索记录各阶段的耗时。
+    """
+
+    def __init__(self, keyword_index: KeywordIndex, top_k: int = 3, fetch_k: int = 20, vector_weight: float = 0.5,
+                 mmr_lambda: float = 0.7, reranker=None, rerank_k: int = 10):
+        self.keyword_index = keyword_index
+        self.top_k = top_k
+        self.fetch_k = fetch_k
+        self.vector_weight = vector_weight
+        self.mmr_lambda = mmr_lambda
+        self.reranker = reranker
+        self.rerank_k = rerank_k
+        # 关键词索引中已经有数据的会话，避免每次都检查是否需要补建
+        self._indexed = set()
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def ensure_indexed(self, session_id: str, collection, where=None):
+        """会话的分片还没有关键词索引时（启用混合检索之前写入的数据），从向量数据库读出分片补建索引"""
+        if session_id in self._indexed:
+            return
+        if not self.keyword_index.has_session(session_id):
+            data = collection.get(where=where, include=['documents'])
+            if not data['ids']:
+                return
+            self.keyword_index.add(session_id, data['ids'], data['documents'])
+            self._count('backfilled_sessions')
+            logger.info(f"Built keyword index for {len(data['ids'])} existing chunks of session {session_id}")
+        self._indexed.add(session_id)
+
+    def index_chunks(self, session_id: str, chunk_ids: list, chunks: list):
+        """新写入向量数据库的分片同步写入关键词索引"""
+        self.keyword_index.add(session_id, chunk_ids, chunks)
+        self._indexed.add(session_id)
+
+    def forget_session(self, session_id: str):
+        self._indexed.discard(session_id)
+        self.keyword_index.delete_session(session_id)
+
+    def retrieve(self, query: str, session_id: str, collection, where=None, query_vector=None) -> list:
+        """
+        返回与查询最相关的 top_k 个分片文本，collection 为会话所在的 Chroma 集合，where 为会话过滤条件。
+        传入 query_vector（如缓存的查询向量）时不再计算查询的 embedding。
+        """
+        timings = {}
+        started = time.perf_counter()
+
+        if query_vector is None:
+            query_vector = get_embeddings().embed_query(query)
+            timings['embed'] = self._elapsed(started)
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+
+        stage_started = time.perf_counter()
+        result = collection.query(query_embeddings=[query_vector.tolist()], n_results=self.fetch_k, where=where,
+                                  include=['documents', 'embeddings'])
+        candidates = {chunk_id: (text, embedding) for chunk_id, text, embedding
+                      in zip(result['ids'][0], result['documents'][0], result['embeddings'][0])}
+        timings['vector'] = self._elapsed(stage_started)
+
+        stage_started = time.perf_counter()
+        self.ensure_indexed(session_id, collection, where)
+        keyword_scores = dict(self.keyword_index.search(session_id, query, self.fetch_k))
+        missing = [chunk_id for chunk_id in keyword_scores if chunk_id not in candidates]
+        if missing:
+            # 只被关键词检索到的分片，从向量数据库取出文本和向量
+            data = collection.get(ids=missing, include=['documents', 'embeddings'])
+            candidates.update({chunk_id: (text, embedding) for chunk_id, text, embedding
+                               in zip(data['ids'], data['documents'], data['embeddings'])})
+        timings['keyword'] = self._elapsed(stage_started)
+        if not candidates:
+            self._record(session_id, timings, started, 0)
+            return []
+
+        stage_started = time.perf_counter()
+        ids = list(candidates)
+        texts = [candidates[chunk_id][0] for chunk_id in ids]
+        embeddings = np.asarray([candidates[chunk_id][1] for chunk_id in ids], dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
+        vector_scores = embeddings @ (query_vector / (np.linalg.norm(query_vector) + 1e-12))
+        bm25_scores = np.asarray([keyword_scores.get(chunk_id, 0.0) for chunk_id in ids], dtype=np.float32)
+        bm25_scores = bm25_scores / bm25_scores.max() if bm25_scores.max() > 0 else bm25_scores
+        relevance = self.vector_weight * _normalize(vector_scores) + (1 - self.vector_weight) * bm25_scores
+        order = np.argsort(-relevance)
+        timings['fuse'] = self._elapsed(stage_started)
+
+        if self.reranker is not None:
+            stage_started = time.perf_counter()
+            try:
+                order = order[:self.rerank_k]
+                relevance = relevance.copy()
+                relevance[order] = _normalize(np.asarray(
+                    self.reranker.score(query, [texts[i] for i in order]), dtype=np.float32))
+            except Exception as e:
+                # 重排模型不可用时使用融合得分
+                self._count('rerank_failures')
+                logger.warning(f"Rerank failed, using fused scores: {e}")
+            timings['rerank'] = self._elapsed(stage_started)
+
+        stage_started = time.perf_counter()
+        selected = mmr_select(embeddings[order], relevance[order], self.top_k, self.mmr_lambda)
+        timings['mmr'] = self._elapsed(stage_started)
+
+        self._record(session_id, timings, started, len(candidates))
+        return [texts[order[i]] for i in selected]
+
+    @staticmethod
+    def _elapsed(started: float) -> float:
+        return (time.perf_counter() - started) * 1000
+
+    def _record(self, session_id: str, timings: dict, started: float, candidates: int):
+        total = self._elapsed(started)
+        with self._lock:
+            self._stats['queries'] += 1
+            self._stats['candidates'] += candidates
+            self._stats['total_ms'] += total
+            for stage, ms in timings.items():
+                self._stats[f'{stage}_ms'] += ms
+                self._stats[f'{stage}_count'] += 1
+        logger.info(f"Retrieval for session {session_id} took {total:.1f} ms ("
+                    + ', '.join(f'{stage} {ms:.1f}' for stage, ms in timings.items())
+                    + f"), {candidates} candidates")
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self._stats[key] += value
+
+    def get_stats(self):
+        with self._lock:
+            queries = self._stats['queries']
+            stages = {stage: round(self._stats[f'{stage}_ms'] / self._stats[f'{stage}_count'], 2)
+                      for stage in RETRIEVAL_STAGES if self._stats[f'{stage}_count']}
+            return {
+                'queries': queries,
+                'avg_ms': round(self._stats['total_ms'] / queries, 2) if queries else None,
+                'avg_stage_ms': stages,
+                'avg_candidates': round(self._stats['candidates'] / queries, 1) if queries else None,
+                'backfilled_sessions': self._stats['backfilled_sessions'],
+                'rerank_failures': self._stats['rerank_failures'],
+                'keyword_index': self.keyword_index.get_stats(),
+            }
@@ -1,83 +1,314 @@
 # models/vector_db_manager.py
 import os
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import chromadb
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
-from langchain.docstore.document import Document
-from models.llm_factory import get_embeddings, get_llm
-from utils.file_util import get_generate_summary_chain
+from models.llm_factory import get_embeddings, get_document_embeddings, get_embedding_model_name
+from models.embedding_executor import EmbeddingExecutor
+from models.vectorstore_cache import VectorStoreCache
+from models.document_registry import DocumentRegistry
+from models.retriever import HybridRetriever
+from models.query_cache import QueryCache
+from utils.stream_splitter import StreamingSplitter
+from utils.summarizer import DocumentSummarizer
+
+# 共享布局下所有会话的数据都存放在 EMBEDDINGS_PATH 下的这个目录中
+SHARED_DIR_NAME = '_shared'
+# 流式分片时缓冲区达到这么多个字符就切分一次
+CHUNK_FLUSH_CHARS = 32 * 1024
+# shared 布局下缓存“会话是否有文档”结果的会话数上限
+PRESENCE_CACHE_SIZE = 10000
 
 
 class VectorDBManager:
+    """
+    会话向量数据库，支持两种存储布局：
+    - directory：每个会话一个 Chroma 数据库，位于 EMBEDDINGS_PATH/<session_id>；
+    - shared：所有会话共用一个 Chroma 数据库中的固定数量的分片集合，按 session_id 元数据过滤查询和删除。
+    """
+
     # 接收 embeddings_path 作为参数，而不是在 __init__ 时从 current_app 获取
-    def __init__(self, embeddings_path):
+    def __init__(self, embeddings_path, max_open_handles: int = 32, max_cache_mb: int = 512,
+                 layout: str = 'directory', shards: int = 8, registry: DocumentRegistry = None,
+                 summarizer: DocumentSummarizer = None, embedding_executor: EmbeddingExecutor = None,
+                 retriever: HybridRetriever = None, query_cache: QueryCache = None, presence_ttl: float = 10):
+        if layout not in ('directory', 'shared'):
+            raise ValueError(f"Unknown vector db layout: {layout}")
         self.embeddings_path = embeddings_path
+        self.layout = layout
+        self.shards = shards
+        # 已打开的 Chroma 句柄在进程内复用，按 LRU 和内存预算淘汰（directory 布局）
+        self.handle_cache = VectorStoreCache(max_open_handles, max_cache_mb * 1024 * 1024)
+        # shared 布局：一个客户端和固定数量的分片集合，常驻内存
+        self._shared_client = None
+        self._shard_collections = {}
+        self._shared_lock = threading.Lock()
+        # shared 布局下“会话是否有文档”的查询结果（有和没有都缓存）：session_id -> (是否有文档, 过期时间)，
+        # 避免每轮对话都查询一次元数据；其他 worker 写入或清除会话后，最多 presence_ttl 秒后生效
+        self.presence_ttl = presence_ttl
+        self._presence = OrderedDict()
+        self._presence_lock = threading.Lock()
+        # 按文件内容登记的已处理文档，为 None 时每次上传都完整处理
+        self.registry = registry
+        # 长文档按段落并发生成摘要后再合并
+        self.summarizer = summarizer or DocumentSummarizer()
+        # 分片的 embedding 按服务商上限分批、限速并发计算
+        self.embedding_executor = embedding_executor or EmbeddingExecutor()
+        # 混合检索（向量 + BM25 + MMR），为 None 时只做向量相似度检索
+        self.retriever = retriever
+        # 查询向量和检索结果的缓存，为 None 时每次查询都计算 embedding 并检索
+        self.query_cache = query_cache
 
     def get_embeddings_path(self):
         return self.embeddings_path
 
-    def generate_embeddings(self, file_name: str, file_content: str, session_id: str):
-        persist_dir = os.path.join(self.embeddings_path, session_id)
-        os.makedirs(persist_dir, exist_ok=True)
+    def _persist_dir(self, session_id: str):
+        return os.path.join(self.embeddings_path, session_id)
 
-        if file_content and file_name:
+    def _shard_of(self, session_id: str):
+        return zlib.crc32(session_id.encode('utf-8')) % self.shards
 
-            chain = get_generate_summary_chain(get_llm())
-            summary = chain.invoke({'input': file_content})
+    def _get_shard(self, session_id: str) -> Chroma:
+        """session_id 所在的分片集合"""
+        shard = self._shard_of(session_id)
+        with self._shared_lock:
+            collection = self._shard_collections.get(shard)
+            if collection is None:
+                if self._shared_client is None:
+                    self._shared_client = chromadb.PersistentClient(
+                        path=os.path.join(self.embeddings_path, SHARED_DIR_NAME))
+                # get_embeddings 需在有 app_context 时调用
+                collection = Chroma(client=self._shared_client, collection_name=f'sessions_{shard:02d}',
+                                    embedding_function=get_embeddings())
+                self._shard_collections[shard] = collection
+            return collection
 
-            file_content = '本文的摘要\主要内容是：\n\n' + summary + "\n\n" + file_content
+    @contextmanager
+    def _open(self, session_id: str):
+        """返回 (向量库, 检索过滤条件)"""
+        if self.layout == 'shared':
+            yield self._get_shard(session_id), {'session_id': session_id}
+        else:
+            # get_embeddings 需在有 app_context 时调用；集合不存在时会自动创建
+            with self.handle_cache.open(self._persist_dir(session_id), get_embeddings()) as vector_db:
+                yield vector_db, None
 
-            documents = [Document(
-                page_content=file_content,
-                metadata={'file_name': file_name, 'session_id': session_id}
-            )]
+    def has_vector_db(self, session_id: str) -> bool:
+        """会话是否上传过文件（即是否需要提供向量数据库查询工具）"""
+        if self.layout == 'directory':
+            return os.path.exists(self._persist_dir(session_id))
+        with self._presence_lock:
+            entry = self._presence.get(session_id)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+        found = bool(self._get_shard(session_id).get(where={'session_id': session_id}, limit=1, include=[])['ids'])
+        self._set_presence(session_id, found)
+        return found
 
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-            split_docs = text_splitter.split_documents(documents)
+    def _set_presence(self, session_id: str, found: bool):
+        with self._presence_lock:
+            self._presence[session_id] = (found, time.monotonic() + self.presence_ttl)
+            self._presence.move_to_end(session_id)
+            while len(self._presence) > PRESENCE_CACHE_SIZE:
+                self._presence.popitem(last=False)
 
-            if os.path.exists(persist_dir):
-                dabs = Chroma(
-                    persist_directory=persist_dir,
-                    embedding_function=get_embeddings()  # get_embeddings 需在有 app_context 时调用
-                )
-                dabs.add_documents(split_docs)
-            else:
-                dabs = Chroma.from_documents(
-                    documents=split_docs,
-                    embedding=get_embeddings(),  # get_embeddings 需在有 app_context 时调用
-                    persist_directory=persist_dir
-                )
+    def generate_embeddings(self, file_name: str, file_content, session_id: str, file_hash: str = None,
+                            progress=None):
+        """
+        生成摘要、分片并计算 embedding 后写入会话的向量数据库。
+        file_content 可以是完整文本，也可以是逐页 / 逐段产出文本的可迭代对象（如 iter_file_sections），
+        后者边解析边切分：分片攒够一组就交给 embedding_executor 计算并立即写入，同时在后台生成分段摘要，
+        内存中只保留正在处理的一小部分文本，未全部完成前已写入的部分即可被检索到。摘要在全文处理完后单独分片写入。
+        传入 file_hash 且启用了文档登记表时，处理结果会被登记，之后相同文件的上传可以直接复用。
+        progress(stage, done=None, total=None) 用于报告 embed / summarize / persist 各阶段的进度。
+        """
+        report = progress or (lambda stage, **info: None)
+        if self.layout == 'directory':
+            os.makedirs(self._persist_dir(session_id), exist_ok=True)
+        if not file_content or not file_name:
+            return
 
-            dabs.persist()
-            # 记录日志时使用 current_app
-            from flask import current_app
-            current_app.logger.info(f'成功将 {file_name} 加载至向量数据库中')
+        sections = [file_content] if isinstance(file_content, str) else file_content
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+        chunk_stream = StreamingSplitter(text_splitter, flush_size=CHUNK_FLUSH_CHARS)
+        summary_stream = self.summarizer.stream()
+        embeddings = get_document_embeddings()
+        # 一组分片足够让 embedding_executor 的所有并发都有批次可做
+        group_size = self.embedding_executor.batch_size_for(embeddings) * self.embedding_executor.max_concurrency * 2
+        # 登记表需要保存全部分片和向量，向量以 float32 保存以减少内存占用
+        registered = ([], []) if self.registry is not None and file_hash else None
+        state = {'done': 0}
 
-    def query_vectorstore(self, query: str, session_id: str):
-        persist_dir = os.path.join(self.embeddings_path, session_id)
+        def embed_group(chunks):
+            for start, batch_vectors in self.embedding_executor.embed(embeddings, chunks):
+                batch = chunks[start:start + len(batch_vectors)]
+                # 每批向量计算完成后立即写入
+                self._add_chunks(session_id, file_name, batch, batch_vectors)
+                if registered is not None:
+                    registered[0].extend(batch)
+                    registered[1].extend(array('f', vector) for vector in batch_vectors)
+                state['done'] += len(batch_vectors)
+                report('embed', done=state['done'])
 
-        if not os.path.exists(persist_dir):
-            return "未发现向量数据库"
+        try:
+            pending = []
+            for section in sections:
+                summary_stream.add(section)
+                pending.extend(chunk_stream.feed(section))
+                if len(pending) >= group_size:
+                    embed_group(pending)
+                    pending = []
+            pending.extend(chunk_stream.close())
+            if not pending and not state['done']:
+                return
+            embed_group(pending)
+            report('embed', done=state['done'], total=state['done'])
+
+            report('summarize')
+            summary = summary_stream.finish()
+            embed_group(text_splitter.split_text('本文的摘要\主要内容是：\n\n' + summary))
+        finally:
+            summary_stream.close()
+
+        report('persist')
+        if registered is not None:
+            # 分片和向量可以完整复用，原文不再整体保留
+            self.registry.put(file_hash, file_name, '', summary, *registered,
+                              embedding_model=get_embedding_model_name())
+            self.registry.add_ref(file_hash, session_id)
+        # 记录日志时使用 current_app
+        from flask import current_app
+        current_app.logger.info(f'成功将 {file_name} 加载至向量数据库中')
 
-        # get_embeddings 需在有 app_context 时调用
-        vector_db = Chroma(
-            persist_directory=persist_dir,
-            embedding_function=get_embeddings()
-        )
-        results = vector_db.similarity_search(query, k=3)
+    def attach_registered_document(self, file_name: str, file_hash: str, session_id: str) -> bool:
+        """
+        文件已经处理过时，直接把登记的分片和向量写入会话的向量数据库，返回 True；
+        未登记时返回 False，由调用方走完整的解析流程。
+        """
+        if self.registry is None:
+            return False
+        if self.registry.has_ref(file_hash, session_id):
+            # 同一会话重复上传同一文件，向量数据库中已经有这些分片
+            return True
+        document = self.registry.get(file_hash, get_embedding_model_name())
+        if document is None:
+            return False
+
+        if self.layout == 'directory':
+            os.makedirs(self._persist_dir(session_id), exist_ok=True)
+        self._add_chunks(session_id, file_name, document['chunks'], document['vectors'])
+        self.registry.add_ref(file_hash, session_id)
+        from flask import current_app
+        current_app.logger.info(f'复用已处理的文档 {file_hash[:12]}，已将 {file_name} 加载至向量数据库中')
+        return True
+
+    def _add_chunks(self, session_id: str, file_name: str, chunks: list, vectors: list):
+        """把已经计算好向量的分片写入会话的向量数据库"""
+        if not chunks:
+            return
+        ids = [str(uuid.uuid4()) for _ in chunks]
+        with self._open(session_id) as (dabs, search_filter):
+            if self.retriever is not None:
+                # 会话中已有的分片先补建关键词索引，之后的分片随写入同步索引
+                self.retriever.ensure_indexed(session_id, dabs._collection, search_filter)
+            dabs._collection.add(
+                ids=ids,
+                embeddings=vectors,
+                documents=chunks,
+                metadatas=[{'file_name': file_name, 'session_id': session_id} for _ in chunks],
+            )
+        if self.retriever is not None:
+            self.retriever.index_chunks(session_id, ids, chunks)
+        if self.query_cache is not None:
+            self.query_cache.invalidate(session_id)
+        if self.layout == 'directory':
+            self.handle_cache.refresh_size(self._persist_dir(session_id))
+        else:
+            self._set_presence(session_id, True)
 
-        if results:
-            res = [doc.page_content for doc in results]
+    def query_vectorstore(self, query: str, session_id: str):
+        if not self.has_vector_db(session_id):
+            return "未发现向量数据库"
+
+        res = self.retrieve_chunks(query, session_id)
+        if res:
             res = '\n'.join(res)
         else:
             res = "没有查询到相关内容"
 
         return res
 
+    def retrieve_chunks(self, query: str, session_id: str) -> list:
+        """
+        检索与查询最相关的分片文本：启用混合检索时交给 retriever，否则按向量相似度取前 3 个。
+        启用查询缓存时，相同（归一化后）的查询直接返回缓存的结果；会话写入过新文档时复用查询向量重新检索。
+        """
+        if self.query_cache is None:
+            return self._retrieve(query, session_id)
+
+        generation = self.query_cache.generation(session_id)
+        query_vector, results = self.query_cache.get(session_id, query, generation)
+        if results is not None:
+            return results
+        if query_vector is None:
+            query_vector = get_embeddings().embed_query(query)
+        results = self._retrieve(query, session_id, query_vector)
+        self.query_cache.put(session_id, query, query_vector, results, generation)
+        return results
+
+    def _retrieve(self, query: str, session_id: str, query_vector=None) -> list:
+        with self._open(session_id) as (vector_db, search_filter):
+            if self.retriever is not None:
+                return self.retriever.retrieve(query, session_id, vector_db._collection, search_filter,
+                                               query_vector=query_vector)
+            if query_vector is not None:
+                results = vector_db.similarity_search_by_vector(query_vector, k=3, filter=search_filter)
+            else:
+                results = vector_db.similarity_search(query, k=3, filter=search_filter)
+            return [doc.page_content for doc in results]
+
     def clear_vector_db(self, session_id: str):
-        persist_dir = os.path.join(self.embeddings_path, session_id)
+        from flask import current_app
+        if self.registry is not None:
+            self.registry.release_session(session_id)
+        if self.retriever is not None:
+            self.retriever.forget_session(session_id)
+        if self.query_cache is not None:
+            self.query_cache.invalidate(session_id)
+        if self.layout == 'shared':
+            self._get_shard(session_id).delete(where={'session_id': session_id})
+            self._set_presence(session_id, False)
+            current_app.logger.info(f'会话 {session_id} 的向量数据已删除')
+            return
+
+        persist_dir = self._persist_dir(session_id)
+        # 先关闭缓存中的句柄，释放索引文件
+        self.handle_cache.close(persist_dir)
         if os.path.exists(persist_dir):
             import shutil
             shutil.rmtree(persist_dir)
             # 记录日志时使用 current_app
-            from flask import current_app
             current_app.logger.info(f'向量数据库目录 {persist_dir} 已删除')
+
+    def get_cache_stats(self):
+        if self.layout == 'shared':
+            return {'layout': 'shared', 'shards': self.shards, 'open_shards': len(self._shard_collections),
+                    'presence_cached': len(self._presence)}
+        return {'layout': 'directory', **self.handle_cache.get_stats()}
+
+    def get_registry_stats(self):
+        return self.registry.get_stats() if self.registry is not None else None
+
+    def get_retrieval_stats(self):
+        return self.retriever.get_stats() if self.retriever is not None else None
+
+    def get_query_cache_stats(self):
+        return self.query_cache.get_stats() if self.query_cache is not None else None
@@ -0,0 +1,184 @@
+# models/vectorstore_cache.py
+import os
+import threading
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+
+from chromadb.api.shared_system_client import SharedSystemClient
+from langchain_community.vectorstores import Chroma
+
+
+def _dir_size(path: str) -> int:
+    """目录在磁盘上的总大小，用于估算打开后的 SQLite 缓存和 HNSW 索引占用的内存"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class _Handle:
+    def __init__(self, vector_db: Chroma, size: int):
+        self.vector_db = vector_db
+        self.size = size
+        self.in_use = 0
+        self.evicted = False
+        self.closed = False
+
+
+class VectorStoreCache:
+    """
+    进程级的 Chroma 句柄缓存，按 persist_directory 复用已打开的集合，避免每次查询都重新打开 SQLite 和 HNSW 索引。
+    句柄数超过 max_handles 或估算内存超过 max_bytes 时按 LRU 淘汰；正在使用的句柄被淘汰时推迟到用完后再关闭。
+    """
+
+    def __init__(self, max_handles: int = 32, max_bytes: int = 512 * 1024 * 1024, dir_lock_stripes: int = 64):
+        self.max_handles = max_handles
+        self.max_bytes = max_bytes
+        self._handles = OrderedDict()
+        # 只保护 LRU 顺序和内存估算，持有期间不做任何 I/O
+        self._lock = threading.Lock()
+        # 按目录分段的锁，串行化同一目录的打开和关闭：chromadb 按目录共享 System，
+        # 两者交错会停掉别人正在用的 System；不同目录之间互不阻塞。同一线程不会同时持有两把目录锁
+        self._dir_locks = [threading.Lock() for _ in range(dir_lock_stripes)]
+        self._bytes = 0
+        # 每个目录尚未关闭的句柄数（缓存中的，以及已被淘汰但仍在使用的），降为 0 时才停止该目录共享的 System
+        self._live = Counter()
+        self.stats = Counter()
+
+    def _dir_lock(self, persist_dir: str) -> threading.Lock:
+        return self._dir_locks[hash(persist_dir) % len(self._dir_locks)]
+
+    @contextmanager
+    def open(self, persist_dir: str, embedding_function):
+        """借出 persist_dir 对应的 Chroma 句柄，没有时打开一个并放入缓存"""
+        handle = self._acquire(persist_dir, embedding_function)
+        try:
+            yield handle.vector_db
+        finally:
+            self._release(handle)
+
+    def _lookup_locked(self, persist_dir: str):
+        handle = self._handles.get(persist_dir)
+        if handle is not None:
+            self._handles.move_to_end(persist_dir)
+            self.stats['hits'] += 1
+            handle.in_use += 1
+        return handle
+
+    def _acquire(self, persist_dir: str, embedding_function) -> _Handle:
+        with self._lock:
+            handle = self._lookup_locked(persist_dir)
+        if handle is not None:
+            return handle
+
+        with self._dir_lock(persist_dir):
+            # 等待目录锁期间可能已被其他线程打开
+            with self._lock:
+                handle = self._lookup_locked(persist_dir)
+                if handle is None:
+                    self.stats['misses'] += 1
+            if handle is not None:
+                return handle
+            # 打开集合和估算大小较慢，不持有缓存锁，其他目录的查询不受影响
+            vector_db = Chroma(persist_directory=persist_dir, embedding_function=embedding_function)
+            handle = _Handle(vector_db, _dir_size(persist_dir))
+            handle.in_use = 1
+            with self._lock:
+                self._handles[persist_dir] = handle
+                self._live[persist_dir] += 1
+                self._bytes += handle.size
+                evicted = self._evict_locked()
+        # 释放本目录的锁之后再关闭被淘汰的句柄
+        self._close_all(evicted)
+        return handle
+
+    def _release(self, handle: _Handle):
+        with self._lock:
+            handle.in_use -= 1
+            closing = handle.evicted and handle.in_use == 0
+        if closing:
+            self._close(handle)
+
+    def _evict_locked(self) -> list:
+        """按 LRU 淘汰，最近放入的句柄至少保留一个；返回需要关闭的句柄，正在使用的句柄用完后再关闭"""
+        closing = []
+        while len(self._handles) > 1 and (len(self._handles) > self.max_handles or self._bytes > self.max_bytes):
+            _, handle = self._handles.popitem(last=False)
+            self._bytes -= handle.size
+            self.stats['evictions'] += 1
+            handle.evicted = True
+            if handle.in_use == 0:
+                closing.append(handle)
+        return closing
+
+    def _close_all(self, handles: list):
+        for handle in handles:
+            self._close(handle)
+
+    def _mark_closed_locked(self, persist_dir: str, handle: _Handle) -> bool:
+        """记录句柄已关闭，返回该目录是否已没有其他未关闭的句柄"""
+        if handle.closed:
+            return False
+        handle.closed = True
+        self._live[persist_dir] -= 1
+        if self._live[persist_dir] > 0:
+            return False
+        del self._live[persist_dir]
+        return True
+
+    def _close(self, handle: _Handle):
+        persist_dir = handle.vector_db._persist_directory
+        with self._dir_lock(persist_dir):
+            with self._lock:
+                # 同一目录还有其他句柄（重新打开后缓存中的，或被淘汰但仍在查询的）时，System 仍在使用中
+                last = self._mark_closed_locked(persist_dir, handle)
+            if last:
+                self._stop_system(persist_dir)
+
+    def refresh_size(self, persist_dir: str):
+        """写入文档后重新估算句柄大小，必要时触发淘汰"""
+        size = _dir_size(persist_dir)
+        evicted = []
+        with self._lock:
+            handle = self._handles.get(persist_dir)
+            if handle is not None:
+                self._bytes += size - handle.size
+                handle.size = size
+                evicted = self._evict_locked()
+        self._close_all(evicted)
+
+    def close(self, persist_dir: str):
+        """关闭并移出 persist_dir 对应的句柄（删除目录前调用，Windows 下文件被占用时无法删除）"""
+        with self._dir_lock(persist_dir):
+            with self._lock:
+                handle = self._handles.pop(persist_dir, None)
+                if handle is not None:
+                    self._bytes -= handle.size
+                    handle.evicted = True
+                    self._mark_closed_locked(persist_dir, handle)
+            # 即使不在缓存中，chromadb 也可能为该目录保留着 System
+            self._stop_system(persist_dir)
+
+    @staticmethod
+    def _stop_system(persist_dir: str):
+        system = SharedSystemClient._identifier_to_system.pop(persist_dir, None)
+        if system is not None:
+            system.stop()
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'handles': len(self._handles),
+                'max_handles': self.max_handles,
+                'estimated_mb': round(self._bytes / 1024 / 1024, 2),
+                'max_mb': round(self.max_bytes / 1024 / 1024, 2),
+                'hits': self.stats['hits'],
+                'misses': self.stats['misses'],
+                'evictions': self.stats['evictions'],
+                'hit_rate': round(self.stats['hits'] / lookups, 4) if lookups else None,
+            }
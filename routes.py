@@ -1,27 +1,26 @@
 # routes.py
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, request, jsonify, send_file, current_app, Response, stream_with_context
+
+from services.streaming import format_event
+from services.parallel_agent import get_tool_execution_stats
+from utils.file_util import allowed_file
 
-from models.vector_db_manager import VectorDBManager
-from services.chat_service import ChatService
-from services.audio_service import AudioService
 from utils.session_storage import session_manager
+from utils.web_utils import get_page_fetcher, get_web_cache_stats
 
 # 创建蓝图
 main_bp = Blueprint('main', __name__)
 
 
-def get_services():
-    """在当前应用上下文内获取服务实例"""
-    # 从 current_app.config 获取配置
-    embeddings_path = current_app.config.get('EMBEDDINGS_PATH')
-    # 创建 VectorDBManager 实例
-    vector_db_manager = VectorDBManager(embeddings_path)
-    # 创建 ChatService 实例，注入依赖
-    chat_service = ChatService(session_manager, vector_db_manager)
-    # 创建 AudioService 实例
-    audio_service = AudioService()
+def get_container():
+    """获取在 create_app() 中构建的应用级服务容器"""
+    return current_app.extensions['service_container']
 
-    return chat_service, audio_service
+
+def get_services():
+    """在当前应用上下文内获取服务实例（进程内共享，不再按请求构造）"""
+    container = get_container()
+    return container.chat_service, container.audio_service
 
 
 @main_bp.route('/chat', methods=['POST'])
@@ -48,6 +47,31 @@ def chat():
         return jsonify({'error': 'Failed to process chat request'}), 500
 
 
+@main_bp.route('/chat_stream', methods=['POST'])
+def chat_stream():
+    """流式对话接口，以 SSE（默认）或 NDJSON（format=ndjson）逐步返回 token 和工具调用进度"""
+    chat_service, _ = get_services()  # 获取需要的服务
+    try:
+        data = request.get_json()
+        if not data or 'message' not in data or 'session_id' not in data:
+            return jsonify({'error': 'Missing message or session_id in request body'}), 400
+
+        user_message = data['message']
+        system_prompt = data.get('system_prompt', 'You are a helpful assistant.')
+        session_id = data['session_id']
+        stream_format = 'ndjson' if data.get('format') == 'ndjson' else 'sse'
+
+        events = chat_service.handle_chat_stream(user_message, system_prompt, session_id)
+    except Exception as e:
+        current_app.logger.error(f"Error in chat_stream: {e}")
+        return jsonify({'error': 'Failed to process chat request'}), 500
+
+    mimetype = 'application/x-ndjson' if stream_format == 'ndjson' else 'text/event-stream'
+    body = (format_event(event, stream_format) for event in events)
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @main_bp.route('/chat_with_image', methods=['POST'])
 def chat_with_image():
     """带图片的对话接口"""
@@ -91,11 +115,14 @@ def chat_with_file():
         if uploaded_file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
 
-        ai_response = chat_service.handle_chat_with_file(uploaded_file, user_message, system_prompt, session_id)
+        ai_response, job = chat_service.handle_chat_with_file(
+            uploaded_file, user_message, system_prompt, session_id,
+            wait_timeout=current_app.config.get('INGEST_WAIT_TIMEOUT', 20))
 
         return jsonify({
             'response': ai_response,
-            'session_id': session_id
+            'session_id': session_id,
+            'ingest_job': job
         })
     except ValueError as e:
         return jsonify({'error': str(e)}), 501
@@ -104,6 +131,42 @@ def chat_with_file():
         return jsonify({'error': 'Failed to process chat with file request'}), 500
 
 
+@main_bp.route('/upload_file', methods=['POST'])
+def upload_file():
+    """只上传文件：提交后台入库任务后立即返回任务状态，通过 /ingest_jobs/<job_id> 查询进度"""
+    ingestion_service = get_container().ingestion_service
+    try:
+        if 'file' not in request.files or 'session_id' not in request.form:
+            return jsonify({'error': 'Missing file or session_id'}), 400
+
+        uploaded_file = request.files['file']
+        session_id = request.form['session_id']
+
+        if uploaded_file.filename == '':
+            return jsonify({'error': 'No selected file'}), 400
+        if not allowed_file(uploaded_file.filename):
+            return jsonify({'error': 'File type not allowed'}), 501
+
+        job = ingestion_service.submit(uploaded_file, session_id)
+        return jsonify(job), 202
+    except Exception as e:
+        current_app.logger.error(f"Error in upload_file: {e}")
+        return jsonify({'error': 'Failed to submit file'}), 500
+
+
+@main_bp.route('/ingest_jobs/<job_id>', methods=['GET'])
+def get_ingest_job(job_id):
+    """查询文件入库任务的状态和各阶段进度"""
+    try:
+        job = get_container().ingestion_service.get_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+    except Exception as e:
+        current_app.logger.error(f"Error in get_ingest_job: {e}")
+        return jsonify({'error': 'Failed to get ingestion job'}), 500
+
+
 @main_bp.route('/clear_current_chat_history', methods=['POST'])
 def clear_current_chat_history():
     """清除本轮对话的历史(缓存)"""
@@ -149,11 +212,34 @@ def health_check():
     """健康检查接口"""
     # 从各自的管理器检查依赖健康状况
     redis_status = "healthy" if session_manager.ping() else "unhealthy"
+    mysql_manager = get_container().mysql_session_manager
+    persister = get_container().session_persister
+    embedding_cache = get_container().embedding_cache
+    mysql_status = "healthy" if mysql_manager.ping() else "unhealthy"
     return {
         'status': 'healthy',
         'dependencies': {
             'redis': redis_status,
-        }
+            'mysql': {
+                'status': mysql_status,
+                'pool': mysql_manager.get_pool_stats(),
+            },
+        },
+        'worker': get_container().construction_counts(),
+        'session_persister': persister.get_stats() if persister else None,
+        'agent_cache': get_container().chat_service.get_agent_cache_stats(),
+        'vectorstore_cache': get_container().vector_db_manager.get_cache_stats(),
+        'embedding_cache': embedding_cache.get_stats() if embedding_cache else None,
+        'document_registry': get_container().vector_db_manager.get_registry_stats(),
+        'retrieval': get_container().vector_db_manager.get_retrieval_stats(),
+        'query_cache': get_container().vector_db_manager.get_query_cache_stats(),
+        'embedding_executor': get_container().vector_db_manager.embedding_executor.get_stats(),
+        'ocr': get_container().ocr_service.get_stats(),
+        'image_description': get_container().chat_service.get_image_stats(),
+        'conversation_memory': get_container().conversation_memory.get_stats(),
+        'tool_execution': get_tool_execution_stats(),
+        'web_fetch': get_page_fetcher().get_stats(),
+        'web_cache': get_web_cache_stats()
     }, 200
 
 
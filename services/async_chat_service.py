@@ -0,0 +1,40 @@
+# services/async_chat_service.py
+import asyncio
+
+from services.chat_service import ChatService, current_session_id
+from utils.session_storage import AsyncRedisSessionManager
+
+
+class AsyncChatService:
+    """
+    ChatService 的异步版本，供 asgi.py 的异步服务模式使用。
+    等待 LLM、Tavily、网页抓取和 Redis 时不占用线程，一个 worker 可以同时承载大量对话。
+    智能体的构建逻辑与同步版本共用。
+    """
+
+    def __init__(self, chat_service: ChatService, session_manager: AsyncRedisSessionManager):
+        self.chat_service = chat_service
+        self.session_manager = session_manager
+
+    async def handle_chat(self, user_message, user_system_prompt, session_id):
+        # 获取历史对话
+        session = await self.session_manager.get_session_history(session_id)
+        # 获取（缓存的）智能体；判断会话是否有文档可能查询向量库，放到线程中执行
+        agent = await asyncio.to_thread(self.chat_service._get_agent, session_id)
+        # 截取历史时可能读取 Redis / MySQL 中的摘要，放到线程中执行
+        inputs = await asyncio.to_thread(self.chat_service._agent_inputs, user_message, user_system_prompt,
+                                         session, session_id)
+        # 调用智能体，工具调用走各工具的 coroutine 实现；会话 ID 只在当前任务的上下文中生效
+        token = current_session_id.set(session_id)
+        try:
+            res = await agent.ainvoke(inputs)
+        finally:
+            current_session_id.reset(token)
+        # 更新历史对话
+        ai_response = res.get('output', '')
+        final_session_messages, new_messages = self.chat_service._append_turn(session, user_message, ai_response)
+        await self.session_manager.save_session_turn(session_id, final_session_messages, new_messages)
+        # 摘要相关的状态检查同样可能访问 Redis / MySQL
+        await asyncio.to_thread(self.chat_service.memory.after_turn, session_id, final_session_messages)
+
+        return ai_response
@@ -1,147 +1,399 @@
 # services/chat_service.py
 import base64
+import contextvars
 import datetime
-import os
+import functools
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict, Counter
+
+from flask import current_app
 from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.tools import tool
-from langchain.memory import ConversationBufferMemory
 from models.vector_db_manager import VectorDBManager
 from models.llm_factory import get_llm, get_vision_llm
-from utils.file_util import allowed_file, allowed_image, save_temp_file, remove_temp_file, process_file, get_image_desc
+from utils.file_util import allowed_file, allowed_image, get_image_desc, format_ocr_text
+from utils.image_util import prepare_image, image_cache_key, RedisImageDescriptionCache
 from utils.web_utils import web_search, crawl_url_content,fetch_url_content
 from utils.session_storage import RedisSessionManager
 from models.prompts import AGENT_SYSTEM_PROMPT
+from services.streaming import QueueCallbackHandler, STREAM_END
+from services.ingestion_service import IngestionService
+from services.ocr_service import OCRService
+from services.conversation_memory import ConversationMemory
+from services.parallel_agent import ParallelAgentExecutor
+from utils.token_utils import count_tokens
+
+# 当前正在处理的会话 ID。智能体在进程内按工具集缓存、被所有会话共享，
+# 向量数据库工具在调用时从这里读取会话 ID，而不是在构建时绑定
+current_session_id = contextvars.ContextVar('current_session_id')
+
+# 系统提示词模板的指纹，作为智能体缓存键的一部分
+AGENT_SYSTEM_PROMPT_HASH = hashlib.sha256(AGENT_SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:16]
 
 
 class ChatService:
-    def __init__(self, session_manager: RedisSessionManager, vector_db_manager: VectorDBManager):
+    def __init__(self, session_manager: RedisSessionManager, vector_db_manager: VectorDBManager,
+                 agent_cache_size: int = 16, ingestion_service: IngestionService = None,
+                 ocr_service: OCRService = None, image_desc_cache: RedisImageDescriptionCache = None,
+                 memory: ConversationMemory = None):
         self.session_manager = session_manager
+        # 每轮对话带给智能体的历史消息，默认带上完整历史
+        self.memory = memory or ConversationMemory(session_manager)
         self.vector_db_manager = vector_db_manager
+        self.ingestion_service = ingestion_service
+        self.ocr_service = ocr_service
+        # 视觉模型的图片描述缓存，为 None 时每次都调用视觉模型
+        self.image_desc_cache = image_desc_cache
+        self.image_stats = Counter()
+        self._image_stats_lock = threading.Lock()
         self.default_tools = [web_search, crawl_url_content,fetch_url_content]
 
+        # 查询向量数据库工具
+        @tool
+        def query_vectorstore_with_session_id(query: str):
+            """
+            Query the vectorstore with the given query
+            : param query: 必要参数，字符串类型，用于表示要查询向量数据库的具体相关的内容
+            : return res: 查询数据库获得的具体内容，可能查询失败，返回“并没有查询到相关的内容”，否则，返回最佳匹配的三个“文档”，并拼接在一起
+            """
+            return self.vector_db_manager.query_vectorstore(query=query, session_id=current_session_id.get())
+
+        self.vectorstore_tool = query_vectorstore_with_session_id
+
+        # 预先构建好的智能体：(工具集, 系统提示词指纹, 模型) -> AgentExecutor，按 LRU 淘汰
+        self.agent_cache_size = agent_cache_size
+        self._agent_cache = OrderedDict()
+        self._agent_cache_lock = threading.Lock()
+        self.agent_cache_stats = Counter()
+
     def handle_chat(self, user_message, user_system_prompt, session_id):
         # 获取历史对话
         session = self.session_manager.get_session_history(session_id)
-        self.session_manager.print_session_history(session_id)
-        # _get_agent 需要访问 self.vector_db_manager
-        # 构建智能体
-        agent = self._get_agent(session_id, user_system_prompt, session)
+        self.session_manager.print_session_history(session_id, session)
+        # 获取（缓存的）智能体，会话相关的内容在调用时传入
+        agent = self._get_agent(session_id)
         # 调用智能体
-        res = agent.invoke({'input': user_message, "chat_history": session})
+        res = self._invoke_agent(agent, session_id,
+                                 self._agent_inputs(user_message, user_system_prompt, session, session_id))
         # 更新历史对话
         ai_response = res.get('output', '')
-        final_session_messages = agent.memory.chat_memory.messages
-        self.session_manager.set_session_history(session_id, final_session_messages)
-        self.session_manager.sync_session_to_mysql(session_id)
+        final_session_messages, new_messages = self._append_turn(session, user_message, ai_response)
+        self.session_manager.save_session_turn(session_id, final_session_messages, new_messages)
+        self.memory.after_turn(session_id, final_session_messages)
 
         return ai_response
 
+    def handle_chat_stream(self, user_message, user_system_prompt, session_id):
+        """
+        handle_chat 的流式版本：返回一个事件生成器，依次产出 token / tool_start / tool_end 事件，最后是 done 或 error。
+        智能体在后台线程中运行，会话历史在对话完成后照常保存（客户端中途断开也会保存）。
+        """
+        app = current_app._get_current_object()
+        # 读取历史、构建智能体在返回生成器之前完成，出错时可以直接返回错误响应
+        session = self.session_manager.get_session_history(session_id)
+        self.session_manager.print_session_history(session_id, session)
+        agent = self._get_agent(session_id)
+        inputs = self._agent_inputs(user_message, user_system_prompt, session, session_id)
+
+        events = queue.Queue()
+        handler = QueueCallbackHandler(events)
+
+        def run_agent():
+            with app.app_context():
+                try:
+                    res = self._invoke_agent(agent, session_id, inputs, config={'callbacks': [handler]})
+                    ai_response = res.get('output', '')
+                    final_session_messages, new_messages = self._append_turn(session, user_message, ai_response)
+                    self.session_manager.save_session_turn(session_id, final_session_messages, new_messages)
+                    self.memory.after_turn(session_id, final_session_messages)
+                    events.put({'type': 'done', 'response': ai_response, 'session_id': session_id})
+                except Exception as e:
+                    app.logger.error(f"Error in streaming chat for session {session_id}: {e}")
+                    events.put({'type': 'error', 'error': 'Failed to process chat request'})
+                finally:
+                    events.put(STREAM_END)
+
+        threading.Thread(target=run_agent, name=f'chat-stream-{session_id}', daemon=True).start()
+
+        def event_stream():
+            while True:
+                event = events.get()
+                if event is STREAM_END:
+                    return
+                yield event
+
+        return event_stream()
+
     def handle_chat_with_image(self, image_file, user_message, user_system_prompt, session_id):
         if not allowed_image(image_file.filename):
             raise ValueError('File type not allowed')
 
-        filepath = save_temp_file(image_file)
-        try:
-            # 读取图片并编码为 base64
-            with open(filepath, "rb") as img_file:
-                img_data = base64.b64encode(img_file.read()).decode('utf-8')
+        # 直接从上传流中读取图片，不经过临时文件
+        image_file.stream.seek(0)
+        img_bytes = image_file.stream.read()
 
-            # 对用户上传的图片进行提取文字和描述的预处理，并将其加入至上下文中
-            image_description = ("本轮对话中提及一张图片，关于这张图片的描述如下所示，包括但不限于图片中的文字：\n\n"
-                                 + get_image_desc(get_vision_llm(), img_data))
+        # 对用户上传的图片进行提取文字和描述的预处理，并将其加入至上下文中
+        image_description = self._describe_image(img_bytes, image_file.filename)
 
-            user_system_prompt = image_description + "\n\n" + user_system_prompt
+        user_system_prompt = image_description + "\n\n" + user_system_prompt
 
-            self.session_manager.print_session_history(session_id)
-            session = self.session_manager.get_session_history(session_id)
-            agent = self._get_agent(session_id, user_system_prompt, session)
-            res = agent.invoke({"input": user_message})
-            ai_response = res.get("output", "")
+        session = self.session_manager.get_session_history(session_id)
+        self.session_manager.print_session_history(session_id, session)
+        agent = self._get_agent(session_id)
+        res = self._invoke_agent(agent, session_id,
+                                 self._agent_inputs(user_message, user_system_prompt, session, session_id))
+        ai_response = res.get("output", "")
 
-            # 将本次对话记录添加到会话历史中
-            session.append(AIMessage(content=ai_response))
-            self.session_manager.set_session_history(session_id, session)
-            self.session_manager.sync_session_to_mysql(session_id)
+        # 将本次对话记录添加到会话历史中
+        final_session_messages, new_messages = self._append_turn(session, user_message, ai_response)
+        self.session_manager.save_session_turn(session_id, final_session_messages, new_messages)
+        self.memory.after_turn(session_id, final_session_messages)
 
-            return ai_response
-        finally:
-            remove_temp_file(filepath)
+        return ai_response
 
-    def handle_chat_with_file(self, uploaded_file, user_message, user_system_prompt, session_id):
-        if not allowed_file(uploaded_file.filename):
-            raise ValueError('File type not allowed')
+    def _describe_image(self, img_bytes: bytes, file_name: str):
+        """
+        图片的描述，按 IMAGE_OCR_MODE 使用本地 OCR：
+        - prefer：先 OCR，识别出的文字不少于 OCR_MIN_TEXT_CHARS 个字符时不再调用视觉模型；
+        - assist：OCR 与视觉模型同时进行，识别出的文字附加在视觉模型的描述之后；
+        - off（或没有 OCR 服务）：只调用视觉模型。
+        OCR 失败、排队已满或超过 OCR_TIMEOUT 秒时按没有识别结果处理。
+        """
+        mode = current_app.config.get('IMAGE_OCR_MODE', 'off') if self.ocr_service is not None else 'off'
+        timeout = current_app.config.get('OCR_TIMEOUT', 10)
+        ocr_future = None
+        if mode in ('assist', 'prefer'):
+            try:
+                ocr_future = self.ocr_service.submit(img_bytes)
+            except Exception as e:
+                current_app.logger.warning(f"Skipping OCR for {file_name}: {e}")
+
+        ocr_results = None
+        if mode == 'prefer' and ocr_future is not None:
+            ocr_results = self._ocr_results(ocr_future, timeout)
+            if ocr_results and len(''.join(ocr_results)) >= current_app.config.get('OCR_MIN_TEXT_CHARS', 20):
+                return "本轮对话中提及一张图片，图片以文字为主，其中的文字如下所示：\n\n" + format_ocr_text(file_name, ocr_results)
 
-        filepath = save_temp_file(uploaded_file)
+        image_description = ("本轮对话中提及一张图片，关于这张图片的描述如下所示，包括但不限于图片中的文字：\n\n"
+                             + self._vision_description(img_bytes))
+        if mode == 'assist' and ocr_future is not None:
+            ocr_results = self._ocr_results(ocr_future, timeout)
+        if ocr_results:
+            image_description += "\n\n" + format_ocr_text(file_name, ocr_results)
+        return image_description
+
+    def _vision_description(self, img_bytes: bytes):
+        """
+        视觉模型对图片的描述。相同的图片（按内容哈希）直接使用缓存的描述；
+        调用视觉模型前把图片缩小到长边不超过 IMAGE_MAX_SIDE 并重新压缩，减少上传大小和图片 token。
+        """
+        max_side = current_app.config.get('IMAGE_MAX_SIDE', 1536)
+        quality = current_app.config.get('IMAGE_JPEG_QUALITY', 85)
+        key = image_cache_key(img_bytes, current_app.config.get('VISION_MODEL_NAME'), max_side, quality)
+        if self.image_desc_cache is not None:
+            try:
+                cached = self.image_desc_cache.get(key)
+            except Exception as e:
+                current_app.logger.warning(f"Failed to read image description cache: {e}")
+                cached = None
+            if cached is not None:
+                self._count_image('hits')
+                return cached
+            self._count_image('misses')
+
+        prepared, mime_type = prepare_image(img_bytes, max_side=max_side, quality=quality)
+        self._count_image('bytes_original', len(img_bytes))
+        self._count_image('bytes_sent', len(prepared))
+        # 编码为 base64
+        img_data = base64.b64encode(prepared).decode('utf-8')
+        description = get_image_desc(get_vision_llm(), img_data, mime_type)
+
+        if self.image_desc_cache is not None:
+            try:
+                self.image_desc_cache.set(key, description)
+            except Exception as e:
+                current_app.logger.warning(f"Failed to write image description cache: {e}")
+        return description
+
+    def _count_image(self, key: str, value: int = 1):
+        with self._image_stats_lock:
+            self.image_stats[key] += value
+
+    def get_image_stats(self):
+        with self._image_stats_lock:
+            lookups = self.image_stats['hits'] + self.image_stats['misses']
+            return {
+                'hits': self.image_stats['hits'],
+                'misses': self.image_stats['misses'],
+                'hit_rate': round(self.image_stats['hits'] / lookups, 4) if lookups else None,
+                'bytes_original': self.image_stats['bytes_original'],
+                'bytes_sent': self.image_stats['bytes_sent'],
+                'bytes_saved': self.image_stats['bytes_original'] - self.image_stats['bytes_sent'],
+            }
+
+    @staticmethod
+    def _ocr_results(ocr_future, timeout):
         try:
-            file_content = process_file(filepath)
-            filename = uploaded_file.filename
+            return ocr_future.result(timeout)
+        except Exception as e:
+            # 超时的请求如果还没开始执行，就不再执行
+            ocr_future.cancel()
+            current_app.logger.warning(f"OCR failed or timed out: {e!r}")
+            return None
+
+    def handle_chat_with_file(self, uploaded_file, user_message, user_system_prompt, session_id, wait_timeout=None):
+        """
+        文件交给入库任务在后台处理，最多等待 wait_timeout 秒后开始对话：
+        处理完成时与原来的行为一致；仍未完成时基于已写入的部分先行回答，并在提示词中说明处理进度。
+        返回 (回答, 入库任务状态)。
+        """
+        if not allowed_file(uploaded_file.filename):
+            raise ValueError('File type not allowed')
 
-            # 生成向量数据库
-            self.vector_db_manager.generate_embeddings(filename, file_content, session_id)
+        job = self.ingestion_service.submit(uploaded_file, session_id)
+        job = self.ingestion_service.wait(job['job_id'], wait_timeout)
+        if job['status'] == 'failed':
+            # 解析失败属于文件本身的问题，与原来 process_file 抛出的异常一致
+            if job['stage'] == 'parse':
+                raise ValueError(job['error'])
+            raise RuntimeError(f"Failed to ingest {job['file_name']}: {job['error']}")
+        if job['status'] != 'completed':
+            user_system_prompt = (
+                f"用户在本轮上传的文件《{job['file_name']}》仍在后台处理中"
+                f"（当前阶段：{job['stage'] or 'queued'}，已写入 {job['chunks_done']}/{job['chunks_total'] or '?'} 个分片），"
+                "查询向量数据库只能检索到已经处理的部分，回答时请说明这一点，并提示用户稍后可以继续追问。\n\n"
+                + user_system_prompt)
 
-            self.session_manager.print_session_history(session_id)
-            session = self.session_manager.get_session_history(session_id)
-            agent = self._get_agent(session_id, user_system_prompt, session)
-            res = agent.invoke({'input': user_message})
-            ai_response = res.get('output', '')
+        session = self.session_manager.get_session_history(session_id)
+        self.session_manager.print_session_history(session_id, session)
+        agent = self._get_agent(session_id)
+        res = self._invoke_agent(agent, session_id,
+                                 self._agent_inputs(user_message, user_system_prompt, session, session_id))
+        ai_response = res.get('output', '')
 
-            # 保存更新后的会话历史到 Redis
-            final_session_messages = agent.memory.chat_memory.messages
-            self.session_manager.set_session_history(session_id, final_session_messages)
-            self.session_manager.sync_session_to_mysql(session_id)
+        # 保存更新后的会话历史到 Redis
+        final_session_messages, new_messages = self._append_turn(session, user_message, ai_response)
+        self.session_manager.save_session_turn(session_id, final_session_messages, new_messages)
+        self.memory.after_turn(session_id, final_session_messages)
 
-            return ai_response
-        finally:
-            remove_temp_file(filepath)
+        return ai_response, job
 
     def clear_session_history(self, session_id):
         self.session_manager.clear_session_history(session_id)
         # 同时清理相关的向量数据库
         self.vector_db_manager.clear_vector_db(session_id)
 
-    def _get_agent(self, session_id: str, user_system_prompt: str, session: list):
+    def _agent_inputs(self, user_message: str, user_system_prompt: str, session: list, session_id: str):
+        """
+        构造智能体的输入：用户提示词、当前时间和历史对话都在调用时注入。
+        历史对话由 memory 按 token 预算截取，并记录本轮开始时的提示词大小（不含工具调用的中间结果）。
+        """
+        history, history_tokens = self.memory.build_history(session_id, session)
+        prompt_tokens = (self._system_prompt_tokens() + count_tokens(user_system_prompt) + history_tokens
+                         + count_tokens(user_message))
+        self.memory.record_turn(session_id, prompt_tokens, len(history), len(session))
+        return {
+            'input': user_message,
+            'chat_history': history,
+            'user_system_prompt': user_system_prompt,
+            # 获取当前系统时间
+            'current_time': datetime.datetime.now().strftime("%Y-%m-%d %H"),
+        }
 
-        # 查询向量数据库工具
-        @tool
-        def query_vectorstore_with_session_id(query: str):
-            """
-            Query the vectorstore with the given query
-            : param query: 必要参数，字符串类型，用于表示要查询向量数据库的具体相关的内容
-            : return res: 查询数据库获得的具体内容，可能查询失败，返回“并没有查询到相关的内容”，否则，返回最佳匹配的三个“文档”，并拼接在一起
-            """
-            return self.vector_db_manager.query_vectorstore(query=query, session_id=session_id)
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _system_prompt_tokens():
+        """系统提示词模板的 token 数，首次使用时计算（tiktoken 首次使用可能需要下载词表）"""
+        return count_tokens(AGENT_SYSTEM_PROMPT)
+
+    @staticmethod
+    def _append_turn(session: list, user_message: str, ai_response: str):
+        """返回追加本轮问答后的完整历史，以及本轮新增的消息"""
+        new_messages = [HumanMessage(content=user_message), AIMessage(content=ai_response)]
+        return session + new_messages, new_messages
 
-        vector_db_dir = os.path.join(self.vector_db_manager.get_embeddings_path(), session_id)
-        # 可使用的工具的配置
+    @staticmethod
+    def _invoke_agent(agent: AgentExecutor, session_id: str, inputs: dict, config=None):
+        """在当前会话的上下文中调用智能体"""
+        token = current_session_id.set(session_id)
+        try:
+            return agent.invoke(inputs, config=config)
+        finally:
+            current_session_id.reset(token)
+
+    def _get_tools(self, session_id: str):
+        """当前会话可使用的工具：上传过文件的会话额外提供向量数据库查询工具"""
         tools = list(self.default_tools)
-        if os.path.exists(vector_db_dir):
-            tools = tools.append(query_vectorstore_with_session_id)
+        if self.vector_db_manager.has_vector_db(session_id):
+            tools.append(self.vectorstore_tool)
+        return tools
 
-        # 记忆的配置
-        current_memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-        current_memory.chat_memory.messages = session
+    def _get_agent(self, session_id: str):
+        """
+        获取当前会话使用的智能体。
+        智能体只取决于工具集、系统提示词模板和模型，按 (工具集, 提示词指纹, 模型) 缓存复用，
+        会话历史、用户提示词和当前时间都在调用时通过输入注入。
+        """
+        tools = self._get_tools(session_id)
+        key = (
+            tuple(t.name for t in tools),
+            AGENT_SYSTEM_PROMPT_HASH,
+            current_app.config.get('LLM_MODEL_NAME'),
+            current_app.config.get('LLM_BASE_URL'),
+        )
 
-        # 获取当前系统时间
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H")
+        with self._agent_cache_lock:
+            agent = self._agent_cache.get(key)
+            if agent is not None:
+                self._agent_cache.move_to_end(key)
+                self.agent_cache_stats['hits'] += 1
+                return agent
 
+        start = time.perf_counter()
+        agent = self._build_agent(tools)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        with self._agent_cache_lock:
+            # 并发构建时以先放入缓存的为准
+            agent = self._agent_cache.setdefault(key, agent)
+            self._agent_cache.move_to_end(key)
+            while len(self._agent_cache) > self.agent_cache_size:
+                self._agent_cache.popitem(last=False)
+            self.agent_cache_stats['misses'] += 1
+        current_app.logger.info(f"Built agent for tools {key[0]} in {build_ms:.1f} ms")
+        return agent
+
+    @staticmethod
+    def _build_agent(tools: list):
+        """构建智能体：提示词模板中的用户提示词、当前时间和历史对话均为调用时填充的变量"""
         # 提示词工程
         prompt = ChatPromptTemplate.from_messages([
-            ("system", user_system_prompt),
-            ("system", AGENT_SYSTEM_PROMPT.format(current_time=current_time)),
+            ("system", "{user_system_prompt}"),
+            ("system", AGENT_SYSTEM_PROMPT),
             ("placeholder", "{chat_history}"),
             ("human", "{input}"),
             ("placeholder", "{agent_scratchpad}"),
         ])
 
         agent = create_tool_calling_agent(get_llm(), tools, prompt)
-        return AgentExecutor(
+        # 模型在同一步中请求的多个工具调用并发执行
+        return ParallelAgentExecutor(
             agent=agent,
             tools=tools,
             verbose=True,
-            memory=current_memory,
             handle_parsing_errors=True,
             max_iterations=5,
             max_execution_time=30,
+            tool_timeout=current_app.config.get('TOOL_TIMEOUT', 20),
+            tool_timeouts=current_app.config.get('TOOL_TIMEOUTS', {}),
+            max_tool_workers=current_app.config.get('TOOL_MAX_WORKERS', 8),
         )
+
+    def get_agent_cache_stats(self):
+        with self._agent_cache_lock:
+            return {'size': len(self._agent_cache), **self.agent_cache_stats}
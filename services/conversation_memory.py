@@ -0,0 +1,193 @@
+# services/conversation_memory.py
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from models.llm_factory import get_llm
+from models.prompts import CONVERSATION_SUMMARY_PROMPT
+from utils.token_utils import count_tokens
+
+# 每条消息在对话格式中的额外开销（角色、分隔符等），按 token 估算
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_tokens(message) -> int:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def get_conversation_summary_chain(llm):
+    """把新增对话合并进滚动摘要的链"""
+    prompt = ChatPromptTemplate.from_messages([
+        ('system', CONVERSATION_SUMMARY_PROMPT),
+        ('human', '此前的摘要：\n{summary}\n\n新增的对话：\n{conversation}')
+    ])
+    return prompt | llm | StrOutputParser()
+
+
+class ConversationMemory:
+    """
+    决定每轮对话带给智能体的历史消息：
+    - buffer 模式：带上完整的会话历史（原来的行为）；
+    - summary 模式：最近的消息在 max_tokens 的预算内原样保留，更早的消息折叠进滚动摘要。
+      摘要与会话一起保存在 Redis 和 MySQL 中，记录覆盖了会话开头的多少条消息；
+      每轮对话结束后若未摘要部分超出预算，在后台线程中把较早的消息增量合并进摘要，
+      一次合并到只剩约一半预算，避免每轮都调用 LLM。
+    """
+
+    def __init__(self, session_manager, mode: str = 'buffer', max_tokens: int = 3000,
+                 summary_max_tokens: int = 500, workers: int = 2):
+        self.session_manager = session_manager
+        self.mode = mode
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='memory-summary')
+        # 正在合并摘要的会话，同一会话同时只有一个合并任务
+        self._folding = set()
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def build_history(self, session_id: str, session: list):
+        """返回 (带给智能体的历史消息, 历史部分的 token 数)"""
+        if self.mode != 'summary':
+            return session, sum(message_tokens(message) for message in session)
+
+        summary, covered = '', 0
+        try:
+            record = self.session_manager.get_session_summary(session_id)
+        except Exception as e:
+            current_app.logger.warning(f"Failed to load conversation summary for {session_id}: {e}")
+            record = None
+        # 摘要覆盖的消息比会话还多，说明会话已被清除后重新开始，摘要已经过期
+        if record and record['covered'] <= len(session):
+            summary, covered = record['summary'], record['covered']
+
+        summary_message = [SystemMessage(content=f"此前对话的摘要：\n{summary}")] if summary else []
+        summary_tokens = sum(message_tokens(message) for message in summary_message)
+        recent, recent_tokens = self._recent(session[covered:], self.max_tokens - summary_tokens)
+        dropped = len(session) - covered - len(recent)
+        if dropped:
+            # 摘要尚未跟上（合并任务还在进行或失败），超出预算的消息本轮不带上
+            self._count('dropped_messages', dropped)
+        return summary_message + recent, summary_tokens + recent_tokens
+
+    @staticmethod
+    def _recent(messages: list, budget: int):
+        """从最新的消息往前取，总 token 数不超过 budget；结果以用户消息开头，保证问答成对"""
+        used, start = 0, len(messages)
+        for index in range(len(messages) - 1, -1, -1):
+            tokens = message_tokens(messages[index])
+            if used + tokens > budget:
+                break
+            used += tokens
+            start = index
+        while start < len(messages) and not isinstance(messages[start], HumanMessage):
+            used -= message_tokens(messages[start])
+            start += 1
+        return messages[start:], used
+
+    def record_turn(self, session_id: str, prompt_tokens: int, history_messages: int, session_messages: int):
+        """记录一轮对话开始时的提示词大小"""
+        with self._lock:
+            self._stats['turns'] += 1
+            self._stats['prompt_tokens'] += prompt_tokens
+            self._stats['max_prompt_tokens'] = max(self._stats['max_prompt_tokens'], prompt_tokens)
+        current_app.logger.info(f"Session {session_id} prompt: {prompt_tokens} tokens, "
+                                f"{history_messages}/{session_messages} history messages ({self.mode} memory)")
+
+    def after_turn(self, session_id: str, session: list):
+        """一轮对话保存之后调用：未摘要部分超出预算时，在后台合并较早的消息"""
+        if self.mode != 'summary':
+            return
+        with self._lock:
+            if session_id in self._folding:
+                return
+            self._folding.add(session_id)
+        app = current_app._get_current_object()
+        try:
+            self._executor.submit(self._fold, app, session_id, list(session))
+        except RuntimeError:
+            # 进程退出时执行器已关闭
+            with self._lock:
+                self._folding.discard(session_id)
+
+    def _fold(self, app, session_id: str, session: list):
+        with app.app_context():
+            try:
+                record = self.session_manager.get_session_summary(session_id)
+                summary, covered = '', 0
+                if record and record['covered'] <= len(session):
+                    summary, covered = record['summary'], record['covered']
+                pending = session[covered:]
+                if count_tokens(summary) + sum(message_tokens(message) for message in pending) <= self.max_tokens:
+                    return
+
+                keep, _ = self._recent(pending, self.max_tokens // 2)
+                cutoff = len(session) - len(keep)
+                if cutoff <= covered:
+                    return
+                conversation = "\n".join(
+                    f"{'用户' if isinstance(message, HumanMessage) else '助手'}：{message.content}"
+                    for message in session[covered:cutoff])
+
+                started = time.perf_counter()
+                chain = get_conversation_summary_chain(get_llm())
+                summary = chain.invoke({'summary': summary or '（无）', 'conversation': conversation,
+                                        'max_tokens': self.summary_max_tokens})
+                if not summary.strip():
+                    raise ValueError('LLM returned an empty summary')
+                if not self._unchanged(session_id, session[:cutoff]):
+                    # 合并期间会话被清除（或清除后重新开始），摘要已经过期，不再写入
+                    self._count('stale_folds')
+                    app.logger.info(f"Session {session_id} was cleared while folding, summary discarded")
+                    return
+                self.session_manager.set_session_summary(session_id, summary, cutoff)
+                self._count('folds')
+                self._count('folded_messages', cutoff - covered)
+                self._count('fold_ms', int((time.perf_counter() - started) * 1000))
+                app.logger.info(f"Folded messages {covered}-{cutoff} of session {session_id} into summary "
+                                f"({count_tokens(summary)} tokens)")
+            except Exception as e:
+                self._count('fold_failures')
+                app.logger.error(f"Failed to update conversation summary for {session_id}: {e}")
+            finally:
+                with self._lock:
+                    self._folding.discard(session_id)
+
+    def _unchanged(self, session_id: str, folded: list) -> bool:
+        """会话当前的开头部分是否仍是被合并的这些消息"""
+        current = self.session_manager.get_session_history(session_id)
+        if len(current) < len(folded):
+            return False
+        return all(type(old) is type(new) and old.content == new.content for old, new in zip(folded, current))
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self._stats[key] += value
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self):
+        with self._lock:
+            turns, folds = self._stats['turns'], self._stats['folds']
+            return {
+                'mode': self.mode,
+                'max_tokens': self.max_tokens,
+                'turns': turns,
+                'avg_prompt_tokens': round(self._stats['prompt_tokens'] / turns, 1) if turns else None,
+                'max_prompt_tokens': self._stats['max_prompt_tokens'],
+                'folds': folds,
+                'folded_messages': self._stats['folded_messages'],
+                'fold_failures': self._stats['fold_failures'],
+                'stale_folds': self._stats['stale_folds'],
+                'avg_fold_ms': round(self._stats['fold_ms'] / folds, 1) if folds else None,
+                'dropped_messages': self._stats['dropped_messages'],
+                'folding': len(self._folding),
+            }
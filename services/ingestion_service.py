@@ -0,0 +1,177 @@
+# services/ingestion_service.py
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from models.vector_db_manager import VectorDBManager
+from utils.file_util import spool_upload, iter_file_sections, file_sha256
+from utils.session_storage import RedisSessionManager
+
+# 文档入库经过的阶段；解析、分片与 embedding 以流水线方式进行，首批分片开始计算 embedding 时进入 embed 阶段
+INGEST_STAGES = ('parse', 'embed', 'summarize', 'persist')
+
+
+class IngestionService:
+    """
+    文档入库任务：上传的文件复制到内存（较大的文件写入匿名临时文件）后立即返回任务 ID，由后台线程池完成解析、摘要、分片、embedding 和写入。
+    任务状态保存在本进程内存中并同步写入 Redis（ingest_job:{job_id}），其他 worker 进程也可以查询。
+    embedding 分批写入向量数据库，任务完成前已写入的分片即可被检索到。
+    """
+
+    def __init__(self, app, vector_db_manager: VectorDBManager, session_manager: RedisSessionManager,
+                 max_workers: int = 4, job_ttl: int = 86400):
+        self.app = app
+        self.vector_db_manager = vector_db_manager
+        self.session_manager = session_manager
+        self.job_ttl = job_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest')
+        # job_id -> (任务状态, 完成事件)，只保存本进程提交的任务
+        self._jobs = {}
+        # 任务状态会被工作线程修改、被请求线程读取，读写都在锁内进行
+        self._lock = threading.RLock()
+
+    def submit(self, uploaded_file, session_id: str):
+        """提交一个上传文件的入库任务，返回任务状态"""
+        self.forget_finished()
+        job_id = uuid.uuid4().hex
+        file_name = uploaded_file.filename
+        file_hash = file_sha256(uploaded_file)
+        job = {
+            'job_id': job_id,
+            'session_id': session_id,
+            'file_name': file_name,
+            'status': 'queued',
+            'stage': None,
+            'stages': {stage: {'status': 'pending'} for stage in INGEST_STAGES},
+            'chunks_total': None,
+            'chunks_done': 0,
+            'error': None,
+            'created_at': time.time(),
+            'finished_at': None,
+        }
+        done = threading.Event()
+        with self._lock:
+            self._jobs[job_id] = (job, done)
+
+        try:
+            # 相同内容的文件已经处理过时直接复用，不再进入队列
+            if self.vector_db_manager.attach_registered_document(file_name, file_hash, session_id):
+                for stage in INGEST_STAGES:
+                    job['stages'][stage] = {'status': 'skipped'}
+                self._finish(job, done, 'completed')
+                return self.get_job(job_id)
+
+            upload = spool_upload(uploaded_file)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            raise
+        self._save(job)
+        self._executor.submit(self._run, job, done, upload, file_hash)
+        return self.get_job(job_id)
+
+    def _run(self, job: dict, done: threading.Event, upload, file_hash: str):
+        with self.app.app_context():
+            with self._lock:
+                job['status'] = 'running'
+            parse_failed = []
+
+            def sections():
+                # 解析与后续阶段交错进行，解析出错时仍记为 parse 阶段失败
+                try:
+                    yield from iter_file_sections(upload, file_name=job['file_name'])
+                except Exception:
+                    parse_failed.append(True)
+                    raise
+
+            try:
+                self._enter_stage(job, 'parse')
+                self.vector_db_manager.generate_embeddings(
+                    job['file_name'], sections(), job['session_id'], file_hash=file_hash,
+                    progress=lambda stage, **info: self._report(job, stage, **info))
+                self._finish(job, done, 'completed')
+            except Exception as e:
+                with self._lock:
+                    if parse_failed:
+                        job['stage'] = 'parse'
+                    if job['stage']:
+                        job['stages'][job['stage']]['status'] = 'failed'
+                    job['error'] = str(e)
+                self.app.logger.error(f"Ingestion job {job['job_id']} failed at stage {job['stage']}: {e}")
+                self._finish(job, done, 'failed')
+            finally:
+                upload.close()
+
+    def _report(self, job: dict, stage: str, done: int = None, total: int = None):
+        """generate_embeddings 的进度回调"""
+        with self._lock:
+            if stage != job['stage']:
+                self._enter_stage(job, stage)
+            if total is not None:
+                job['chunks_total'] = total
+                job['stages'][stage]['total'] = total
+            if done is not None:
+                job['chunks_done'] = done
+                job['stages'][stage]['done'] = done
+        self._save(job)
+
+    def _enter_stage(self, job: dict, stage: str):
+        now = time.time()
+        with self._lock:
+            previous = job['stage']
+            if previous:
+                job['stages'][previous]['status'] = 'completed'
+                job['stages'][previous]['elapsed'] = round(now - job['stages'][previous]['started_at'], 3)
+            job['stage'] = stage
+            job['stages'][stage] = {'status': 'running', 'started_at': now}
+        self._save(job)
+
+    def _finish(self, job: dict, done: threading.Event, status: str):
+        with self._lock:
+            if status == 'completed' and job['stage']:
+                stage = job['stages'][job['stage']]
+                stage['status'] = 'completed'
+                stage['elapsed'] = round(time.time() - stage['started_at'], 3)
+            job['status'] = status
+            job['finished_at'] = time.time()
+        self._save(job)
+        done.set()
+
+    def _save(self, job: dict):
+        with self._lock:
+            data = json.dumps(job, ensure_ascii=False)
+        try:
+            self.session_manager._get_redis_client().set(f"ingest_job:{job['job_id']}", data, ex=self.job_ttl)
+        except Exception as e:
+            # Redis 不可用时本进程仍可查询任务状态
+            self.app.logger.warning(f"Failed to save ingestion job {job['job_id']} to Redis: {e}")
+
+    def get_job(self, job_id: str):
+        """查询任务状态，本进程之外提交的任务从 Redis 读取；不存在时返回 None"""
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is not None:
+                return json.loads(json.dumps(entry[0]))
+        data = self.session_manager._get_redis_client().get(f"ingest_job:{job_id}")
+        return json.loads(data) if data else None
+
+    def wait(self, job_id: str, timeout: float):
+        """等待本进程提交的任务完成，最多 timeout 秒，返回当前的任务状态"""
+        with self._lock:
+            entry = self._jobs.get(job_id)
+        if entry is not None:
+            entry[1].wait(timeout)
+        return self.get_job(job_id)
+
+    def forget_finished(self, max_age: float = 3600):
+        """从内存中移除已经结束一段时间的任务（Redis 中的记录按 TTL 过期）"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            for job_id in [job_id for job_id, (job, _) in self._jobs.items()
+                           if job['finished_at'] and job['finished_at'] < cutoff]:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,116 @@
+# services/ocr_service.py
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# 队列中的停止标记
+_STOP = object()
+
+
+class OCRService:
+    """
+    进程内常驻的 OCR 服务：easyocr 的检测和识别模型只加载一次（首次请求时或启动预热时），
+    所有识别请求经有界队列交给专用线程串行执行，避免多个请求同时占用 CPU 和内存。
+    threads 大于 0 时设置 torch 的 CPU 线程数（进程级设置）。
+    """
+
+    def __init__(self, languages=('ch_sim', 'en'), gpu: bool = False, threads: int = 0, queue_size: int = 16):
+        self.languages = list(languages)
+        self.gpu = gpu
+        self.threads = threads
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._reader = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    def submit(self, image) -> Future:
+        """
+        提交识别请求，image 可以是文件路径或图片的二进制内容；返回 Future，结果为识别出的文本行列表。
+        队列已满时抛出 RuntimeError，调用方应跳过 OCR 而不是排队等待。
+        """
+        self._ensure_thread()
+        future = Future()
+        try:
+            self._queue.put_nowait((image, future, time.perf_counter()))
+        except queue.Full:
+            self._count('rejected')
+            raise RuntimeError('OCR queue is full')
+        return future
+
+    def recognize(self, image, timeout: float = None) -> list:
+        return self.submit(image).result(timeout)
+
+    def warm_up(self):
+        """在专用线程中加载模型并等待完成"""
+        self.submit(None).result()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='ocr', daemon=True)
+                    self._thread.start()
+
+    def _load(self):
+        if self._reader is None:
+            started = time.perf_counter()
+            if self.threads > 0:
+                import torch
+                torch.set_num_threads(self.threads)
+            import easyocr
+            self._reader = easyocr.Reader(self.languages, gpu=self.gpu)
+            logger.info(f"OCR models {self.languages} loaded in {time.perf_counter() - started:.1f}s")
+        return self._reader
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            image, future, queued_at = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                reader = self._load()
+                result = [] if image is None else reader.readtext(image, detail=0)  # detail=0 只返回文本
+            except Exception as e:
+                self._count('failed')
+                future.set_exception(e)
+                continue
+            if image is not None:
+                self._count('processed')
+                self._count('wait_ms', int((started - queued_at) * 1000))
+                self._count('ocr_ms', int((time.perf_counter() - started) * 1000))
+            future.set_result(result)
+
+    def _count(self, key: str, value: int = 1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def shutdown(self):
+        if self._thread is not None:
+            try:
+                self._queue.put_nowait(_STOP)
+            except queue.Full:
+                pass
+
+    def get_stats(self):
+        with self._stats_lock:
+            processed = self._stats['processed']
+            return {
+                'loaded': self._reader is not None,
+                'queued': self._queue.qsize(),
+                'processed': processed,
+                'failed': self._stats['failed'],
+                'rejected': self._stats['rejected'],
+                'avg_wait_ms': round(self._stats['wait_ms'] / processed, 1) if processed else None,
+                'avg_ocr_ms': round(self._stats['ocr_ms'] / processed, 1) if processed else None,
+            }
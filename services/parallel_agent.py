@@ -0,0 +1,221 @@
+# services/parallel_agent.py
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentStep
+from pydantic import Field
+
+logger = logging.getLogger(__name__)
+
+# 当前这次智能体调用的截止时间（按 max_execution_time 计算），等待工具结果时不超过它
+_deadline = contextvars.ContextVar('agent_deadline', default=None)
+# 异步模式下当前这一步中各个工具调用的起止时间
+_step_calls = contextvars.ContextVar('agent_step_calls', default=None)
+
+# 同步模式下执行工具调用的线程池，进程内所有智能体共享
+_pool = None
+_pool_lock = threading.Lock()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _get_pool(max_workers: int) -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='agent-tool')
+    return _pool
+
+
+def shutdown_pool():
+    """进程退出时关闭工具线程池，尚未开始的工具调用被取消"""
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _timeout_observation(tool_name: str) -> str:
+    return f"工具 {tool_name} 没有在限定时间内返回结果，调用已取消，请根据已有信息回答或换一种方式查询。"
+
+
+def _cancelled_observation(tool_name: str) -> str:
+    return f"工具 {tool_name} 在开始执行前被取消，请根据已有信息回答或换一种方式查询。"
+
+
+class _ToolCall:
+    """提交到线程池的一个工具调用；started 在工具真正开始执行时记录，排队等待线程的时间不计入工具超时"""
+
+    def __init__(self):
+        self.future = None
+        self.started = None
+        # 工具开始执行，或者在开始前被取消时置位
+        self.ready = threading.Event()
+
+
+def _record_step(calls: int, timeouts: int, tools_seconds: float, wall_seconds: float, cancelled: int = 0):
+    """
+    记录一步中的工具调用：各工具耗时之和即顺序执行所需的时间，与实际耗时之差为并行节省的时间。
+    timeouts 为已经开始执行但超时的调用，cancelled 为还没开始执行就被取消的调用（耗时按 0 计算）
+    """
+    saved_ms = max(0.0, (tools_seconds - wall_seconds) * 1000)
+    with _stats_lock:
+        _stats['steps'] += 1
+        _stats['tool_calls'] += calls
+        _stats['timeouts'] += timeouts
+        _stats['cancelled'] += cancelled
+        if calls > 1:
+            _stats['parallel_steps'] += 1
+            _stats['saved_ms'] += saved_ms
+    if calls > 1:
+        logger.info(f"Ran {calls} tool calls concurrently in {wall_seconds * 1000:.0f} ms "
+                    f"(sequential {tools_seconds * 1000:.0f} ms, saved {saved_ms:.0f} ms, {timeouts} timed out, "
+                    f"{cancelled} cancelled)")
+
+
+def get_tool_execution_stats():
+    with _stats_lock:
+        return {
+            'steps': _stats['steps'],
+            'tool_calls': _stats['tool_calls'],
+            'parallel_steps': _stats['parallel_steps'],
+            'timeouts': _stats['timeouts'],
+            'cancelled': _stats['cancelled'],
+            'saved_ms': round(_stats['saved_ms'], 1),
+        }
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """
+    同一步中的多个工具调用并发执行的 AgentExecutor：
+    - 同步调用（invoke）时工具调用提交到共享的有界线程池，在调用方的上下文（Flask 应用上下文、会话 ID）中执行；
+    - 异步调用（ainvoke）时沿用 AgentExecutor 的 asyncio.gather，另外为每个工具调用加上超时。
+    每个工具调用从开始执行起最多等待 tool_timeout 秒（tool_timeouts 可按工具名单独设置），在线程池中排队的时间不计入；
+    所有等待都不超过 max_execution_time 的截止时间，到期时还在排队的调用被取消。
+    超时的调用被放弃（同步模式下已经开始执行的线程无法中断，结果被丢弃），智能体收到超时或取消说明后继续。
+    """
+
+    tool_timeout: Optional[float] = None
+    tool_timeouts: dict = Field(default_factory=dict)
+    max_tool_workers: int = 8
+
+    def _timeout_for(self, tool_name: str):
+        return self.tool_timeouts.get(tool_name, self.tool_timeout)
+
+    def _call(self, inputs, run_manager=None):
+        deadline = time.monotonic() + self.max_execution_time if self.max_execution_time else None
+        token = _deadline.set(deadline)
+        try:
+            return super()._call(inputs, run_manager=run_manager)
+        finally:
+            _deadline.reset(token)
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        """提交到线程池后立即返回，observation 为 _ToolCall，由 _iter_next_step 统一等待"""
+        perform = super()._perform_agent_action
+        call = _ToolCall()
+
+        def run():
+            call.started = time.monotonic()
+            call.ready.set()
+            step = perform(name_to_tool_map, color_mapping, agent_action, run_manager)
+            return step.observation, time.monotonic() - call.started
+
+        context = contextvars.copy_context()
+        call.future = _get_pool(self.max_tool_workers).submit(context.run, run)
+        # 在开始执行前被取消（如线程池关闭）时同样唤醒等待方
+        call.future.add_done_callback(lambda _: call.ready.set())
+        return AgentStep(action=agent_action, observation=call)
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        pending = []
+        submitted = None
+        for item in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps,
+                                            run_manager):
+            if isinstance(item, AgentStep) and isinstance(item.observation, _ToolCall):
+                submitted = submitted or time.monotonic()
+                pending.append(item)
+            else:
+                yield item
+        if pending:
+            yield from self._collect(pending, submitted)
+
+    @staticmethod
+    def _remaining(wait_until):
+        return None if wait_until is None else max(0.0, wait_until - time.monotonic())
+
+    def _wait(self, call: _ToolCall, tool_name: str, deadline):
+        """等待一个工具调用的结果：排队期间只受截止时间限制，开始执行后再加上该工具的超时"""
+        if not call.ready.wait(self._remaining(deadline)):
+            raise FutureTimeoutError()
+        timeout = self._timeout_for(tool_name)
+        wait_until = call.started + timeout if timeout and call.started is not None else None
+        if deadline is not None:
+            wait_until = deadline if wait_until is None else min(wait_until, deadline)
+        return call.future.result(self._remaining(wait_until))
+
+    def _collect(self, pending: list, submitted: float):
+        """按提交顺序等待各个工具调用的结果，超时的调用被放弃、未开始的调用被取消，以说明文字作为结果"""
+        deadline = _deadline.get()
+        steps = []
+        tools_seconds, timeouts, cancelled = 0.0, 0, 0
+        for step in pending:
+            call, tool_name = step.observation, step.action.tool
+            try:
+                observation, seconds = self._wait(call, tool_name, deadline)
+                tools_seconds += seconds
+            except FutureTimeoutError:
+                if call.future.cancel():
+                    # 到截止时间还在排队，没有占用线程
+                    cancelled += 1
+                    observation = _cancelled_observation(tool_name)
+                    logger.warning(f"Tool {tool_name} was cancelled before it started")
+                else:
+                    timeouts += 1
+                    tools_seconds += time.monotonic() - call.started
+                    observation = _timeout_observation(tool_name)
+                    logger.warning(f"Tool {tool_name} timed out and was abandoned")
+            except CancelledError:
+                cancelled += 1
+                observation = _cancelled_observation(tool_name)
+                logger.warning(f"Tool {tool_name} was cancelled before it started")
+            steps.append(AgentStep(action=step.action, observation=observation))
+        _record_step(len(pending), timeouts, tools_seconds, time.monotonic() - submitted, cancelled)
+        return steps
+
+    async def _aiter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        # AgentExecutor 在 asyncio.gather 中执行各个工具调用，这里只收集每个调用的 (开始, 结束, 是否超时)
+        calls = []
+        token = _step_calls.set(calls)
+        try:
+            async for item in super()._aiter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps,
+                                                       run_manager):
+                yield item
+        finally:
+            _step_calls.reset(token)
+        if calls:
+            _record_step(len(calls), sum(1 for _, _, timed_out in calls if timed_out),
+                         sum(finished - started for started, finished, _ in calls),
+                         max(finished for _, finished, _ in calls) - min(started for started, _, _ in calls))
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        started = time.monotonic()
+        timed_out = False
+        try:
+            step = await asyncio.wait_for(
+                super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager),
+                self._timeout_for(agent_action.tool))
+        except asyncio.TimeoutError:
+            timed_out = True
+            logger.warning(f"Tool {agent_action.tool} timed out and was cancelled")
+            step = AgentStep(action=agent_action, observation=_timeout_observation(agent_action.tool))
+        calls = _step_calls.get()
+        if calls is not None:
+            calls.append((started, time.monotonic(), timed_out))
+        return step
@@ -0,0 +1,187 @@
+# services/service_container.py
+from models.llm_factory import (get_llm, get_vision_llm, get_embeddings, get_document_embeddings, get_embedding_cache,
+                                construction_counts, get_construction_counts)
+from models.vector_db_manager import VectorDBManager
+from models.document_registry import DocumentRegistry
+from models.embedding_executor import EmbeddingExecutor
+from models.keyword_index import KeywordIndex
+from models.query_cache import QueryCache
+from models.retriever import HybridRetriever, create_reranker
+from services.chat_service import ChatService
+from services.conversation_memory import ConversationMemory
+from services.ingestion_service import IngestionService
+from services.ocr_service import OCRService
+from services.audio_service import AudioService
+from services.async_chat_service import AsyncChatService
+from utils.session_storage import session_manager, AsyncRedisSessionManager
+from utils.mysql_storage import session_manager as mysql_session_manager
+from utils.pdf_pages import shutdown_pool as shutdown_pdf_pool
+from services.parallel_agent import shutdown_pool as shutdown_tool_pool
+from utils.image_util import RedisImageDescriptionCache
+from utils.session_persister import SessionPersister
+from utils.summarizer import DocumentSummarizer, RedisSummaryCache
+from utils.web_cache import WebResultCache
+from utils.web_utils import set_web_cache
+
+
+class ServiceContainer:
+    """
+    应用级服务容器，在 create_app() 中构建一次，之后进程内所有请求共享同一组服务实例。
+    LLM / Embedding 客户端由 llm_factory 按配置缓存，这里在启动时预热，避免首个请求承担构造开销。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.session_manager = session_manager
+        self.mysql_session_manager = mysql_session_manager
+        self.session_persister = None
+        if app.config.get('SESSION_WRITE_BEHIND', False):
+            self.session_persister = SessionPersister(
+                app,
+                self.mysql_session_manager,
+                flush_interval=app.config.get('SESSION_FLUSH_INTERVAL', 1.0),
+                batch_size=app.config.get('SESSION_FLUSH_BATCH_SIZE', 100),
+            )
+            self.session_manager.set_persister(self.session_persister)
+        self.vector_db_manager = VectorDBManager(
+            app.config.get('EMBEDDINGS_PATH'),
+            max_open_handles=app.config.get('VECTOR_DB_MAX_OPEN_HANDLES', 32),
+            max_cache_mb=app.config.get('VECTOR_DB_CACHE_MB', 512),
+            layout=app.config.get('VECTOR_DB_LAYOUT', 'directory'),
+            shards=app.config.get('VECTOR_DB_SHARDS', 8),
+            presence_ttl=app.config.get('VECTOR_DB_PRESENCE_TTL', 10),
+            registry=DocumentRegistry(app.config['DOCUMENT_REGISTRY_PATH'])
+            if app.config.get('DOCUMENT_REGISTRY_ENABLED', False) else None,
+            summarizer=DocumentSummarizer(
+                section_tokens=app.config.get('SUMMARY_SECTION_TOKENS', 4000),
+                fan_out=app.config.get('SUMMARY_FAN_OUT', 8),
+                cache=RedisSummaryCache(self.session_manager._get_redis_client,
+                                        ttl=app.config.get('SUMMARY_CACHE_TTL', 7 * 86400)),
+            ),
+            embedding_executor=EmbeddingExecutor(
+                max_concurrency=app.config.get('EMBED_CONCURRENCY', 4),
+                rate_limit=app.config.get('EMBED_RATE_LIMIT', 10.0),
+                batch_size=app.config.get('EMBED_BATCH_SIZE') or None,
+            ),
+            retriever=HybridRetriever(
+                KeywordIndex(app.config['KEYWORD_INDEX_PATH']),
+                top_k=app.config.get('RETRIEVAL_TOP_K', 3),
+                fetch_k=app.config.get('RETRIEVAL_FETCH_K', 20),
+                vector_weight=app.config.get('HYBRID_VECTOR_WEIGHT', 0.5),
+                mmr_lambda=app.config.get('MMR_LAMBDA', 0.7),
+                reranker=create_reranker(app.config.get('RERANKER', 'none'), app.config.get('RERANKER_MODEL')),
+                rerank_k=app.config.get('RERANK_TOP_K', 10),
+            ) if app.config.get('RETRIEVAL_MODE', 'vector') == 'hybrid' else None,
+            query_cache=QueryCache(
+                max_entries=app.config.get('QUERY_CACHE_SIZE', 1024),
+                ttl=app.config.get('QUERY_CACHE_TTL', 600),
+                get_client=self.session_manager._get_redis_client,
+            ) if app.config.get('QUERY_CACHE_ENABLED', False) else None,
+        )
+        construction_counts['vector_db_manager'] += 1
+        self.ingestion_service = IngestionService(
+            app,
+            self.vector_db_manager,
+            self.session_manager,
+            max_workers=app.config.get('INGEST_WORKERS', 4),
+            job_ttl=app.config.get('INGEST_JOB_TTL', 86400),
+        )
+        construction_counts['ingestion_service'] += 1
+        self.ocr_service = OCRService(
+            languages=app.config.get('OCR_LANGUAGES', ('ch_sim', 'en')),
+            gpu=app.config.get('OCR_GPU', False),
+            threads=app.config.get('OCR_THREADS', 0),
+            queue_size=app.config.get('OCR_QUEUE_SIZE', 16),
+        )
+        construction_counts['ocr_service'] += 1
+        self.conversation_memory = ConversationMemory(
+            self.session_manager,
+            mode=app.config.get('MEMORY_MODE', 'buffer'),
+            max_tokens=app.config.get('MEMORY_MAX_TOKENS', 3000),
+            summary_max_tokens=app.config.get('MEMORY_SUMMARY_MAX_TOKENS', 500),
+        )
+        self.chat_service = ChatService(self.session_manager, self.vector_db_manager,
+                                        agent_cache_size=app.config.get('AGENT_CACHE_SIZE', 16),
+                                        ingestion_service=self.ingestion_service,
+                                        ocr_service=self.ocr_service,
+                                        image_desc_cache=RedisImageDescriptionCache(
+                                            self.session_manager._get_redis_client,
+                                            ttl=app.config.get('IMAGE_DESC_CACHE_TTL', 7 * 86400))
+                                        if app.config.get('IMAGE_DESC_CACHE_ENABLED', False) else None,
+                                        memory=self.conversation_memory)
+        construction_counts['chat_service'] += 1
+        # 异步服务模式（asgi.py）使用的版本，与同步版本共用智能体构建逻辑和存储配置
+        async_session_manager = AsyncRedisSessionManager(self.session_manager)
+        self.async_chat_service = AsyncChatService(self.chat_service, async_session_manager)
+        construction_counts['async_chat_service'] += 1
+        # 联网工具是模块级函数，缓存在这里按配置设置
+        set_web_cache(WebResultCache(
+            self.session_manager._get_redis_client,
+            async_session_manager._get_redis_client,
+            ttls={'search': app.config.get('WEB_SEARCH_CACHE_TTL', 1800),
+                  'crawl': app.config.get('WEB_CRAWL_CACHE_TTL', 21600)},
+            lock_wait=app.config.get('WEB_CACHE_LOCK_WAIT', 20),
+        ) if app.config.get('WEB_CACHE_ENABLED', False) else None)
+        self.audio_service = AudioService()
+        construction_counts['audio_service'] += 1
+
+        self.init_schema()
+        self.warm_up()
+
+    def init_schema(self):
+        """启动时创建 MySQL 表结构；数据库暂不可用时推迟到首次访问"""
+        with self.app.app_context():
+            try:
+                self.mysql_session_manager.init_schema()
+            except Exception as e:
+                self.app.logger.warning(f"Failed to initialize MySQL schema at startup: {e}")
+
+    def warm_up(self):
+        """预先构造 LLM / Embedding 客户端；缺少密钥等配置时只记录警告，首次使用时再构造"""
+        with self.app.app_context():
+            for name, factory in (('llm', get_llm), ('vision_llm', get_vision_llm), ('embeddings', get_embeddings),
+                                  ('document_embeddings', get_document_embeddings)):
+                try:
+                    factory()
+                except Exception as e:
+                    self.app.logger.warning(f"Failed to warm up {name} client: {e}")
+            if self.app.config.get('IMAGE_OCR_MODE', 'off') != 'off' and self.app.config.get('OCR_PRELOAD', False):
+                # 在 OCR 线程中加载模型，不阻塞启动
+                self.ocr_service.submit(None)
+
+    @property
+    def llm(self):
+        return get_llm()
+
+    @property
+    def vision_llm(self):
+        return get_vision_llm()
+
+    @property
+    def embeddings(self):
+        return get_embeddings()
+
+    @property
+    def embedding_cache(self):
+        return get_embedding_cache()
+
+    def shutdown(self):
+        """进程退出前把尚未持久化的会话写入 MySQL，并停止接收新的入库任务"""
+        self.ingestion_service.shutdown()
+        self.ocr_service.shutdown()
+        self.conversation_memory.shutdown()
+        shutdown_pdf_pool()
+        shutdown_tool_pool()
+        if self.session_persister is not None:
+            self.session_persister.shutdown()
+
+    def construction_counts(self):
+        """当前 worker 进程内的对象构造计数"""
+        return get_construction_counts()
+
+
+def init_services(app):
+    """构建服务容器并挂载到 app.extensions 上"""
+    container = ServiceContainer(app)
+    app.extensions['service_container'] = container
+    return container
@@ -0,0 +1,41 @@
+# services/streaming.py
+import json
+import queue
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 队列结束标记
+STREAM_END = object()
+
+
+class QueueCallbackHandler(BaseCallbackHandler):
+    """把 LLM 的增量 token 和工具调用进度转换为事件，放入队列供流式接口消费"""
+
+    def __init__(self, event_queue: queue.Queue, max_tool_output_chars: int = 500):
+        self.queue = event_queue
+        self.max_tool_output_chars = max_tool_output_chars
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        # 工具调用阶段的增量只有 tool_call_chunks，没有文本内容
+        if token:
+            self.queue.put({'type': 'token', 'content': token})
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        name = (serialized or {}).get('name') or kwargs.get('name', '')
+        self.queue.put({'type': 'tool_start', 'tool': name, 'input': input_str})
+
+    def on_tool_end(self, output, **kwargs):
+        output = str(getattr(output, 'content', output))
+        self.queue.put({'type': 'tool_end', 'tool': kwargs.get('name', ''),
+                        'output': output[:self.max_tool_output_chars]})
+
+    def on_tool_error(self, error, **kwargs):
+        self.queue.put({'type': 'tool_error', 'tool': kwargs.get('name', ''), 'error': str(error)})
+
+
+def format_event(event: dict, stream_format: str = 'sse'):
+    """将事件编码为 SSE 或 NDJSON 文本"""
+    payload = json.dumps(event, ensure_ascii=False)
+    if stream_format == 'ndjson':
+        return payload + '\n'
+    return f"event: {event['type']}\ndata: {payload}\n\n"
@@ -1,18 +1,21 @@
+import hashlib
+import io
 import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from functools import partial
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from werkzeug.utils import secure_filename
 from flask import current_app
-from langchain_community.document_loaders import TextLoader, PyPDFLoader, CSVLoader, JSONLoader, \
-    UnstructuredMarkdownLoader
+from langchain_community.document_loaders import CSVLoader, JSONLoader, UnstructuredMarkdownLoader
 from langchain_community.document_loaders import (
     UnstructuredWordDocumentLoader,  # 用于 .docx 和 .doc
     UnstructuredPowerPointLoader,  # 用于 .pptx 和 .ppt
-    UnstructuredFileLoader  # 通用加载器，可处理 .java, .c 等
 )
-import easyocr
 from models.prompts import GENERATE_SUMMARY_PROMPT,IMAGE_DESC_PROMPT
+from utils.pdf_pages import iter_pdf_pages
 
 
 def allowed_file(filename):
@@ -27,13 +30,15 @@ def allowed_image(filename):
         filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_IMAGE_EXTENSIONS']
 
 
-def save_temp_file(file_obj):
-    """保存上传的文件到临时目录并返回文件路径"""
-    filename = secure_filename(file_obj.filename)
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
-    file_obj.save(filepath)
-    return filepath
+def file_sha256(file_obj):
+    """计算上传文件内容的 sha256，计算完成后把读取位置恢复到开头"""
+    digest = hashlib.sha256()
+    stream = file_obj.stream
+    stream.seek(0)
+    for block in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
 
 
 def remove_temp_file(filepath):
@@ -45,74 +50,144 @@ def remove_temp_file(filepath):
         pass  # 忽略删除失败的情况
 
 
-def process_file(filepath):
+def spool_upload(file_obj):
     """
-    处理不同类型的文件并返回其文本内容。
-    :param filepath: 文件的路径
-    :return: 文件的文本内容 (str)
-    :raises ValueError: 如果文件类型不支持
+    把上传文件复制到 SpooledTemporaryFile 并返回：不超过 UPLOAD_SPOOL_MAX_MB 的文件保存在内存中，
+    更大的文件写入临时目录中的匿名临时文件（不会与其他上传重名，关闭后自动删除）。
+    请求结束后上传流会被关闭，后台入库任务读取的是这份副本。
     """
-    _, file_extension = os.path.splitext(filepath.lower())
-
+    folder = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    spool = tempfile.SpooledTemporaryFile(
+        max_size=int(current_app.config.get('UPLOAD_SPOOL_MAX_MB', 8) * 1024 * 1024), dir=folder)
+    stream = file_obj.stream
+    stream.seek(0)
+    shutil.copyfileobj(stream, spool, 1024 * 1024)
+    stream.seek(0)
+    spool.seek(0)
+    return spool
+
+
+def iter_file_sections(source, file_name=None, pdf_workers=None):
+    """
+    逐页 / 逐段产出文件的文本内容，调用方可以边解析边切分，不需要把整个文档读入内存。
+    PDF 按页在进程池中并行提取（pdf_workers 个进程，默认取配置 PDF_PARSE_WORKERS）；
+    文本和代码文件按行分块读取；其他类型使用对应 loader 的 lazy_load 逐个产出。
+    :param source: 文件的路径，或可 seek 的二进制文件对象（如 spool_upload 的返回值，此时需要传入 file_name）
+    :param file_name: 用于判断文件类型的文件名，默认为 source 路径
+    :return: 文本片段的生成器，片段之间以换行连接即为完整文本
+    :raises ValueError: 如果文件类型不支持或无法解析（在迭代时抛出）
+    """
+    file_name = file_name or source
+    _, file_extension = os.path.splitext(file_name.lower())
+
+    if file_extension == '.pdf':
+        workers = pdf_workers or current_app.config.get('PDF_PARSE_WORKERS', 4)
+        yield from _iter_loader(file_name, 'pypdf', lambda: iter_pdf_pages(
+            source, workers=workers, spill_dir=current_app.config.get('UPLOAD_FOLDER')))
+        return
     if file_extension == '.txt':
-        loader = TextLoader(filepath, encoding='utf-8')
-    elif file_extension == '.pdf':
-        loader = PyPDFLoader(filepath)
-    elif file_extension == '.csv':
-        loader = CSVLoader(filepath)
+        yield from _iter_loader(file_name, 'TextLoader', lambda: _iter_text_blocks(source, errors='strict'))
+        return
+    if file_extension in ['.java', '.c', '.py', '.js', '.html', '.css', '.xml']:  # 可以添加更多代码文件类型
+        # 对于代码文件，直接作为文本读取，忽略无法解码的字符
+        yield from _iter_loader(file_name, 'open', lambda: _iter_text_blocks(source, errors='ignore'))
+        return
+
+    if file_extension == '.csv':
+        loader_class = CSVLoader
     elif file_extension == '.json':
-        loader = JSONLoader(filepath, jq_schema='.', text_content=False)  # 根据JSON结构调整jq_schema
+        loader_class = partial(JSONLoader, jq_schema='.', text_content=False)  # 根据JSON结构调整jq_schema
     elif file_extension in ['.md', 'markdown']:
-        loader = UnstructuredMarkdownLoader(filepath)
+        loader_class = UnstructuredMarkdownLoader
     elif file_extension in ['.docx', '.doc']:
         # 使用 UnstructuredWordDocumentLoader 处理 .docx 和 .doc
-        loader = UnstructuredWordDocumentLoader(filepath)
+        loader_class = UnstructuredWordDocumentLoader
     elif file_extension in ['.pptx', '.ppt']:
         # 使用 UnstructuredPowerPointLoader 处理 .pptx 和 .ppt
-        loader = UnstructuredPowerPointLoader(filepath)
-    elif file_extension in ['.java', '.c', '.py', '.js', '.html', '.css', '.xml']:  # 可以添加更多代码文件类型
-        # 对于代码文件，最简单的方式是作为文本读取
-        # 也可以使用 UnstructuredFileLoader
-        try:
-            # 尝试直接作为文本读取
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
-        except UnicodeDecodeError:
-            # 如果编码问题，尝试 UnstructuredFileLoader
-            print(f"UTF-8 decode failed for {filepath}, trying UnstructuredFileLoader.")
-            try:
-                loader = UnstructuredFileLoader(filepath)
-            except Exception as e:
-                raise ValueError(f"File type '{file_extension}' is not supported or could not be processed. Error: {e}")
+        loader_class = UnstructuredPowerPointLoader
     else:
         raise ValueError(f"File type '{file_extension}' is not supported.")
 
-    if 'loader' in locals():
-        try:
-            documents = loader.load()
-            current_app.logger.info(documents)
-            # documents 是一个 Document 对象列表，通常取第一个的 page_content
-            return "\n".join([doc.page_content for doc in documents])
-        except Exception as e:
-            raise ValueError(f"Could not load file {filepath} using {type(loader).__name__}: {e}")
+    # 这些 loader 只能按路径读取文件
+    with _as_path(source, file_extension) as filepath:
+        loader = loader_class(filepath)
+        yield from _iter_loader(file_name, type(loader).__name__,
+                                lambda: (doc.page_content for doc in loader.lazy_load()))
+
+
+@contextmanager
+def _as_path(source, suffix):
+    """source 为文件对象时写入临时目录中唯一命名的临时文件，用完后删除"""
+    if isinstance(source, str):
+        yield source
+        return
+    folder = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=folder, suffix=suffix, delete=False) as f:
+        source.seek(0)
+        shutil.copyfileobj(source, f, 1024 * 1024)
+    try:
+        yield f.name
+    finally:
+        remove_temp_file(f.name)
 
-    raise RuntimeError(f"Logic error in process_file for {filepath}")
 
+def _iter_loader(file_name, loader_name, make_iter):
+    """统一把解析过程中的异常转换为 ValueError，并记录产出的片段数"""
+    sections = 0
+    try:
+        for text in make_iter():
+            sections += 1
+            yield text
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Could not load file {file_name} using {loader_name}: {e}")
+    current_app.logger.info(f"Loaded {sections} sections from {os.path.basename(file_name)} using {loader_name}")
 
-# 使用 OCR 技术尝试识别图片上的文字
-def preprocess_image(filepath):
-    # 支持简体中文、英文的文字识别
-    reader = easyocr.Reader(['ch_sim', 'en'])
+
+def _iter_text_blocks(source, errors, block_chars=64 * 1024):
+    """按行读取文本文件，每攒够 block_chars 个字符产出一块（去掉块末尾的换行，以换行连接后与原文一致）"""
+    if isinstance(source, str):
+        f = open(source, 'r', encoding='utf-8', errors=errors)
+    else:
+        source.seek(0)
+        f = io.TextIOWrapper(source, encoding='utf-8', errors=errors)
     try:
-        # OCR 提取
-        ocr_results = reader.readtext(filepath, detail=0)  # detail=0 只返回文本
-        if ocr_results:
-            file_name = os.path.basename(filepath)
-            ocr_text = " ".join(ocr_results)
-            ocr_text = f"在图片'{file_name}'中识别到的文字如下：\n {ocr_text} \n\n"
+        lines, size = [], 0
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if size >= block_chars:
+                yield ''.join(lines)[:-1] if line.endswith('\n') else ''.join(lines)
+                lines, size = [], 0
+        if lines:
+            yield ''.join(lines)
+    finally:
+        if isinstance(source, str):
+            f.close()
         else:
-            ocr_text = "未在图片中识别到文字。"
+            # 不关闭调用方传入的文件对象
+            f.detach()
 
+
+def process_file(filepath):
+    """
+    处理不同类型的文件并返回其文本内容。
+    :param filepath: 文件的路径
+    :return: 文件的文本内容 (str)
+    :raises ValueError: 如果文件类型不支持
+    """
+    return "\n".join(iter_file_sections(filepath))
+
+
+# 使用 OCR 技术尝试识别图片上的文字
+def preprocess_image(filepath, ocr_service, timeout=None):
+    """通过常驻的 OCR 服务识别图片上的文字（支持简体中文、英文），返回可以加入上下文的描述"""
+    try:
+        # OCR 提取
+        ocr_text = format_ocr_text(os.path.basename(filepath), ocr_service.recognize(filepath, timeout))
         current_app.logger.info(f"OCR Extracted Text: {ocr_text}")
 
     except Exception as e:
@@ -123,13 +198,20 @@ def preprocess_image(filepath):
     return ocr_text
 
 
+def format_ocr_text(file_name, ocr_results):
+    if ocr_results:
+        ocr_text = " ".join(ocr_results)
+        return f"在图片'{file_name}'中识别到的文字如下：\n {ocr_text} \n\n"
+    return "未在图片中识别到文字。"
+
+
 # 通过 VISION LLM 获得图片的描述以及可能的文字
-def get_image_desc(vision_llm, image_base64: str):
+def get_image_desc(vision_llm, image_base64: str, mime_type: str = 'image/jpeg'):
     vision_prompt_template = ChatPromptTemplate.from_messages([
         ('system', IMAGE_DESC_PROMPT),
         ("human", [
             {"type": "text", "text": "请详细描述这张图片的内容以及可能包含的文字。"},
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_base64}"}}
         ])
     ])
     vision_chain = vision_prompt_template | vision_llm | StrOutputParser()
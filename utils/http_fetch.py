@@ -0,0 +1,175 @@
+# utils/http_fetch.py
+import asyncio
+import re
+import threading
+import weakref
+from collections import OrderedDict, Counter
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 读取响应体时每次读取的字节数
+CHUNK_SIZE = 64 * 1024
+
+_CHARSET = re.compile(r'charset=["\']?([\w.:-]+)', re.I)
+
+
+def header_charset(content_type: str):
+    """Content-Type 中声明的字符集，没有声明时返回 None"""
+    match = _CHARSET.search(content_type or '')
+    return match.group(1) if match else None
+
+
+class PageFetcher:
+    """
+    抓取网页的共享 HTTP 客户端：
+    - 同步请求共用一个 requests.Session，连接按主机放入连接池复用（keep-alive），
+      每个主机最多 pool_per_host 个并发请求，超出时最多等待 timeout 秒，仍没有空闲连接则抛出 requests.Timeout；
+      不保存 Cookie，避免不同会话的请求互相影响；
+    - 响应体流式读取，最多读取 max_bytes 字节（按解压后的大小计算），超出部分直接丢弃并断开连接；
+    - 带 ETag / Last-Modified 的网页把解析后的内容缓存在进程内（LRU，最多 cache_size 个），
+      再次抓取时发送条件请求，服务器返回 304 时直接使用缓存的内容，不再传输和解析网页。
+    异步请求使用调用方传入的 httpx.AsyncClient（按事件循环复用），按主机的并发数同样不超过 pool_per_host。
+    """
+
+    def __init__(self, max_bytes: int = 2 * 1024 * 1024, timeout: float = 10, pool_hosts: int = 32,
+                 pool_per_host: int = 4, cache_size: int = 256, headers: dict = None):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.pool_per_host = pool_per_host
+        self.cache_size = cache_size
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        # 并发数由下面按主机的信号量限制（可以设置等待时间），连接池本身不阻塞：
+        # urllib3 的阻塞式连接池没有等待超时，主机响应慢时取连接的线程会一直等下去
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_per_host, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # url -> (ETag, Last-Modified, 解析结果)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # 主机 -> threading.BoundedSemaphore
+        self._host_slots = {}
+        # 事件循环 -> {主机: asyncio.Semaphore}
+        self._host_limits = weakref.WeakKeyDictionary()
+        self.stats = Counter()
+
+    def _conditional_headers(self, url: str):
+        with self._lock:
+            self.stats['requests'] += 1
+            entry = self._cache.get(url)
+        if entry is None:
+            return {}, None
+        etag, last_modified, _ = entry
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers, entry
+
+    def _cached(self, url: str, entry):
+        with self._lock:
+            if url in self._cache:
+                self._cache.move_to_end(url)
+            self.stats['not_modified'] += 1
+        return entry[2]
+
+    def _store(self, url: str, headers, value):
+        """响应带有校验信息且允许缓存时保存解析结果"""
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+        if not (etag or last_modified) or 'no-store' in (headers.get('Cache-Control') or '').lower():
+            return
+        with self._lock:
+            self._cache[url] = (etag, last_modified, value)
+            self._cache.move_to_end(url)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _count_body(self, size: int, truncated: bool):
+        with self._lock:
+            self.stats['fetched'] += 1
+            self.stats['bytes'] += size
+            if truncated:
+                self.stats['truncated'] += 1
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.pool_per_host)
+            return slot
+
+    def fetch(self, url: str, parse):
+        """
+        抓取网页，parse(响应体, 响应头中的字符集) 返回解析结果；网页未变化时直接返回缓存的解析结果。
+        HTTP 错误状态抛出 requests.HTTPError，等待空闲连接超时抛出 requests.Timeout。
+        """
+        headers, entry = self._conditional_headers(url)
+        slot = self._host_slot(url)
+        if not slot.acquire(timeout=self.timeout):
+            with self._lock:
+                self.stats['pool_timeouts'] += 1
+            raise requests.Timeout(f"Timed out after {self.timeout}s waiting for a connection to {url}")
+        try:
+            response_headers, body = self._download(url, headers, entry)
+        finally:
+            slot.release()
+        if body is None:
+            return self._cached(url, entry)
+        value = parse(body, header_charset(response_headers.get('Content-Type')))
+        self._store(url, response_headers, value)
+        return value
+
+    def _download(self, url: str, headers: dict, entry):
+        """返回 (响应头, 响应体)；服务器返回 304 且有缓存时响应体为 None"""
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304 and entry is not None:
+                # 读完（空的）响应体，连接才会放回连接池
+                response.content
+                return response.headers, None
+            response.raise_for_status()
+            body = bytearray()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                body += chunk
+                if len(body) >= self.max_bytes:
+                    break
+            truncated = len(body) >= self.max_bytes
+            self._count_body(len(body), truncated)
+            return response.headers, bytes(body[:self.max_bytes])
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        limits = self._host_limits.setdefault(asyncio.get_running_loop(), {})
+        host = urlsplit(url).netloc
+        if host not in limits:
+            limits[host] = asyncio.Semaphore(self.pool_per_host)
+        return limits[host]
+
+    async def afetch(self, client, url: str, parse):
+        """fetch 的异步版本，client 为 httpx.AsyncClient；HTTP 错误状态抛出 httpx.HTTPStatusError"""
+        headers, entry = self._conditional_headers(url)
+        async with self._host_limit(url):
+            async with client.stream('GET', url, headers=headers, timeout=self.timeout) as response:
+                if response.status_code == 304 and entry is not None:
+                    return self._cached(url, entry)
+                response.raise_for_status()
+                body = bytearray()
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    body += chunk
+                    if len(body) >= self.max_bytes:
+                        break
+                truncated = len(body) >= self.max_bytes
+                self._count_body(len(body), truncated)
+                response_headers = response.headers
+        value = parse(bytes(body[:self.max_bytes]), header_charset(response_headers.get('Content-Type')))
+        self._store(url, response_headers, value)
+        return value
+
+    def get_stats(self):
+        with self._lock:
+            return {'cached_pages': len(self._cache), **self.stats}
@@ -0,0 +1,73 @@
+# utils/image_util.py
+import hashlib
+import io
+
+from PIL import Image, ImageOps
+
+
+def prepare_image(img_bytes: bytes, max_side: int = 1536, quality: int = 85):
+    """
+    发送给视觉模型之前缩小并重新压缩图片：长边超过 max_side 时等比缩小，重新编码为 JPEG（PNG 原图同时尝试 PNG），
+    取其中最小的结果。图片 token 数由分辨率决定，缩小后的图片即使字节数更大也会使用；
+    没有缩小且重新编码没有变小，或者图片无法解析时返回原图。返回 (图片内容, MIME 类型)。
+    """
+    try:
+        with Image.open(io.BytesIO(img_bytes)) as image:
+            original_format = image.format
+            # 按 EXIF 方向旋转，避免手机照片缩小后方向错误
+            image = ImageOps.exif_transpose(image)
+            resized = max(image.size) > max_side
+            if resized:
+                image.thumbnail((max_side, max_side), Image.LANCZOS)
+            candidates = [(_encode_jpeg(image, quality), 'image/jpeg')]
+            if original_format == 'PNG':
+                output = io.BytesIO()
+                image.save(output, format='PNG', optimize=True)
+                candidates.append((output.getvalue(), 'image/png'))
+    except Exception:
+        return img_bytes, 'image/jpeg'
+
+    if not resized:
+        candidates.append((img_bytes, _mime_type(original_format)))
+    return min(candidates, key=lambda candidate: len(candidate[0]))
+
+
+def _encode_jpeg(image, quality: int) -> bytes:
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # 透明背景铺白色，与常见的截图显示效果一致
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def _mime_type(image_format):
+    return {'PNG': 'image/png', 'WEBP': 'image/webp', 'GIF': 'image/gif'}.get(image_format, 'image/jpeg')
+
+
+def image_cache_key(img_bytes: bytes, *params) -> str:
+    """按原图内容和影响描述结果的参数（模型、缩放尺寸等）计算缓存键"""
+    digest = hashlib.sha256(img_bytes)
+    for param in params:
+        digest.update(f"\0{param}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RedisImageDescriptionCache:
+    """视觉模型的图片描述缓存，保存在 Redis 中（image_desc:{key}），按 TTL 过期"""
+
+    def __init__(self, get_client, ttl: int = 7 * 86400):
+        self.get_client = get_client
+        self.ttl = ttl
+
+    def get(self, key: str):
+        value = self.get_client().get(f"image_desc:{key}")
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key: str, description: str):
+        self.get_client().set(f"image_desc:{key}", description, ex=self.ttl)
@@ -1,11 +1,135 @@
 import json
 import logging
+import threading
+import time
+from collections import deque, Counter
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from flask import current_app
 import pymysql.cursors
 import os
 
 
+def messages_to_json(history: list):
+    """将 LangChain 消息对象转换为可 JSON 序列化的格式"""
+    history_json = []
+    for msg in history:
+        if isinstance(msg, HumanMessage):
+            history_json.append({'type': 'human', 'content': msg.content})
+        elif isinstance(msg, AIMessage):
+            history_json.append({'type': 'ai', 'content': msg.content})
+        elif isinstance(msg, SystemMessage):
+            history_json.append({'type': 'system', 'content': msg.content})
+    return history_json
+
+
+def messages_from_json(history_json: list):
+    """将 JSON 格式的消息列表还原为 LangChain 消息对象"""
+    history = []
+    for msg_obj in history_json:
+        if msg_obj['type'] == 'human':
+            history.append(HumanMessage(content=msg_obj['content']))
+        elif msg_obj['type'] == 'ai':
+            history.append(AIMessage(content=msg_obj['content']))
+        elif msg_obj['type'] == 'system':
+            history.append(SystemMessage(content=msg_obj['content']))
+    return history
+
+
+class MySQLConnectionPool:
+    """
+    线程安全的有界 MySQL 连接池。
+    空闲连接按后进先出复用，空闲超过 ping_interval 的连接在取出前 PING 一次；
+    归还时已断开的连接直接丢弃，下次取用时重新建立。
+    """
+
+    def __init__(self, connect, max_size=10, timeout=10, ping_interval=30):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._idle = deque()  # (connection, 归还时间)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._stats = Counter()
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquire(self):
+        """取出一个连接，池满时最多等待 timeout 秒"""
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise TimeoutError(f"Timed out after {self.timeout}s waiting for a MySQL connection")
+        waited = time.perf_counter() - start
+
+        connection = None
+        try:
+            while connection is None:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    candidate, released_at = self._idle.pop()
+                if time.monotonic() - released_at > self.ping_interval:
+                    try:
+                        candidate.ping(reconnect=False)
+                    except Exception:
+                        self._close_quietly(candidate)
+                        continue
+                connection = candidate
+
+            if connection is None:
+                connection = self._connect()
+                with self._lock:
+                    self._stats['created'] += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return connection
+
+    def release(self, connection):
+        """归还连接；连接已断开（如执行过程中出现网络错误）时直接丢弃"""
+        with self._lock:
+            self._in_use -= 1
+        if connection.open:
+            with self._lock:
+                self._idle.append((connection, time.monotonic()))
+        else:
+            self._close_quietly(connection)
+        self._slots.release()
+
+    def _close_quietly(self, connection):
+        with self._lock:
+            self._stats['discarded'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def get_stats(self):
+        """连接池指标：使用中 / 空闲连接数，等待时间等"""
+        with self._lock:
+            checkouts = self._stats['checkouts']
+            return {
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': checkouts,
+                'created': self._stats['created'],
+                'discarded': self._stats['discarded'],
+                'timeouts': self._stats['timeouts'],
+                'avg_wait_ms': round(self._wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                'max_wait_ms': round(self._wait_max * 1000, 3),
+            }
+
+
 class MySQLSessionManager:
     def __init__(self):
         # 从 Flask 应用配置中获取 MySQL 连接信息
@@ -17,24 +141,56 @@ class MySQLSessionManager:
         self.charset = os.getenv('MYSQL_CHARSET', 'utf8mb4')
         self.timezone = os.getenv('MYSQL_TIMEZONE', '+08:00')
 
+        self._pool = MySQLConnectionPool(
+            self._connect,
+            max_size=int(os.getenv('MYSQL_POOL_SIZE', 10)),
+            timeout=float(os.getenv('MYSQL_POOL_TIMEOUT', 10)),
+            ping_interval=float(os.getenv('MYSQL_POOL_PING_INTERVAL', 30)),
+        )
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self):
+        """建立新的 MySQL 数据库连接"""
+        connection = pymysql.connect(
+            host=self.host,
+            port=self.port,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            charset=self.charset,
+            # 连接会在请求间复用，使用自动提交避免连接上残留的事务快照
+            autocommit=True,
+            cursorclass=pymysql.cursors.DictCursor  # 返回字典格式的结果，方便处理
+        )
+        print("Connected to MySQL database")
+        return connection
+
     def _get_connection(self):
-        """获取 MySQL 数据库连接"""
+        """从连接池获取 MySQL 数据库连接，用完后需调用 _release_connection 归还"""
         try:
-            connection = pymysql.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                charset=self.charset,
-                cursorclass=pymysql.cursors.DictCursor  # 返回字典格式的结果，方便处理
-            )
-            print("Connected to MySQL database")
-            return connection
+            return self._pool.acquire()
         except Exception as e:
             current_app.logger.error(f"Error connecting to MySQL: {e}")
             raise e
 
+    def _release_connection(self, connection):
+        """将连接归还连接池"""
+        self._pool.release(connection)
+
+    def get_pool_stats(self):
+        """连接池指标"""
+        return self._pool.get_stats()
+
+    def init_schema(self):
+        """在启动时创建表结构，成功后不再重复执行 DDL"""
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if not self._schema_ready:
+                self._create_table_if_not_exists()
+                self._schema_ready = True
+
     def _create_table_if_not_exists(self):
         """检查并创建会话历史表（如果不存在）"""
         create_table_sql = """
@@ -47,25 +203,47 @@ class MySQLSessionManager:
             INDEX idx_session_id (session_id) -- 为 session_id 创建索引，提高查询速度
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
         """
+        # 追加写模式下的逐条消息表，按自增 id 保证消息顺序
+        create_messages_table_sql = """
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            session_id VARCHAR(255) NOT NULL,
+            type VARCHAR(16) NOT NULL,
+            content MEDIUMTEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_session_id_id (session_id, id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+        """
+        # 按 token 预算截取历史时，更早消息的滚动摘要
+        create_summaries_table_sql = """
+        CREATE TABLE IF NOT EXISTS chat_session_summaries (
+            session_id VARCHAR(255) PRIMARY KEY,
+            summary MEDIUMTEXT NOT NULL,
+            covered INT NOT NULL, -- 摘要覆盖的消息条数（会话开头的前 covered 条）
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+        """
         connection = self._get_connection()
         try:
             with connection.cursor() as cursor:
                 cursor.execute(create_table_sql)
+                cursor.execute(create_messages_table_sql)
+                cursor.execute(create_summaries_table_sql)
             connection.commit()
-            print("Table 'chat_sessions' is ready.")
+            print("Tables 'chat_sessions', 'chat_messages' and 'chat_session_summaries' are ready.")
         except Exception as e:
             current_app.logger.error(f"Error creating table: {e}")
             raise e
         finally:
-            connection.close()
+            self._release_connection(connection)
 
     def get_session_history(self, session_id: str, default=None):
         """从 MySQL 获取会话历史"""
         if default is None:
             default = []
 
-        # 确保表存在
-        self._create_table_if_not_exists()
+        # 确保表存在（仅首次调用时执行 DDL）
+        self.init_schema()
 
         connection = self._get_connection()
         try:
@@ -76,37 +254,24 @@ class MySQLSessionManager:
 
                 if result and result['history']:
                     history_json = result['history']
-                    history = []
-                    for msg_obj in history_json:
-                        if msg_obj['type'] == 'human':
-                            history.append(HumanMessage(content=msg_obj['content']))
-                        elif msg_obj['type'] == 'ai':
-                            history.append(AIMessage(content=msg_obj['content']))
-                        elif msg_obj['type'] == 'system':
-                            history.append(SystemMessage(content=msg_obj['content']))
-                    return history
+                    if isinstance(history_json, (str, bytes)):
+                        history_json = json.loads(history_json)
+                    return messages_from_json(history_json)
                 else:
                     return default
         except Exception as e:
             current_app.logger.error(f"Error loading session history for {session_id}: {e}")
             return default
         finally:
-            connection.close()
+            self._release_connection(connection)
 
     def set_session_history(self, session_id: str, history: list):
         """将会话历史保存到 MySQL (持久化)"""
-        # 确保表存在
-        self._create_table_if_not_exists()
+        # 确保表存在（仅首次调用时执行 DDL）
+        self.init_schema()
 
         # 将 LangChain 消息对象转换为 JSON 序列化的格式
-        history_json = []
-        for msg in history:
-            if isinstance(msg, HumanMessage):
-                history_json.append({'type': 'human', 'content': msg.content})
-            elif isinstance(msg, AIMessage):
-                history_json.append({'type': 'ai', 'content': msg.content})
-            elif isinstance(msg, SystemMessage):
-                history_json.append({'type': 'system', 'content': msg.content})
+        history_json = messages_to_json(history)
 
         connection = self._get_connection()
         try:
@@ -125,7 +290,203 @@ class MySQLSessionManager:
             current_app.logger.error(f"Error saving session history for {session_id}: {e}")
             # raise e # 根据需要决定是否抛出异常
         finally:
-            connection.close()
+            self._release_connection(connection)
+
+    def get_session_messages(self, session_id: str, default=None):
+        """
+        从逐条消息表 chat_messages 获取会话历史（追加写模式）。
+        如果该会话还没有逐条消息，但 chat_sessions 中存在旧的整段 JSON 历史，则顺带完成该会话的迁移。
+        """
+        if default is None:
+            default = []
+
+        self.init_schema()
+
+        connection = self._get_connection()
+        try:
+            rows = self._select_messages(connection, session_id)
+            if rows:
+                return messages_from_json(rows)
+
+            # 兼容旧格式：从 chat_sessions.history 读取并迁移
+            history_json = self._migrate_session(connection, session_id)
+            if history_json:
+                logging.info(f"Migrated session {session_id} from chat_sessions to chat_messages.")
+                return messages_from_json(history_json)
+            # 可能刚被并发的请求迁移完成，重新读取一次
+            rows = self._select_messages(connection, session_id)
+            return messages_from_json(rows) if rows else default
+        except Exception as e:
+            current_app.logger.error(f"Error loading session messages for {session_id}: {e}")
+            return default
+        finally:
+            self._release_connection(connection)
+
+    @staticmethod
+    def _select_messages(connection, session_id: str):
+        with connection.cursor() as cursor:
+            sql = "SELECT type, content FROM chat_messages WHERE session_id = %s ORDER BY id"
+            cursor.execute(sql, (session_id,))
+            return cursor.fetchall()
+
+    @staticmethod
+    def _migrate_session(connection, session_id: str):
+        """
+        在一个事务中把会话的整段 JSON 历史拆分写入 chat_messages，返回迁移的消息（JSON 格式）。
+        事务先锁定 chat_sessions 中的会话行（SELECT ... FOR UPDATE），同一会话的并发迁移依次执行，
+        后执行的看到已有逐条消息后跳过并返回 None，消息不会被重复写入；没有旧历史时同样返回 None。
+        """
+        connection.begin()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT history FROM chat_sessions WHERE session_id = %s FOR UPDATE", (session_id,))
+                row = cursor.fetchone()
+                # 加锁读取，读到的是其他事务已提交的最新数据
+                cursor.execute("SELECT 1 FROM chat_messages WHERE session_id = %s LIMIT 1 LOCK IN SHARE MODE",
+                               (session_id,))
+                if row is None or not row['history'] or cursor.fetchone():
+                    connection.rollback()
+                    return None
+
+                history_json = row['history']
+                if isinstance(history_json, (str, bytes)):
+                    history_json = json.loads(history_json)
+                rows = [(session_id, msg['type'], msg['content']) for msg in history_json]
+                if rows:
+                    cursor.executemany(
+                        "INSERT INTO chat_messages (session_id, type, content) VALUES (%s, %s, %s)", rows)
+            connection.commit()
+            return history_json
+        except Exception:
+            connection.rollback()
+            raise
+
+    def append_session_messages(self, session_id: str, messages: list):
+        """向 chat_messages 追加本轮新增的消息，写入量只与新增消息数量相关"""
+        rows = [(session_id, msg['type'], msg['content']) for msg in messages_to_json(messages)]
+        if not rows:
+            return
+
+        connection = self._get_connection()
+        try:
+            with connection.cursor() as cursor:
+                sql = "INSERT INTO chat_messages (session_id, type, content) VALUES (%s, %s, %s)"
+                cursor.executemany(sql, rows)
+            connection.commit()
+        except Exception as e:
+            current_app.logger.error(f"Error appending session messages for {session_id}: {e}")
+        finally:
+            self._release_connection(connection)
+
+    def upsert_session_histories(self, histories: dict):
+        """
+        批量 upsert 多个会话的完整历史（write-behind 刷盘使用）。
+        :param histories: {session_id: JSON 格式的消息列表}
+        写入失败时抛出异常，由调用方决定是否重试。
+        """
+        rows = [(session_id, json.dumps(history_json, ensure_ascii=False))
+                for session_id, history_json in histories.items()]
+        if not rows:
+            return
+
+        connection = self._get_connection()
+        try:
+            with connection.cursor() as cursor:
+                # pymysql 会将 executemany 的 INSERT 改写为一条多行 INSERT
+                sql = """
+                INSERT INTO chat_sessions (session_id, history) 
+                VALUES (%s, %s) 
+                ON DUPLICATE KEY UPDATE history = VALUES(history), updated_at = CURRENT_TIMESTAMP
+                """
+                cursor.executemany(sql, rows)
+            connection.commit()
+        finally:
+            self._release_connection(connection)
+
+    def insert_messages(self, rows: list):
+        """
+        批量插入逐条消息（write-behind 刷盘使用）。
+        :param rows: [(session_id, type, content), ...]，同一会话的消息需按时间顺序排列
+        写入失败时抛出异常，由调用方决定是否重试。
+        """
+        if not rows:
+            return
+
+        connection = self._get_connection()
+        try:
+            with connection.cursor() as cursor:
+                sql = "INSERT INTO chat_messages (session_id, type, content) VALUES (%s, %s, %s)"
+                cursor.executemany(sql, rows)
+            connection.commit()
+        finally:
+            self._release_connection(connection)
+
+    def migrate_history_blobs(self, batch_size: int = 200):
+        """
+        将 chat_sessions.history 中的整段 JSON 历史拆分迁移到 chat_messages 表。
+        已有逐条消息的会话会被跳过，因此可以重复执行；每个会话在单独的事务中迁移，
+        与请求中的按需迁移同时进行时也不会重复写入消息。
+        :return: 迁移的会话数量
+        """
+        self.init_schema()
+
+        migrated = 0
+        last_id = 0
+        while True:
+            connection = self._get_connection()
+            try:
+                with connection.cursor() as cursor:
+                    sql = """
+                    SELECT s.id, s.session_id FROM chat_sessions s
+                    WHERE s.id > %s
+                      AND NOT EXISTS (SELECT 1 FROM chat_messages m WHERE m.session_id = s.session_id)
+                    ORDER BY s.id LIMIT %s
+                    """
+                    cursor.execute(sql, (last_id, batch_size))
+                    sessions = cursor.fetchall()
+                if not sessions:
+                    break
+
+                for row in sessions:
+                    last_id = row['id']
+                    if self._migrate_session(connection, row['session_id']):
+                        migrated += 1
+            finally:
+                self._release_connection(connection)
+
+        return migrated
+
+    def get_session_summary(self, session_id: str):
+        """从 MySQL 获取会话的滚动摘要 {'summary', 'covered'}，没有摘要时返回 None"""
+        self.init_schema()
+
+        connection = self._get_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT summary, covered FROM chat_session_summaries WHERE session_id = %s",
+                               (session_id,))
+                result = cursor.fetchone()
+                return {'summary': result['summary'], 'covered': result['covered']} if result else None
+        finally:
+            self._release_connection(connection)
+
+    def set_session_summary(self, session_id: str, summary: str, covered: int):
+        """保存会话的滚动摘要"""
+        self.init_schema()
+
+        connection = self._get_connection()
+        try:
+            with connection.cursor() as cursor:
+                sql = """
+                INSERT INTO chat_session_summaries (session_id, summary, covered)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE summary = VALUES(summary), covered = VALUES(covered),
+                                        updated_at = CURRENT_TIMESTAMP
+                """
+                cursor.execute(sql, (session_id, summary, covered))
+            connection.commit()
+        finally:
+            self._release_connection(connection)
 
     def clear_session_history(self, session_id: str):
         """从 MySQL 清除指定会话的历史"""
@@ -134,10 +495,14 @@ class MySQLSessionManager:
             with connection.cursor() as cursor:
                 sql = "DELETE FROM chat_sessions WHERE session_id = %s"
                 cursor.execute(sql, (session_id,))
+                deleted_count = cursor.rowcount
+                cursor.execute("DELETE FROM chat_messages WHERE session_id = %s", (session_id,))
+                deleted_count += cursor.rowcount
+                cursor.execute("DELETE FROM chat_session_summaries WHERE session_id = %s", (session_id,))
             connection.commit()
 
             # 记录日志
-            if cursor.rowcount > 0:
+            if deleted_count > 0:
                 current_app.logger.info(f"Session {session_id} cleared from MySQL.")
             else:
                 current_app.logger.debug(f"Attempted to clear session {session_id}, but it did not exist in MySQL.")
@@ -145,15 +510,17 @@ class MySQLSessionManager:
             current_app.logger.error(f"Error clearing session history for {session_id}: {e}")
             # raise e # 根据需要决定是否抛出异常
         finally:
-            connection.close()
+            self._release_connection(connection)
 
     def ping(self):
         """测试 MySQL 连接"""
         try:
             connection = self._get_connection()
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT 1")
-            connection.close()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            finally:
+                self._release_connection(connection)
             return True
         except Exception as e:
             logging.error(f"MySQL health check failed: {e}")
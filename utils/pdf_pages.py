@@ -0,0 +1,124 @@
+# utils/pdf_pages.py
+# 子进程执行的函数只依赖本模块和 pypdf。进程池以 spawn 启动，子进程除本模块外还会重新导入父进程的主模块
+# （以 __mp_main__ 的名义，`if __name__ == '__main__'` 中的代码不会执行）：uvicorn / gunicorn 启动时主模块是服务器的启动脚本，
+# `python app.py` 启动时是 app.py，其顶层只导入 Flask 和 dotenv，应用本身在 create_app 中才导入，子进程不会加载整个应用
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import pypdf
+
+# 每个子进程缓存最近解析的 PDF：((路径, 大小, 修改时间), PdfReader)，不保留打开的文件
+_worker_reader = None
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _page_text(page) -> str:
+    """与 PyPDFLoader 的逐页结果一致"""
+    return page.extract_text(extraction_mode='plain').strip()
+
+
+def _extract_pages(filepath: str, start: int, end: int) -> list:
+    """
+    在子进程中提取 [start, end) 页的文本。
+    子进程缓存最近解析的 PDF 结构（交叉引用表、页面树），同一文件的后续页段不再重新解析；
+    文件只在处理一段期间打开，段结束即关闭，子进程不持有文件句柄，调用方可以随时删除临时文件
+    （Windows 下打开的文件无法删除）。
+    """
+    global _worker_reader
+    stat = os.stat(filepath)
+    # 按路径、大小和修改时间识别文件，同名文件被替换后不会沿用旧的页面树
+    key = (filepath, stat.st_size, stat.st_mtime_ns)
+    # 传入文件对象而不是路径，pypdf 按需读取，不会把整个文件读入内存
+    with open(filepath, 'rb') as stream:
+        if _worker_reader is None or _worker_reader[0] != key:
+            _worker_reader = (key, pypdf.PdfReader(stream))
+        reader = _worker_reader[1]
+        reader.stream = stream
+        try:
+            return [_page_text(reader.pages[i]) for i in range(start, end)]
+        finally:
+            # pypdf 会缓存解析过的对象（页面内容流等），处理完一段就丢弃，内存不随页数增长
+            reader.resolved_objects.clear()
+            reader.stream = None
+
+
+def _get_pool(workers: int):
+    """进程内共享的解析进程池；使用 spawn 启动，避免在多线程的服务进程中 fork"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def iter_pdf_pages(source, workers: int = 4, pages_per_task: int = 8, spill_dir: str = None):
+    """
+    按页序逐页产出 PDF 的文本，source 为文件路径或可 seek 的二进制文件对象。
+    页数较多时按 pages_per_task 页一段交给进程池并行提取，同时最多有 workers * 2 段在处理中，
+    已提取但未被消费的页数有上限，内存占用与文件大小无关。
+    子进程需要通过路径读取文件，source 为文件对象时先写入 spill_dir 下的临时文件。
+    """
+    stream = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        stream.seek(0)
+        reader = pypdf.PdfReader(stream)
+        # 直接读取页面树根节点上的页数，避免展开整个页面树
+        total = int(reader.root_object['/Pages']['/Count'])
+        if workers <= 1 or total <= pages_per_task * 2:
+            for i, page in enumerate(reader.pages, start=1):
+                yield _page_text(page)
+                if i % pages_per_task == 0:
+                    reader.resolved_objects.clear()
+            return
+        # 页面交给子进程提取，本进程不保留页面树
+        del reader
+
+        if isinstance(source, str):
+            yield from _iter_pages_in_pool(source, total, workers, pages_per_task)
+            return
+        with tempfile.NamedTemporaryFile(dir=spill_dir, suffix='.pdf', delete=False) as spill:
+            stream.seek(0)
+            shutil.copyfileobj(stream, spill, 1024 * 1024)
+        try:
+            yield from _iter_pages_in_pool(spill.name, total, workers, pages_per_task)
+        finally:
+            os.remove(spill.name)
+    finally:
+        if isinstance(source, str):
+            stream.close()
+
+
+def _iter_pages_in_pool(filepath: str, total: int, workers: int, pages_per_task: int):
+    pool = _get_pool(workers)
+    pending = deque()
+    try:
+        for start in range(0, total, pages_per_task):
+            pending.append(pool.submit(_extract_pages, filepath, start, min(start + pages_per_task, total)))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # 调用方提前停止迭代或出错时，取消尚未开始的页段，并等待已经开始的页段结束（之后才能删除临时文件）
+        for future in pending:
+            future.cancel()
+        wait(pending)
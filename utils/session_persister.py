@@ -0,0 +1,151 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from .mysql_storage import messages_to_json
+
+
+class SessionPersister:
+    """
+    Redis -> MySQL 的 write-behind 持久化。
+    每轮对话结束时只把会话标记为脏数据并立即返回，后台线程按 flush_interval 周期（或积压达到 batch_size 时）
+    合并脏会话，以多行 upsert / insert 批量写入 MySQL；进程退出时会把未写入的数据全部刷盘。
+    """
+
+    def __init__(self, app, mysql_manager, flush_interval=1.0, batch_size=100):
+        self.app = app
+        self.mysql_manager = mysql_manager
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        # blob 模式：同一会话只保留最新一份完整历史
+        self._pending_histories = {}
+        # append 模式：同一会话的新增消息按顺序累积
+        self._pending_messages = {}
+        self._lock = threading.Lock()
+        # 保证同一时刻只有一个线程在刷盘，避免同一会话的消息乱序写入
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._stats = Counter()
+        # 刷盘失败后，在下一个刷盘周期之前不再因积压提前唤醒，避免数据库故障时反复重试
+        self._retry_after = 0.0
+
+        self._worker = threading.Thread(target=self._run, name='session-persister', daemon=True)
+        self._worker.start()
+        atexit.register(self.shutdown)
+
+    def mark_dirty(self, session_id: str, history: list = None, new_messages: list = None):
+        """
+        标记会话需要持久化。
+        blob 模式传入完整 history，append 模式传入本轮新增的 new_messages。
+        """
+        with self._lock:
+            if history is not None:
+                self._pending_histories[session_id] = messages_to_json(history)
+            if new_messages:
+                self._pending_messages.setdefault(session_id, []).extend(messages_to_json(new_messages))
+            self._stats['marked'] += 1
+            backlog = len(self._pending_histories) + len(self._pending_messages)
+
+        if backlog >= self.batch_size and time.monotonic() >= self._retry_after:
+            self._wakeup.set()
+
+    def is_pending(self, session_id: str):
+        """会话是否还有尚未写入 MySQL 的数据"""
+        with self._lock:
+            return session_id in self._pending_histories or session_id in self._pending_messages
+
+    def discard(self, session_id: str, clear=None):
+        """
+        丢弃会话尚未写入 MySQL 的数据。传入 clear 时在持有刷盘锁期间调用它（例如删除 MySQL 中的会话），
+        正在进行的刷盘先完成，之后的刷盘不会再把丢弃前的数据写回 MySQL。
+        """
+        with self._flush_lock:
+            with self._lock:
+                discarded = self._pending_histories.pop(session_id, None) is not None
+                discarded = self._pending_messages.pop(session_id, None) is not None or discarded
+                if discarded:
+                    self._stats['discarded'] += 1
+            if clear is not None:
+                clear()
+
+    def flush(self):
+        """把当前所有脏会话批量写入 MySQL；写入失败的批次会放回队列等待下次重试"""
+        with self._flush_lock:
+            with self._lock:
+                histories, self._pending_histories = self._pending_histories, {}
+                messages, self._pending_messages = self._pending_messages, {}
+
+            if not histories and not messages:
+                return
+
+            start = time.perf_counter()
+            history_items = list(histories.items())
+            for i in range(0, len(history_items), self.batch_size):
+                batch = dict(history_items[i:i + self.batch_size])
+                try:
+                    self.mysql_manager.upsert_session_histories(batch)
+                    self._stats['sessions_written'] += len(batch)
+                except Exception as e:
+                    logging.error(f"Error flushing {len(batch)} session histories to MySQL: {e}")
+                    self._stats['failures'] += 1
+                    self._retry_after = time.monotonic() + self.flush_interval
+                    self._requeue_histories(batch)
+
+            message_items = list(messages.items())
+            for i in range(0, len(message_items), self.batch_size):
+                batch = dict(message_items[i:i + self.batch_size])
+                rows = [(session_id, msg['type'], msg['content'])
+                        for session_id, msgs in batch.items() for msg in msgs]
+                try:
+                    self.mysql_manager.insert_messages(rows)
+                    self._stats['messages_written'] += len(rows)
+                except Exception as e:
+                    logging.error(f"Error flushing {len(rows)} session messages to MySQL: {e}")
+                    self._stats['failures'] += 1
+                    self._retry_after = time.monotonic() + self.flush_interval
+                    self._requeue_messages(batch)
+
+            self._stats['flushes'] += 1
+            logging.info(f"Flushed {len(histories) + len(messages)} sessions to MySQL "
+                         f"in {(time.perf_counter() - start) * 1000:.1f} ms.")
+
+    def _requeue_histories(self, batch: dict):
+        with self._lock:
+            for session_id, history_json in batch.items():
+                # 期间若已有更新的完整历史，则以新的为准
+                self._pending_histories.setdefault(session_id, history_json)
+
+    def _requeue_messages(self, batch: dict):
+        with self._lock:
+            for session_id, msgs in batch.items():
+                # 失败的旧消息排在期间新增的消息之前
+                self._pending_messages[session_id] = msgs + self._pending_messages.get(session_id, [])
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception as e:
+                logging.error(f"Session persister flush failed: {e}")
+
+    def shutdown(self):
+        """停止后台线程，并把剩余的脏数据全部写入 MySQL"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._worker.join(timeout=max(self.flush_interval * 2, 5))
+        with self.app.app_context():
+            self.flush()
+
+    def get_stats(self):
+        with self._lock:
+            pending = len(self._pending_histories) + len(self._pending_messages)
+        return {'pending_sessions': pending, **self._stats}
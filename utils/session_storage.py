@@ -1,39 +1,59 @@
+import asyncio
 import json
 import logging
+import threading
+import weakref
+
 import redis
+import redis.asyncio
 from flask import current_app
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from .mysql_storage import session_manager as mysql_session_manager
+from .mysql_storage import session_manager as mysql_session_manager, messages_to_json, messages_from_json
 
 
 class RedisSessionManager:
     def __init__(self):
-        pass
+        # 进程内共享的连接池，首次使用时按 Flask 配置创建
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # write-behind 持久化器，未设置时每轮对话同步写入 MySQL
+        self.persister = None
 
-    def _get_redis_client(self):
-        """获取 Redis 客户端实例"""
-        # 从 Flask 应用配置中获取 Redis 连接信息
+    def set_persister(self, persister):
+        """启用 write-behind：对话结束时只标记脏会话，由后台线程批量写入 MySQL"""
+        self.persister = persister
+
+    def _create_pool(self, pool_class=redis.ConnectionPool):
+        """根据 Flask 应用配置创建 Redis 连接池"""
         redis_host = current_app.config.get('REDIS_HOST', 'localhost')
         redis_port = current_app.config.get('REDIS_PORT', 6379)
         redis_db = current_app.config.get('REDIS_DB', 0)
         redis_password = current_app.config.get('REDIS_PASSWORD', None)
         redis_url = current_app.config.get('REDIS_URL', None)
 
+        pool_kwargs = {
+            'max_connections': current_app.config.get('REDIS_MAX_CONNECTIONS', 50),
+            'socket_timeout': current_app.config.get('REDIS_SOCKET_TIMEOUT', 5),
+            'socket_connect_timeout': current_app.config.get('REDIS_SOCKET_CONNECT_TIMEOUT', 2),
+            # 只对空闲超过该秒数的连接在取出时做 PING，代替每次调用都 PING
+            'health_check_interval': current_app.config.get('REDIS_HEALTH_CHECK_INTERVAL', 30),
+        }
+
         if redis_url:
-            pool = redis.ConnectionPool.from_url(redis_url)
-            r = redis.Redis(connection_pool=pool)
-        else:
-            pool = redis.ConnectionPool(host=redis_host, port=redis_port, db=redis_db, password=redis_password)
-            r = redis.Redis(connection_pool=pool)
+            return pool_class.from_url(redis_url, **pool_kwargs)
+        return pool_class(host=redis_host, port=redis_port, db=redis_db, password=redis_password, **pool_kwargs)
 
-        # 测试连接
-        try:
-            r.ping()
-        except redis.ConnectionError as e:
-            current_app.logger.error(f"Could not connect to Redis: {e}")
-            raise e
+    def _get_redis_client(self):
+        """获取 Redis 客户端实例（共享同一个连接池，不再每次新建连接池并 PING）"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = self._create_pool()
+        return redis.Redis(connection_pool=self._pool)
 
-        return r
+    @staticmethod
+    def _append_mode():
+        """SESSION_STORAGE_MODE 为 'append' 时按条追加消息，默认 'blob' 整段覆盖写入"""
+        return current_app.config.get('SESSION_STORAGE_MODE', 'blob') == 'append'
 
     def get_session_history(self, session_id: str, default=None):
         """
@@ -42,6 +62,9 @@ class RedisSessionManager:
         """
         if default is None:
             default = []
+        if self._append_mode():
+            return self._get_session_log(session_id, default)
+
         redis_client = self._get_redis_client()
         key = f"chat_session:{session_id}"
 
@@ -49,16 +72,7 @@ class RedisSessionManager:
         if session_data:
             # Redis 中有数据，直接返回
             try:
-                history_json = json.loads(session_data)
-                history = []
-                for msg_obj in history_json:
-                    if msg_obj['type'] == 'human':
-                        content = msg_obj['content']
-                        history.append(HumanMessage(content=content))
-                    elif msg_obj['type'] == 'ai':
-                        history.append(AIMessage(content=msg_obj['content']))
-                    elif msg_obj['type'] == 'system':
-                        history.append(SystemMessage(content=msg_obj['content']))
+                history = messages_from_json(json.loads(session_data))
                 logging.info(f"Retrieved session {session_id} from Redis.")
                 return history
             except (json.JSONDecodeError, KeyError, TypeError) as e:
@@ -70,25 +84,63 @@ class RedisSessionManager:
             logging.info(f"Session {session_id} not found in Redis, attempting to load from MySQL.")
             return self._load_from_mysql_and_cache(session_id, default)
 
+    def _get_session_log(self, session_id: str, default):
+        """追加写模式：从 Redis 列表 chat_session_log:<session_id> 读取逐条消息"""
+        redis_client = self._get_redis_client()
+        key = f"chat_session_log:{session_id}"
+
+        entries = redis_client.lrange(key, 0, -1)
+        if entries:
+            try:
+                history = messages_from_json([json.loads(entry) for entry in entries])
+                logging.info(f"Retrieved session {session_id} log from Redis.")
+                return history
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                current_app.logger.error(f"Error loading session log for {session_id} from Redis: {e}")
+        else:
+            logging.info(f"Session {session_id} log not found in Redis, attempting to load from MySQL.")
+        return self._load_from_mysql_and_cache(session_id, default)
+
+    def _cache_session_log(self, session_id: str, history: list, expire_time=3600):
+        """用完整历史重建 Redis 中的消息列表（仅在缓存未命中时发生）"""
+        key = f"chat_session_log:{session_id}"
+        pipe = self._get_redis_client().pipeline(transaction=True)
+        pipe.delete(key)
+        entries = [json.dumps(msg, ensure_ascii=False) for msg in messages_to_json(history)]
+        if entries:
+            pipe.rpush(key, *entries)
+            pipe.expire(key, expire_time)
+        pipe.execute()
+
     def _load_from_mysql_and_cache(self, session_id: str, default):
         """从 MySQL 加载会话历史并缓存到 Redis"""
         try:
-            history_from_mysql = mysql_session_manager.get_session_history(session_id, default)
-            # 将从 MySQL 加载的数据存入 Redis，供后续快速访问
-            self.set_session_history(session_id, history_from_mysql)
+            if self.persister is not None and self.persister.is_pending(session_id):
+                # Redis 缓存已失效但还有未刷盘的数据，先写入 MySQL 再读取
+                self.persister.flush()
+            if self._append_mode():
+                history_from_mysql = mysql_session_manager.get_session_messages(session_id, default)
+                self._cache_session_log(session_id, history_from_mysql)
+            else:
+                history_from_mysql = mysql_session_manager.get_session_history(session_id, default)
+                # 将从 MySQL 加载的数据存入 Redis，供后续快速访问
+                self.set_session_history(session_id, history_from_mysql)
             logging.info(f"Loaded session {session_id} from MySQL and cached in Redis.")
             return history_from_mysql
         except Exception as e:
             current_app.logger.error(f"Error loading session {session_id} from MySQL: {e}")
             return default
 
-    def sync_session_to_mysql(self, session_id: str):
+    def sync_session_to_mysql(self, session_id: str, history: list = None):
         """
         从 Redis 获取会话历史并同步到 MySQL。
-        这个方法需要在对话结束时被调用。
+        这个方法需要在对话结束时被调用；若调用方已持有刚写入 Redis 的历史，可直接传入 history，省去一次 Redis 读取。
         """
-        # 从 Redis 获取最新的会话历史
-        latest_history_from_redis = self.get_session_history(session_id, default=[])
+        if history is not None:
+            latest_history_from_redis = history
+        else:
+            # 从 Redis 获取最新的会话历史
+            latest_history_from_redis = self.get_session_history(session_id, default=[])
 
         try:
             # 将最新的历史保存到 MySQL
@@ -97,34 +149,109 @@ class RedisSessionManager:
         except Exception as e:
             current_app.logger.error(f"Error syncing session {session_id} to MySQL: {e}")
 
+    @staticmethod
+    def _serialize_history(history: list):
+        """将 LangChain 消息对象转换为可 JSON 序列化的格式"""
+        return messages_to_json(history)
+
+    def append_session_messages(self, session_id: str, messages: list, history: list = None, expire_time=3600):
+        """
+        追加写模式：将本轮新增的消息追加到 Redis 列表，并刷新过期时间（一次往返）。
+        若列表已过期不存在，则用调用方传入的完整 history 重建，避免缓存中只剩下部分消息。
+        """
+        if not messages:
+            return
+        key = f"chat_session_log:{session_id}"
+        entries = [json.dumps(msg, ensure_ascii=False) for msg in messages_to_json(messages)]
+        try:
+            pipe = self._get_redis_client().pipeline(transaction=True)
+            pipe.rpushx(key, *entries)
+            pipe.expire(key, expire_time)
+            length, _ = pipe.execute()
+            if not length and history is not None:
+                self._cache_session_log(session_id, history, expire_time)
+        except Exception as e:
+            current_app.logger.error(f"Error appending session messages for {session_id}: {e}")
+
+    def save_session_turn(self, session_id: str, history: list, new_messages: list):
+        """
+        保存一轮对话的结果并同步到 MySQL。
+        blob 模式下整段覆盖写入 history；append 模式下只追加本轮新增的 new_messages。
+        """
+        if not self._append_mode():
+            self.set_session_history(session_id, history)
+            if self.persister is not None:
+                self.persister.mark_dirty(session_id, history=history)
+            else:
+                self.sync_session_to_mysql(session_id, history)
+            return
+
+        self.append_session_messages(session_id, new_messages, history)
+        if self.persister is not None:
+            self.persister.mark_dirty(session_id, new_messages=new_messages)
+            return
+        try:
+            mysql_session_manager.append_session_messages(session_id, new_messages)
+            logging.info(f"Appended {len(new_messages)} messages of session {session_id} to MySQL.")
+        except Exception as e:
+            current_app.logger.error(f"Error appending session {session_id} to MySQL: {e}")
 
     def set_session_history(self, session_id: str, history: list, expire_time=3600):
         """将会话历史保存到 Redis"""
         redis_client = self._get_redis_client()
         key = f"chat_session:{session_id}"
 
-        history_json = []
-        for msg in history:
-            if isinstance(msg, HumanMessage):
-                history_json.append({'type': 'human', 'content': msg.content})
-            elif isinstance(msg, AIMessage):
-                history_json.append({'type': 'ai', 'content': msg.content})
-            elif isinstance(msg, SystemMessage):
-                history_json.append({'type': 'system', 'content': msg.content})
+        history_json = self._serialize_history(history)
 
         try:
             redis_client.setex(key, expire_time, json.dumps(history_json))
         except Exception as e:
             current_app.logger.error(f"Error saving session history for {session_id}: {e}")
 
+    def get_session_summary(self, session_id: str, expire_time=3600):
+        """
+        获取会话的滚动摘要 {'summary', 'covered'}（覆盖会话开头的前 covered 条消息），没有摘要时返回 None。
+        Redis 中没有时从 MySQL 加载并回填；MySQL 中也没有时缓存一个空摘要，避免每轮对话都查询 MySQL。
+        """
+        redis_client = self._get_redis_client()
+        key = f"chat_session_summary:{session_id}"
+
+        data = redis_client.get(key)
+        if data:
+            try:
+                record = json.loads(data)
+                return record if record['summary'] else None
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                current_app.logger.error(f"Error loading session summary for {session_id} from Redis: {e}")
+
+        try:
+            record = mysql_session_manager.get_session_summary(session_id)
+        except Exception as e:
+            current_app.logger.error(f"Error loading session summary for {session_id} from MySQL: {e}")
+            return None
+        redis_client.setex(key, expire_time, json.dumps(record or {'summary': '', 'covered': 0}, ensure_ascii=False))
+        return record
+
+    def set_session_summary(self, session_id: str, summary: str, covered: int, expire_time=3600):
+        """保存会话的滚动摘要到 Redis 和 MySQL"""
+        record = {'summary': summary, 'covered': covered}
+        self._get_redis_client().setex(f"chat_session_summary:{session_id}", expire_time,
+                                       json.dumps(record, ensure_ascii=False))
+        try:
+            mysql_session_manager.set_session_summary(session_id, summary, covered)
+        except Exception as e:
+            current_app.logger.error(f"Error saving session summary for {session_id} to MySQL: {e}")
+
     def clear_session_history(self, session_id: str):
-        """从 Redis 清除指定会话的历史"""
+        """从 Redis 和 MySQL 清除指定会话的历史，尚未写入 MySQL 的数据一并丢弃"""
         redis_client = self._get_redis_client()
         key = f"chat_session:{session_id}"
+        log_key = f"chat_session_log:{session_id}"
+        summary_key = f"chat_session_summary:{session_id}"
 
         # Redis 的 delete 命令即使键不存在也不会报错
-        # 它会返回删除的键的数量 (0 或 1)
-        deleted_count = redis_client.delete(key)
+        # 它会返回删除的键的数量 (0 ~ 3)，同时清理两种存储模式下的键和滚动摘要
+        deleted_count = redis_client.delete(key, log_key, summary_key)
 
         # 可以选择性地记录日志，区分是否真的删除了数据
         if deleted_count > 0:
@@ -133,15 +260,28 @@ class RedisSessionManager:
             current_app.logger.debug(
                 f"Attempted to clear session {session_id}, but it did not exist in Redis.")  # 使用 debug 级别，避免日志过多
 
-    def print_session_history(self, session_id: str):
-        """打印指定会话的所有对话历史，处理可能的编码问题"""
-        redis_client = self._get_redis_client()
-        key = f"chat_session:{session_id}"
+        # 否则 Redis 过期后会从 MySQL 重新加载已清除的历史；
+        # 后台持久化中尚未写入的数据先丢弃，再在刷盘锁内删除 MySQL 中的记录，避免清除后又被写回
+        if self.persister is not None:
+            self.persister.discard(session_id, clear=lambda: mysql_session_manager.clear_session_history(session_id))
+        else:
+            mysql_session_manager.clear_session_history(session_id)
+
+    def print_session_history(self, session_id: str, history: list = None):
+        """打印指定会话的所有对话历史，处理可能的编码问题；传入已读取的 history 时不再访问 Redis"""
+        if history is None and self._append_mode():
+            history = self.get_session_history(session_id)
+
+        if history is not None:
+            session_data = self._serialize_history(history)
+        else:
+            redis_client = self._get_redis_client()
+            key = f"chat_session:{session_id}"
+            session_data = redis_client.get(key)
 
-        session_data = redis_client.get(key)
         if session_data:
             try:
-                history_json = json.loads(session_data)
+                history_json = session_data if isinstance(session_data, list) else json.loads(session_data)
                 print(f"\n--- Session History for ID: {session_id} ---")
                 for i, msg_obj in enumerate(history_json):
                     msg_type = msg_obj['type'].upper()
@@ -171,5 +311,80 @@ class RedisSessionManager:
             return False
 
 
+class AsyncRedisSessionManager:
+    """
+    RedisSessionManager 的 asyncio 版本，供异步服务模式使用。
+    Redis 读写使用 redis.asyncio；缓存未命中时的 MySQL 加载和未启用 write-behind 时的同步写入放到线程中执行，
+    存储模式、write-behind 持久化器等配置与同步版本共用。
+    """
+
+    def __init__(self, sync_manager: RedisSessionManager):
+        self.sync_manager = sync_manager
+        # redis.asyncio 的连接池绑定在创建它的事件循环上，按事件循环分别创建（通常每个 worker 只有一个）
+        self._pools = weakref.WeakKeyDictionary()
+
+    def _get_redis_client(self):
+        loop = asyncio.get_running_loop()
+        pool = self._pools.get(loop)
+        if pool is None:
+            pool = self._pools[loop] = self.sync_manager._create_pool(redis.asyncio.ConnectionPool)
+        return redis.asyncio.Redis(connection_pool=pool)
+
+    async def get_session_history(self, session_id: str, default=None):
+        """从 Redis 获取会话历史，未命中时从 MySQL 加载并回填缓存"""
+        if default is None:
+            default = []
+        redis_client = self._get_redis_client()
+
+        try:
+            if self.sync_manager._append_mode():
+                entries = await redis_client.lrange(f"chat_session_log:{session_id}", 0, -1)
+                if entries:
+                    return messages_from_json([json.loads(entry) for entry in entries])
+            else:
+                session_data = await redis_client.get(f"chat_session:{session_id}")
+                if session_data:
+                    return messages_from_json(json.loads(session_data))
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            current_app.logger.error(f"Error loading session history for {session_id} from Redis: {e}")
+
+        # asyncio.to_thread 会复制当前上下文，线程中同样可以访问 current_app
+        return await asyncio.to_thread(self.sync_manager._load_from_mysql_and_cache, session_id, default)
+
+    async def save_session_turn(self, session_id: str, history: list, new_messages: list, expire_time=3600):
+        """保存一轮对话的结果，语义与 RedisSessionManager.save_session_turn 相同"""
+        redis_client = self._get_redis_client()
+        append_mode = self.sync_manager._append_mode()
+
+        try:
+            if append_mode:
+                key = f"chat_session_log:{session_id}"
+                entries = [json.dumps(msg, ensure_ascii=False) for msg in messages_to_json(new_messages)]
+                if entries:
+                    async with redis_client.pipeline(transaction=True) as pipe:
+                        pipe.rpushx(key, *entries)
+                        pipe.expire(key, expire_time)
+                        length, _ = await pipe.execute()
+                    if not length:
+                        await asyncio.to_thread(self.sync_manager._cache_session_log, session_id, history,
+                                                expire_time)
+            else:
+                await redis_client.setex(f"chat_session:{session_id}", expire_time,
+                                         json.dumps(messages_to_json(history)))
+        except Exception as e:
+            current_app.logger.error(f"Error saving session history for {session_id}: {e}")
+
+        persister = self.sync_manager.persister
+        if persister is not None:
+            if append_mode:
+                persister.mark_dirty(session_id, new_messages=new_messages)
+            else:
+                persister.mark_dirty(session_id, history=history)
+        elif append_mode:
+            await asyncio.to_thread(mysql_session_manager.append_session_messages, session_id, new_messages)
+        else:
+            await asyncio.to_thread(self.sync_manager.sync_session_to_mysql, session_id, history)
+
+
 # 创建一个全局实例，以便在其他模块中使用
 session_manager = RedisSessionManager()
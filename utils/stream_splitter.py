@@ -0,0 +1,43 @@
+# utils/stream_splitter.py
+
+
+class StreamingSplitter:
+    """
+    把逐段到达的文本增量切分为分片：文本先进入缓冲区，缓冲区长度达到 flush_size 时切分一次，
+    产出除最后一片以外的分片，最后一片留作下一次切分的开头，这样分片边界和重叠与整篇切分基本一致，
+    而缓冲区大小不随文档长度增长。
+    """
+
+    def __init__(self, splitter, flush_size: int, length_function=len, separator: str = '\n'):
+        self.splitter = splitter
+        self.flush_size = flush_size
+        self.length_function = length_function
+        self.separator = separator
+        self._buffer = ''
+        self._buffer_length = 0
+
+    def feed(self, text: str) -> list:
+        """追加一段文本，返回已经可以确定的分片"""
+        if not text:
+            return []
+        if self._buffer:
+            self._buffer += self.separator + text
+        else:
+            self._buffer = text
+        self._buffer_length += self.length_function(text)
+        if self._buffer_length < self.flush_size:
+            return []
+
+        parts = self.splitter.split_text(self._buffer)
+        if not parts:
+            self._buffer, self._buffer_length = '', 0
+            return []
+        self._buffer = parts[-1]
+        self._buffer_length = self.length_function(self._buffer)
+        return parts[:-1]
+
+    def close(self) -> list:
+        """返回缓冲区中剩余的分片"""
+        parts = self.splitter.split_text(self._buffer) if self._buffer else []
+        self._buffer, self._buffer_length = '', 0
+        return parts
@@ -0,0 +1,205 @@
+# utils/summarizer.py
+import hashlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from models.llm_factory import get_llm
+from models.prompts import GENERATE_SUMMARY_PROMPT, REDUCE_SUMMARY_PROMPT
+from utils.file_util import get_generate_summary_chain
+from utils.stream_splitter import StreamingSplitter
+from utils.token_utils import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# 分段摘要失败时，用段落开头的这么多个字符代替
+FALLBACK_LEAD_CHARS = 300
+# 合并摘要的最大层数，超过后直接拼接截断
+MAX_REDUCE_DEPTH = 4
+
+
+def get_reduce_summary_chain(llm):
+    """合并分段摘要的链"""
+    reduce_summary_prompt = ChatPromptTemplate.from_messages([
+        ('system', REDUCE_SUMMARY_PROMPT),
+        ('human', '{input}')
+    ])
+    return reduce_summary_prompt | llm | StrOutputParser()
+
+
+class RedisSummaryCache:
+    """分段摘要缓存，保存在 Redis 中（summary_section:{key}），按 TTL 过期"""
+
+    def __init__(self, get_client, ttl: int = 7 * 86400):
+        self.get_client = get_client
+        self.ttl = ttl
+
+    def get_many(self, keys: list) -> dict:
+        if not keys:
+            return {}
+        values = self.get_client().mget([f"summary_section:{key}" for key in keys])
+        return {key: value.decode('utf-8') if isinstance(value, bytes) else value
+                for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items: dict):
+        if not items:
+            return
+        pipe = self.get_client().pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(f"summary_section:{key}", value, ex=self.ttl)
+        pipe.execute()
+
+
+class DocumentSummarizer:
+    """
+    长文档的分层（map-reduce）摘要：
+    - 不超过 section_tokens 的文档直接一次生成摘要；
+    - 更长的文档按 token 数切分为段落，最多 fan_out 个段落并发生成分段摘要（map），分段摘要可缓存复用；
+    - 分段摘要合并后仍超过 section_tokens 时按组逐层合并，直到可以一次生成最终摘要（reduce）。
+    单个段落摘要失败时以段落开头代替，合并失败时以分段摘要拼接代替，不会让整个文档入库失败。
+    """
+
+    def __init__(self, section_tokens: int = 4000, fan_out: int = 8, cache: RedisSummaryCache = None):
+        self.section_tokens = section_tokens
+        self.fan_out = fan_out
+        self.cache = cache
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=section_tokens, chunk_overlap=0, length_function=count_tokens,
+            separators=["\n\n", "\n", "。", ".", " ", ""])
+
+    def summarize(self, text: str) -> str:
+        # get_llm 需在有 app_context 时调用
+        llm = get_llm()
+        map_chain = get_generate_summary_chain(llm)
+        if count_tokens(text) <= self.section_tokens:
+            return self._map([text], map_chain, llm)[0]
+
+        sections = self.splitter.split_text(text)
+        logger.info(f"Summarizing document in {len(sections)} sections (fan-out {self.fan_out})")
+        partials = self._map(sections, map_chain, llm)
+        return self._reduce(partials, get_reduce_summary_chain(llm))
+
+    def stream(self) -> 'SummaryStream':
+        """逐段接收文本的摘要过程，用于边解析边生成分段摘要"""
+        # get_llm 需在有 app_context 时调用
+        return SummaryStream(self, get_llm())
+
+    def _cache_key(self, llm, text: str) -> str:
+        model_name = getattr(llm, 'model_name', type(llm).__name__)
+        return hashlib.sha256(f"{model_name}\0{GENERATE_SUMMARY_PROMPT}\0{text}".encode('utf-8')).hexdigest()
+
+    def _map(self, sections: list, chain, llm) -> list:
+        """并发生成分段摘要，结果与 sections 一一对应"""
+        keys = [self._cache_key(llm, section) for section in sections]
+        cached = {}
+        if self.cache is not None:
+            try:
+                cached = self.cache.get_many(keys)
+            except Exception as e:
+                logger.warning(f"Failed to read section summary cache: {e}")
+
+        pending = [i for i, key in enumerate(keys) if key not in cached]
+        results = chain.batch([{'input': sections[i]} for i in pending],
+                              config={'max_concurrency': self.fan_out}, return_exceptions=True)
+
+        summaries = [cached.get(key) for key in keys]
+        fresh = {}
+        for i, result in zip(pending, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to summarize section {i + 1}/{len(sections)}, using its opening instead: {result}")
+                summaries[i] = self._lead(sections[i])
+            else:
+                summaries[i] = result
+                fresh[keys[i]] = result
+
+        if self.cache is not None and fresh:
+            try:
+                self.cache.set_many(fresh)
+            except Exception as e:
+                logger.warning(f"Failed to write section summary cache: {e}")
+        return summaries
+
+    def _reduce(self, partials: list, chain, depth: int = 0) -> str:
+        combined = "\n\n".join(partials)
+        if count_tokens(combined) <= self.section_tokens or depth >= MAX_REDUCE_DEPTH:
+            try:
+                return chain.invoke({'input': combined})
+            except Exception as e:
+                logger.warning(f"Failed to reduce section summaries, using them as-is: {e}")
+                return combined
+
+        # 分段摘要合起来仍然太长：按顺序分组，每组合并为一段，再进入下一层
+        groups, group, group_tokens = [], [], 0
+        for partial in partials:
+            tokens = count_tokens(partial)
+            if group and group_tokens + tokens > self.section_tokens:
+                groups.append(group)
+                group, group_tokens = [], 0
+            group.append(partial)
+            group_tokens += tokens
+        groups.append(group)
+
+        results = chain.batch([{'input': "\n\n".join(g)} for g in groups],
+                              config={'max_concurrency': self.fan_out}, return_exceptions=True)
+        merged = ["\n\n".join(g) if isinstance(result, Exception) else result for g, result in zip(groups, results)]
+        return self._reduce(merged, chain, depth + 1)
+
+    @staticmethod
+    def _lead(section: str) -> str:
+        return section[:FALLBACK_LEAD_CHARS] + ('……' if len(section) > FALLBACK_LEAD_CHARS else '')
+
+
+class SummaryStream:
+    """
+    逐段接收文档文本：攒够一个段落（section_tokens）就在后台线程生成分段摘要，最多 fan_out 个并发，
+    已切出但尚未摘要的段落最多 fan_out * 2 个；finish() 等待剩余的分段摘要并合并出最终摘要。
+    整篇文档不超过一个段落时与 DocumentSummarizer.summarize 一样只调用一次。
+    """
+
+    def __init__(self, summarizer: DocumentSummarizer, llm):
+        self.summarizer = summarizer
+        self.llm = llm
+        self.map_chain = get_generate_summary_chain(llm)
+        self.splitter = StreamingSplitter(summarizer.splitter, flush_size=summarizer.section_tokens * 2,
+                                          length_function=count_tokens)
+        self._executor = None
+        self._pending = deque()
+        self._partials = []
+
+    def add(self, text: str):
+        for section in self.splitter.feed(text):
+            self._submit(section)
+
+    def _submit(self, section: str):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.summarizer.fan_out, thread_name_prefix='summary')
+        self._pending.append(self._executor.submit(self.summarizer._map, [section], self.map_chain, self.llm))
+        while len(self._pending) > self.summarizer.fan_out * 2:
+            self._partials.extend(self._pending.popleft().result())
+
+    def finish(self) -> str:
+        try:
+            remaining = self.splitter.close()
+            if self._executor is None and len(remaining) <= 1:
+                # 短文档：一次生成摘要
+                return self.summarizer._map(remaining, self.map_chain, self.llm)[0] if remaining else ''
+            for section in remaining:
+                self._submit(section)
+            while self._pending:
+                self._partials.extend(self._pending.popleft().result())
+            logger.info(f"Summarizing streamed document from {len(self._partials)} sections "
+                        f"(fan-out {self.summarizer.fan_out})")
+            return self.summarizer._reduce(self._partials, get_reduce_summary_chain(self.llm))
+        finally:
+            self.close()
+
+    def close(self):
+        """放弃尚未开始的分段摘要并释放线程"""
+        for future in self._pending:
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
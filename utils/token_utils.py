@@ -0,0 +1,42 @@
+# utils/token_utils.py
+import logging
+import re
+import threading
+
+# 中日韩文字按每字一个 token 估算，其余字符按每 4 个字符一个 token 估算
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """tiktoken 的 cl100k_base 编码；首次使用需要下载词表，失败后改用估算，不再重试"""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding('cl100k_base')
+                except Exception as e:
+                    _encoding_failed = True
+                    logging.warning(f"tiktoken is unavailable, falling back to estimated token counts: {e}")
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """不依赖词表的 token 数估算"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """文本的 token 数。不同模型的分词不同，这里只用于预算控制，不要求精确"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
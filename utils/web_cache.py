@@ -0,0 +1,276 @@
+# utils/web_cache.py
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from urllib.parse import urlsplit, urlunsplit
+
+from models.query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# 只删除自己持有的锁：锁已过期并被其他进程重新获取时不删除
+_UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# 发出请求的调用被取消（客户端断开等）时交给等待的调用的结果，收到后各自重新尝试
+_RETRY = object()
+
+
+def normalize_url(url: str) -> str:
+    """URL 归一化：去掉首尾空白和 # 片段，协议和主机名转小写，空路径补 /"""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', parts.query, ''))
+
+
+def web_cache_key(kind: str, target: str, params: dict) -> str:
+    """缓存键：请求类型 + 归一化后的查询或 URL + 请求参数"""
+    target = normalize_url(target) if kind == 'crawl' else normalize_query(target)
+    payload = json.dumps([target, params], sort_keys=True, ensure_ascii=False)
+    return f"{kind}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class WebResultCache:
+    """
+    联网搜索、网页爬取（Tavily）结果的共享缓存，保存在 Redis 中（web_cache:{key}），按请求类型设置 TTL，所有 worker 进程共用。
+    - 进程内相同的请求同时只发出一个，其余调用等待它的结果（single-flight），同步和异步调用之间同样合并；
+    - 跨进程用 Redis 锁（web_cache_lock:{key}，值为随机 token，只由持有者删除）合并：
+      没有拿到锁的进程在 lock_wait 秒内轮询结果，等不到时自己请求；
+    - 进程内等待的调用同样最多等待 lock_wait 秒；发出请求的调用被取消时，等待的调用重新尝试，而不是一起被取消；
+    - 请求失败时不缓存，异常传给所有等待的调用；Redis 不可用时直接请求。
+    """
+
+    def __init__(self, get_client, get_async_client=None, ttls: dict = None, lock_ttl: int = 30,
+                 lock_wait: float = 20, poll_interval: float = 0.2):
+        self.get_client = get_client
+        self.get_async_client = get_async_client
+        self.ttls = {'search': 1800, 'crawl': 21600, **(ttls or {})}
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        self.poll_interval = poll_interval
+        # 进程内正在进行的请求：key -> Future
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _claim(self, key: str):
+        """返回 (Future, 是否由当前调用发出请求)"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future, False
+            self.stats['misses'] += 1
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _finish(self, key: str, future: Future, result=None, error: Exception = None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def _redis_error(self, action: str, key: str, e: Exception):
+        self._count('redis_errors')
+        logger.warning(f"Failed to {action} web cache entry {key}: {e}")
+
+    @staticmethod
+    def _decode(value):
+        return json.loads(value) if value is not None else None
+
+    def _get(self, key: str):
+        try:
+            return self._decode(self.get_client().get(f"web_cache:{key}"))
+        except Exception as e:
+            self._redis_error('read', key, e)
+            return None
+
+    def _set(self, key: str, result):
+        try:
+            self.get_client().set(f"web_cache:{key}", json.dumps(result, ensure_ascii=False), ex=self._ttl(key))
+        except Exception as e:
+            self._redis_error('write', key, e)
+
+    def _try_lock(self, key: str):
+        """获取跨进程的请求锁，返回锁的 token；锁被其他进程持有时返回 None，Redis 不可用时视为拿到锁（直接请求）"""
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.get_client().set(f"web_cache_lock:{key}", token, nx=True, ex=self.lock_ttl)
+        except Exception as e:
+            self._redis_error('lock', key, e)
+            return token
+        return token if acquired else None
+
+    def _unlock(self, key: str, token: str):
+        try:
+            self.get_client().eval(_UNLOCK_SCRIPT, 1, f"web_cache_lock:{key}", token)
+        except Exception as e:
+            self._redis_error('unlock', key, e)
+
+    def _ttl(self, key: str) -> int:
+        return self.ttls.get(key.split(':', 1)[0], self.ttls['search'])
+
+    def get_or_fetch(self, key: str, fetch):
+        """返回缓存的结果，未命中时调用 fetch() 请求（结果需可 JSON 序列化）并写入缓存"""
+        while True:
+            cached = self._get(key)
+            if cached is not None:
+                self._count('hits')
+                return cached
+            future, leader = self._claim(key)
+            if leader:
+                break
+            try:
+                result = future.result(self.lock_wait)
+            except FutureTimeoutError:
+                # 发出请求的调用迟迟没有结果，自己请求
+                self._count('wait_timeouts')
+                return self._fetch_and_set(key, fetch)
+            if result is not _RETRY:
+                return result
+            self._count('retries')
+
+        try:
+            result = self._fetch_shared(key, fetch)
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, _RETRY)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def _fetch_and_set(self, key: str, fetch):
+        result = fetch()
+        self._set(key, result)
+        return result
+
+    def _fetch_shared(self, key: str, fetch):
+        """跨进程合并：拿到 Redis 锁的进程请求并写入缓存，其余进程轮询等待结果，等不到时自己请求"""
+        token = self._try_lock(key)
+        if token is None:
+            deadline = time.monotonic() + self.lock_wait
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                cached = self._get(key)
+                if cached is not None:
+                    self._count('coalesced_remote')
+                    return cached
+            self._count('lock_timeouts')
+        try:
+            return self._fetch_and_set(key, fetch)
+        finally:
+            if token is not None:
+                self._unlock(key, token)
+
+    async def aget_or_fetch(self, key: str, fetch):
+        """get_or_fetch 的异步版本，fetch 为协程函数"""
+        while True:
+            cached = await self._aget(key)
+            if cached is not None:
+                self._count('hits')
+                return cached
+            future, leader = self._claim(key)
+            if leader:
+                break
+            try:
+                # shield：等待的协程被取消时不影响共享的 Future
+                result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.lock_wait)
+            except asyncio.TimeoutError:
+                self._count('wait_timeouts')
+                return await self._afetch_and_set(key, fetch)
+            if result is not _RETRY:
+                return result
+            self._count('retries')
+
+        try:
+            result = await self._afetch_shared(key, fetch)
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, _RETRY)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def _afetch_and_set(self, key: str, fetch):
+        result = await fetch()
+        await self._aset(key, result)
+        return result
+
+    async def _afetch_shared(self, key: str, fetch):
+        token = await self._atry_lock(key)
+        if token is None:
+            deadline = time.monotonic() + self.lock_wait
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                cached = await self._aget(key)
+                if cached is not None:
+                    self._count('coalesced_remote')
+                    return cached
+            self._count('lock_timeouts')
+        try:
+            return await self._afetch_and_set(key, fetch)
+        finally:
+            if token is not None:
+                await self._aunlock(key, token)
+
+    # 异步版本的 Redis 读写使用 get_async_client（redis.asyncio），未提供时放到线程中执行
+
+    async def _aget(self, key: str):
+        if self.get_async_client is None:
+            return await asyncio.to_thread(self._get, key)
+        try:
+            return self._decode(await self.get_async_client().get(f"web_cache:{key}"))
+        except Exception as e:
+            self._redis_error('read', key, e)
+            return None
+
+    async def _aset(self, key: str, result):
+        if self.get_async_client is None:
+            return await asyncio.to_thread(self._set, key, result)
+        try:
+            await self.get_async_client().set(f"web_cache:{key}", json.dumps(result, ensure_ascii=False),
+                                              ex=self._ttl(key))
+        except Exception as e:
+            self._redis_error('write', key, e)
+
+    async def _atry_lock(self, key: str):
+        if self.get_async_client is None:
+            return await asyncio.to_thread(self._try_lock, key)
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self.get_async_client().set(f"web_cache_lock:{key}", token, nx=True, ex=self.lock_ttl)
+        except Exception as e:
+            self._redis_error('lock', key, e)
+            return token
+        return token if acquired else None
+
+    async def _aunlock(self, key: str, token: str):
+        if self.get_async_client is None:
+            return await asyncio.to_thread(self._unlock, key, token)
+        try:
+            await self.get_async_client().eval(_UNLOCK_SCRIPT, 1, f"web_cache_lock:{key}", token)
+        except Exception as e:
+            self._redis_error('unlock', key, e)
+
+    def get_stats(self):
+        with self._lock:
+            return {'inflight': len(self._inflight), **self.stats}
@@ -1,9 +1,74 @@
+import asyncio
+import codecs
 import os
+import re
+import threading
+import weakref
 
+import charset_normalizer
+import httpx
 import requests
-from bs4 import BeautifulSoup
+from flask import current_app, has_app_context
 from langchain_core.tools import tool
-from tavily import TavilyClient
+from lxml import etree
+from tavily import TavilyClient, AsyncTavilyClient
+
+from utils.http_fetch import PageFetcher
+from utils.web_cache import WebResultCache, web_cache_key
+
+# 默认请求头，模拟浏览器
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8, application/json',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'DNT': '1',  # 表示不跟踪
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+# Tavily 搜索和网页爬取的参数
+SEARCH_PARAMS = {'search_depth': "basic", 'include_answer': True}
+CRAWL_PARAMS = {
+    'instructions': "Find all pages on agents",
+    'max_depth': 4,
+    'max_breadth': 20,
+    'extract_depth': "advanced",
+}
+
+# 默认尝试查找常见的内容容器
+CONTENT_SELECTORS = ['.main-content', 'article', '.post-body', 'p']
+
+# 默认过滤掉常见的无关元素
+UNWANTED_SELECTORS = ['nav', '.advertisement', '.sidebar', '#footer', 'script', 'style']
+
+_META_CHARSET = re.compile(rb'<meta[^>]+charset', re.I)
+
+
+def _selector_matcher(selector: str):
+    """把简单的 CSS 选择器（标签名、.class、#id）转换为 (标签名, 属性) -> bool 的判断函数"""
+    if selector.startswith('.'):
+        return lambda tag, attrib: selector[1:] in attrib.get('class', '').split()
+    if selector.startswith('#'):
+        return lambda tag, attrib: attrib.get('id') == selector[1:]
+    return lambda tag, attrib: tag == selector
+
+
+_CONTENT_MATCHERS = [_selector_matcher(selector) for selector in CONTENT_SELECTORS]
+_UNWANTED_MATCHERS = [_selector_matcher(selector) for selector in UNWANTED_SELECTORS]
+
+
+def _tavily_client_kwargs():
+    kwargs = {'api_key': os.environ.get("TAVILY_API_KEY")}
+    # 可指向自建代理或本地压测用的桩服务
+    if os.environ.get("TAVILY_BASE_URL"):
+        kwargs['api_base_url'] = os.environ["TAVILY_BASE_URL"]
+    return kwargs
+
+
+# 同步 Tavily 客户端（内部的 requests.Session 保持连接），配置不变时复用
+_tavily_client = None
+_tavily_client_lock = threading.Lock()
 
 
 def get_tavily_client():
@@ -12,10 +77,82 @@ def get_tavily_client():
     if not api_key:
         return None
 
-    # 2. 初始化Tavily客户端
-    tavily = TavilyClient(api_key=api_key)
+    # 2. 初始化Tavily客户端，密钥或地址变化时重新创建
+    global _tavily_client
+    kwargs = _tavily_client_kwargs()
+    with _tavily_client_lock:
+        if _tavily_client is None or _tavily_client[0] != kwargs:
+            _tavily_client = (kwargs, TavilyClient(**kwargs))
+        return _tavily_client[1]
+
+
+# 联网搜索和网页爬取结果的共享缓存，由服务容器按配置设置，未设置时不缓存
+_web_cache = None
+
+
+def set_web_cache(cache: WebResultCache):
+    global _web_cache
+    _web_cache = cache
+
+
+def get_web_cache_stats():
+    return _web_cache.get_stats() if _web_cache is not None else None
+
+
+def _cached(kind: str, target: str, params: dict, fetch):
+    if _web_cache is None:
+        return fetch()
+    return _web_cache.get_or_fetch(web_cache_key(kind, target, params), fetch)
+
+
+async def _acached(kind: str, target: str, params: dict, fetch):
+    if _web_cache is None:
+        return await fetch()
+    return await _web_cache.aget_or_fetch(web_cache_key(kind, target, params), fetch)
+
+
+# 异步客户端内部的连接池绑定在事件循环上，按事件循环复用，避免每次调用都重新创建连接池和 SSL 上下文
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _get_loop_client(name: str, factory):
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if name not in clients:
+        clients[name] = factory()
+    return clients[name]
+
+
+def get_async_tavily_client():
+    """异步版本的 Tavily 客户端，供 agent.ainvoke 调用工具时使用（需在事件循环中调用）"""
+    if not os.environ.get("TAVILY_API_KEY"):
+        return None
+    return _get_loop_client('tavily', lambda: AsyncTavilyClient(**_tavily_client_kwargs()))
+
+
+def _format_search_response(query: str, response: dict) -> str:
+    if response.get("answer"):
+        return response["answer"]
+
+    # 如果没有综合性回答，则格式化原始结果
+    formatted_results = []
+    for result in response.get("results", []):
+        formatted_results.append(f"- {result['title']}: {result['content']}")
+
+    if not formatted_results:
+        return f"抱歉，没有找到与{query}相关的内容。"
+
+    return "根据搜索，为您找到以下信息：\n" + "\n".join(formatted_results)
 
-    return tavily
+
+def _format_crawl_response(url: str, response: dict) -> str:
+    formatted_results = []
+    for result in response.get("results", []):
+        formatted_results.append(f"- {result.get('title', 'None')}: {result.get('content', 'None')}")
+
+    if not formatted_results:
+        return f"抱歉，无法获取指定网页 {url} 上的内容。"
+
+    return "根据访问，为您找到以下信息：\n" + "\n".join(formatted_results)
 
 
 @tool
@@ -32,28 +169,31 @@ def web_search(query: str) -> str:
         return "错误：配置 tavily client 失败"
 
     try:
-        response = tavily.search(
-            query=query,
-            search_depth="basic",
-            include_answer=True
-        )
-        if response.get("answer"):
-            return response["answer"]
+        response = _cached('search', query, SEARCH_PARAMS, lambda: tavily.search(query=query, **SEARCH_PARAMS))
+        return _format_search_response(query, response)
+
+    except Exception as e:
+        return f"错误：执行Tavily搜索时出现问题 - {e}"
 
-        # 如果没有综合性回答，则格式化原始结果
-        formatted_results = []
-        for result in response.get("results", []):
-            formatted_results.append(f"- {result['title']}: {result['content']}")
 
-        if not formatted_results:
-            return f"抱歉，没有找到与{query}相关的内容。"
+async def _web_search_async(query: str) -> str:
+    tavily = get_async_tavily_client()
 
-        return "根据搜索，为您找到以下信息：\n" + "\n".join(formatted_results)
+    if not tavily:
+        return "错误：配置 tavily client 失败"
+
+    try:
+        response = await _acached('search', query, SEARCH_PARAMS, lambda: tavily.search(query=query, **SEARCH_PARAMS))
+        return _format_search_response(query, response)
 
     except Exception as e:
         return f"错误：执行Tavily搜索时出现问题 - {e}"
 
 
+# 异步服务模式下 agent.ainvoke 会调用 coroutine，不再占用线程等待网络
+web_search.coroutine = _web_search_async
+
+
 @tool
 def crawl_url_content(url: str) -> str:
     """
@@ -68,27 +208,158 @@ def crawl_url_content(url: str) -> str:
         return "错误：配置 tavily client 失败"
 
     try:
-        response = tavily.crawl(
-            url=url,
-            instructions="Find all pages on agents",
-            max_depth=4,
-            max_breadth=20,
-            extract_depth="advanced"
-        )
+        response = _cached('crawl', url, CRAWL_PARAMS, lambda: tavily.crawl(url=url, **CRAWL_PARAMS))
+        return _format_crawl_response(url, response)
+
+    except Exception as e:
+        return f"错误：执行Tavily网页爬取时出现问题 - {e}"
 
-        formatted_results = []
-        for result in response.get("results", []):
-            formatted_results.append(f"- {result.get('title', 'None')}: {result.get('content', 'None')}")
 
-        if not formatted_results:
-            return f"抱歉，无法获取指定网页 {url} 上的内容。"
+async def _crawl_url_content_async(url: str) -> str:
+    tavily = get_async_tavily_client()
+
+    if not tavily:
+        return "错误：配置 tavily client 失败"
 
-        return "根据访问，为您找到以下信息：\n" + "\n".join(formatted_results)
+    try:
+        response = await _acached('crawl', url, CRAWL_PARAMS, lambda: tavily.crawl(url=url, **CRAWL_PARAMS))
+        return _format_crawl_response(url, response)
 
     except Exception as e:
         return f"错误：执行Tavily网页爬取时出现问题 - {e}"
 
 
+crawl_url_content.coroutine = _crawl_url_content_async
+
+
+def _detect_charset(body: bytes, charset: str = None):
+    """
+    网页的字符集：优先使用响应头中声明的字符集；网页中有 <meta charset> 声明时交给 lxml 识别；
+    否则能按 UTF-8 解码就用 UTF-8（末尾被截断的半个字符不影响判断），再不行按内容推测。
+    """
+    if charset:
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            pass
+    if _META_CHARSET.search(body[:4096]):
+        return None
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(body, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        best = charset_normalizer.from_bytes(body[:64 * 1024]).best()
+        return best.encoding if best else None
+
+
+class _ContentTarget:
+    """
+    lxml 解析器的 target：随解析事件提取文本，不构建文档树。
+    无关元素（UNWANTED_SELECTORS）内的内容整体跳过，其后的文本与前面的文本连在一起，与从树中移除该元素的效果相同；
+    每个匹配 CONTENT_SELECTORS 的元素单独收集文本，解析结束时按选择器顺序取第一个有匹配元素的选择器。
+    文本按节点 strip 后拼接，与 BeautifulSoup 的 get_text(strip=True) 一致。
+    """
+
+    def __init__(self):
+        # 每个选择器匹配到的元素，每个元素为文本片段列表
+        self.matches = [[] for _ in CONTENT_SELECTORS]
+        # 当前所在的匹配元素（文本同时属于所有外层匹配元素）
+        self.active = []
+        # 每个打开的元素新增了几个匹配元素，位于无关元素内时为 None
+        self.stack = []
+        self.skipping = 0
+        self.buffer = []
+
+    def _flush(self):
+        if self.buffer:
+            text = ''.join(self.buffer).strip()
+            self.buffer.clear()
+            if text:
+                for chunks in self.active:
+                    chunks.append(text)
+
+    def start(self, tag, attrib):
+        if self.skipping or any(match(tag, attrib) for match in _UNWANTED_MATCHERS):
+            self.skipping += 1
+            self.stack.append(None)
+            return
+        self._flush()
+        opened = 0
+        for index, match in enumerate(_CONTENT_MATCHERS):
+            if match(tag, attrib):
+                chunks = []
+                self.matches[index].append(chunks)
+                self.active.append(chunks)
+                opened += 1
+        self.stack.append(opened)
+
+    def end(self, tag):
+        opened = self.stack.pop() if self.stack else 0
+        if opened is None:
+            self.skipping -= 1
+            return
+        self._flush()
+        if opened:
+            del self.active[-opened:]
+
+    def data(self, text):
+        if not self.skipping:
+            self.buffer.append(text)
+
+    def comment(self, text):
+        # 注释本身不计入文本，但会分隔前后的文本节点
+        if not self.skipping:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        for elements in self.matches:
+            if elements:
+                return [text for text in (''.join(chunks) for chunks in elements) if text]
+        return None
+
+
+def _extract_content(html: bytes, url: str, charset: str = None):
+    """
+    从网页 HTML 中跳过无关元素，并按选择器提取文本内容。
+    lxml 解析器直接把解析事件交给 _ContentTarget，不构建文档树，内存和耗时只与（已截断的）响应体大小成正比。
+    """
+    extracted_texts = None
+    if html:
+        parser = etree.HTMLParser(target=_ContentTarget(), encoding=_detect_charset(html, charset))
+        parser.feed(html)
+        extracted_texts = parser.close()
+
+    if extracted_texts is None:
+        print(f"警告: 在 {url} 中未找到匹配选择器 '{CONTENT_SELECTORS}' 的内容。")
+        return []
+
+    print("内容提取完成。")
+    return extracted_texts
+
+
+# 抓取网页的共享 HTTP 客户端（连接池、条件请求缓存），首次使用时按配置创建
+_page_fetcher = None
+_page_fetcher_lock = threading.Lock()
+
+
+def get_page_fetcher() -> PageFetcher:
+    global _page_fetcher
+    if _page_fetcher is None:
+        with _page_fetcher_lock:
+            if _page_fetcher is None:
+                config = current_app.config if has_app_context() else {}
+                _page_fetcher = PageFetcher(
+                    max_bytes=int(config.get('WEB_FETCH_MAX_BYTES', 2 * 1024 * 1024)),
+                    timeout=config.get('WEB_FETCH_TIMEOUT', 10),
+                    pool_hosts=config.get('HTTP_POOL_HOSTS', 32),
+                    pool_per_host=config.get('HTTP_POOL_PER_HOST', 4),
+                    cache_size=config.get('WEB_PAGE_CACHE_SIZE', 256),
+                    headers=DEFAULT_HEADERS,
+                )
+    return _page_fetcher
+
+
 @tool
 def fetch_url_content(url: str):
     """
@@ -96,62 +367,26 @@ def fetch_url_content(url: str):
     :param url: 目标网站的URL
     :return: 过滤后的文本内容列表
     """
-    # --- 默认配置 ---
-    # 默认尝试查找常见的内容容器
-    content_selectors = ['.main-content', 'article', '.post-body', 'p']
-
-    # 默认过滤掉常见的无关元素
-    unwanted_selectors = ['nav', '.advertisement', '.sidebar', '#footer', 'script', 'style']
-
-    # 默认请求头，模拟浏览器
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8, application/json',
-        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'DNT': '1',  # 表示不跟踪
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-    }
-    # --- 配置结束 ---
-
     try:
         print(f"正在请求网页: {url}")
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        response.encoding = response.apparent_encoding
-
-        print("网页请求成功，正在解析内容...")
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # 移除不需要的元素
-        for selector in unwanted_selectors:
-            for tag in soup.select(selector):
-                tag.decompose()
-
-        # 查找并提取所需内容
-        content_elements = []
-        for selector in content_selectors:
-            elements = soup.select(selector)
-            if elements:
-                content_elements.extend(elements)
-                break  # 找到匹配的就跳出，避免重复添加
+        return get_page_fetcher().fetch(url, lambda body, charset: _extract_content(body, url, charset))
 
-        if not content_elements:
-            print(f"警告: 在 {url} 中未找到匹配选择器 '{content_selectors}' 的内容。")
-            return []
+    except requests.exceptions.RequestException as e:
+        print(f"请求错误: {e}")
+        return []
+    except Exception as e:
+        print(f"解析错误或其它错误: {e}")
+        return []
 
-        # 提取文本内容
-        extracted_texts = []
-        for element in content_elements:
-            text = element.get_text(strip=True)
-            if text:
-                extracted_texts.append(text)
 
-        print("内容提取完成。")
-        return extracted_texts
+async def _fetch_url_content_async(url: str):
+    try:
+        print(f"正在请求网页: {url}")
+        client = _get_loop_client('http', lambda: httpx.AsyncClient(headers=DEFAULT_HEADERS, follow_redirects=True))
+        return await get_page_fetcher().afetch(client, url,
+                                               lambda body, charset: _extract_content(body, url, charset))
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"请求错误: {e}")
         return []
     except Exception as e:
@@ -159,6 +394,9 @@ def fetch_url_content(url: str):
         return []
 
 
+fetch_url_content.coroutine = _fetch_url_content_async
+
+
 if __name__ == "__main__":
     res = fetch_url_content('https://baike.baidu.com/item/JaVa/85979')
     print(res)